@@ -0,0 +1,70 @@
+"""
+benchmarks
+
+Standalone performance checks, run from the project directory:
+    python -m benchmarks.<module>
+
+Benchmarks never touch db.sqlite3, the on-disk caches or var/: they run
+against a throwaway test database with the page cache disabled, and keep
+sessions, request metrics and profiles in a temporary directory.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def setup_django():
+    # Benchmarks run outside manage.py, so configure Django here
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
+    import django
+    django.setup()
+
+
+def setup_environment():
+    """Configure Django for serving benchmark requests and create an empty test database."""
+    setup_django()
+    from django.conf import settings
+    from django.db import connection, connections
+
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['testserver', 'localhost', '127.0.0.1']
+    # A file, not SQLite's shared-cache memory database, whose table locks
+    # fail concurrent requests
+    directory = tempfile.mkdtemp(prefix='blog-benchmark-')
+    atexit.register(shutil.rmtree, directory, True)
+    settings.CACHES = {
+        **settings.CACHES,
+        'pages': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        'sessions': {**settings.CACHES['sessions'], 'LOCATION': os.path.join(directory, 'sessions')},
+    }
+    settings.BLOG_METRICS_DIR = os.path.join(directory, 'metrics')
+    settings.BLOG_PROFILING_DIR = os.path.join(directory, 'profiles')
+    connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'db.sqlite3')
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    # Test mirrors (the read-only replica) open the same file, read-only
+    for alias in connections:
+        if connections[alias].settings_dict['TEST'].get('MIRROR') == connection.alias:
+            connections[alias].settings_dict['NAME'] = f"file:{connection.settings_dict['NAME']}?mode=ro"
+
+
+def seed_posts(count, user=None, categories=5):
+    # Published posts spread over a few categories; returns their slugs
+    from blog.models import Category, Post
+
+    groups = [Category.objects.create(name=f'Category {i}') for i in range(categories)]
+    posts = [
+        Post.objects.create(
+            title=f'Benchmark post {i}', content=f'Benchmark body {i}. ' * 60,
+            category=groups[i % categories], user=user, is_published=True,
+            img_url='https://example.com/p.jpg',
+        )
+        for i in range(count)
+    ]
+    return [post.slug for post in posts]
@@ -0,0 +1,132 @@
+"""
+asgi_vs_wsgi.py
+
+Throughput of the read-heavy pages (index, details, about) under WSGI and ASGI:
+- WSGI sync: myproject.wsgi's handler, serving the views' sync twins, called
+  from a pool of threads like a threaded server
+- WSGI async: Django's own WSGI handler, running the async views through
+  async_to_sync, as the WSGI entry point did before the sync twins
+- ASGI: the ASGI handler driven by concurrent tasks on one event loop
+- Both run in-process against a test database, so the numbers compare the two
+  handler stacks without any network or server overhead
+
+Usage: python -m benchmarks.asgi_vs_wsgi [--requests N] [--concurrency C] [--anonymous]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import percentile, seed_posts, setup_environment
+
+
+def report(label, started, latencies, statuses):
+    elapsed = time.perf_counter() - started
+    failures = sum(1 for status in statuses if status >= 400)
+    print(f"{label:<12}{len(latencies) / elapsed:>10.0f}{statistics.median(latencies) * 1000:>10.1f}"
+          f"{percentile(latencies, 0.99) * 1000:>10.1f}{failures:>10}")
+
+
+def run_wsgi(label, application, paths, cookie, concurrency):
+    from django.test.client import FakePayload
+
+
+    def request(path):
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_HOST': 'testserver', 'HTTP_COOKIE': cookie,
+            'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': FakePayload(b''),
+            'wsgi.errors': None, 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+        }
+        status = []
+        started = time.perf_counter()
+        body = application(environ, lambda line, headers, exc_info=None: status.append(int(line[:3])))
+        b''.join(body)
+        body.close()
+        return time.perf_counter() - started, status[0]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(request, paths))
+    report(label, started, [latency for latency, _ in results], [status for _, status in results])
+
+
+def run_asgi(paths, cookie, concurrency):
+    from django.core.asgi import get_asgi_application
+
+    application = get_asgi_application()
+    headers = [(b'host', b'testserver'), (b'cookie', cookie.encode())]
+
+    async def request(path, slots):
+        async with slots:
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+                'root_path': '', 'headers': headers, 'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+            }
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+            status = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                # Stays connected until the handler stops listening
+                await asyncio.Future()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            started = time.perf_counter()
+            await application(scope, receive, send)
+            return time.perf_counter() - started, status[0]
+
+    async def main():
+        slots = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(request(path, slots) for path in paths))
+
+    started = time.perf_counter()
+    results = asyncio.run(main())
+    report('ASGI', started, [latency for latency, _ in results], [status for _, status in results])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--requests', type=int, default=2000, help="Requests per handler.")
+    parser.add_argument('--concurrency', type=int, default=64, help="Requests in flight at once.")
+    parser.add_argument('--posts', type=int, default=200, help="Published posts to seed.")
+    parser.add_argument('--anonymous', action='store_true',
+                        help="Send anonymous requests (details then redirects to login).")
+    options = parser.parse_args()
+
+    setup_environment()
+    from django.conf import settings
+    from django.contrib.auth.models import Group, User
+    from django.test import Client
+
+    reader = User.objects.create_user('bench-reader', password='password123')
+    reader.groups.add(Group.objects.get(name='Readers'))
+    slugs = seed_posts(options.posts, user=reader)
+    cookie = ''
+    if not options.anonymous:
+        client = Client()
+        client.force_login(reader)
+        cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+    pages = ['/', '/about'] + [f'/details/{slug}' for slug in slugs[:20]]
+    paths = [pages[i % len(pages)] for i in range(options.requests)]
+    print(f"{options.requests} requests, concurrency {options.concurrency}, "
+          f"{'anonymous' if options.anonymous else 'signed in'}")
+    print(f"{'':<12}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>10}")
+    from django.core.handlers.wsgi import WSGIHandler
+    from myproject.wsgi import SyncViewsWSGIHandler
+
+    run_wsgi('WSGI sync', SyncViewsWSGIHandler(), paths, cookie, options.concurrency)
+    run_wsgi('WSGI async', WSGIHandler(), paths, cookie, options.concurrency)
+    run_asgi(paths, cookie, options.concurrency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+"""
+latency.py
+
+Latency, queries and memory of every blog route, compared against a baseline:
+- Seeds a throwaway database at --scale (see seed.py), then requests each
+  route in blog/urls.py through the test client and through a local
+  threaded WSGI server, one request at a time
+- Reports p50/p95/p99 latency per transport, the most queries a request ran
+  (with the view's budget) and the peak Python memory of a request
+- --output saves the results as JSON; --baseline compares against an earlier
+  file and exits with status 1 when a route got slower, ran more queries or
+  used more memory beyond the thresholds
+
+Usage: python -m benchmarks.latency [--scale small|medium|large] [--requests N]
+       [--output FILE] [--baseline FILE]
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import platform
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+from . import percentile, setup_environment
+from .seed import SCALES, WORDS, seed
+
+# Requests per route and transport that are not timed
+WARMUP = 3
+
+# URL arguments per route, from a published post of the sample and a pool
+# of drafts for the routes that use up their post
+ROUTE_KWARGS = {
+    'details': lambda post, drafts: {'slug': post['slug']},
+    'category': lambda post, drafts: {'category_id': post['category_id']},
+    'edit_post': lambda post, drafts: {'post_id': post['pk']},
+    'delete_post': lambda post, drafts: {'post_id': drafts.pop()},
+    'publish_post': lambda post, drafts: {'post_id': drafts.pop()},
+    'reset_password': lambda post, drafts: {'uidb64': 'MQ', 'token': 'invalid-token'},
+    'feed': lambda post, drafts: {'kind': 'rss'},
+    'category_feed': lambda post, drafts: {'category_id': post['category_id'], 'kind': 'atom'},
+    'sitemap_page': lambda post, drafts: {'page': 1},
+}
+# Routes that end the session they are requested with
+FRESH_SESSION_ROUTES = {'logout'}
+
+
+def route_paths(patterns, count, sample, drafts):
+    # {route name: [path, ...]} with `count` paths per route
+    from django.urls import reverse
+
+    paths = {}
+    for pattern in patterns:
+        kwargs = ROUTE_KWARGS.get(pattern.name, lambda post, drafts: {})
+        paths[pattern.name] = [
+            reverse(f'blog:{pattern.name}', kwargs=kwargs(sample[i % len(sample)], drafts))
+            + (f'?q={WORDS[i % len(WORDS)]}' if pattern.name == 'search' else '')
+            for i in range(count)
+        ]
+    return paths
+
+
+class Sessions:
+    """Session cookies of the benchmark user (or none, when anonymous)."""
+
+    def __init__(self, user):
+        self.user = user
+        self.shared = self.new() if user else ''
+
+    def new(self):
+        from django.conf import settings
+        from django.test import Client
+
+        client = Client()
+        client.force_login(self.user)
+        return f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+    def cookie(self, route):
+        return self.new() if self.user and route in FRESH_SESSION_ROUTES else self.shared
+
+
+def run_client(paths, sessions):
+    """{route: [(seconds, status, queries), ...]} through the test client."""
+    from django.test import Client
+
+    client = Client(raise_request_exception=False)
+    results = {}
+    for route, route_paths in paths.items():
+        timings = []
+        for path in route_paths:
+            cookie = sessions.cookie(route)
+            started = time.perf_counter()
+            response = client.get(path, HTTP_COOKIE=cookie)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+            recorder = getattr(response.wsgi_request, 'query_recorder', None)
+            timings.append((elapsed, response.status_code, recorder.count if recorder else 0))
+        results[route] = timings[WARMUP:]
+    return results
+
+
+def start_server():
+    # Django's threaded development server on a free port, without request logging
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=False)
+    server.set_app(get_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_server(paths, sessions):
+    """{route: [(seconds, status), ...]} over HTTP, a new connection per request."""
+    server = start_server()
+    port = server.server_address[1]
+    results = {}
+    try:
+        for route, route_paths in paths.items():
+            timings = []
+            for path in route_paths:
+                cookie = sessions.cookie(route)
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+                started = time.perf_counter()
+                connection.request('GET', path, headers={'Cookie': cookie} if cookie else {})
+                response = connection.getresponse()
+                response.read()
+                elapsed = time.perf_counter() - started
+                connection.close()
+                timings.append((elapsed, response.status))
+            results[route] = timings[WARMUP:]
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def measure_memory(paths, sessions):
+    # Peak Python allocations (KiB) while handling one request per route
+    from django.test import Client
+
+    client = Client(raise_request_exception=False)
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for route, route_paths in paths.items():
+            cookie = sessions.cookie(route)
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            response = client.get(route_paths[0], HTTP_COOKIE=cookie)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            peaks[route] = (tracemalloc.get_traced_memory()[1] - current) / 1024
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def latency_summary(timings):
+    latencies = [timing[0] * 1000 for timing in timings]
+    return {
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'errors': sum(1 for timing in timings if timing[1] >= 400),
+    }
+
+
+def summarize(patterns, client, server, peaks):
+    return {
+        pattern.name: {
+            'client': latency_summary(client[pattern.name]),
+            'server': latency_summary(server[pattern.name]),
+            'queries': max(timing[2] for timing in client[pattern.name]),
+            'budget': getattr(pattern.callback, 'query_budget', None),
+            'peak_kib': round(peaks[pattern.name], 1),
+        }
+        for pattern in patterns
+    }
+
+
+def print_results(routes):
+    print(f"{'route':<16}{'client p50':>11}{'p95':>8}{'p99':>8}{'server p50':>12}{'p95':>8}{'p99':>8}"
+          f"{'queries':>9}{'peak KiB':>10}{'errors':>8}")
+    for name, route in routes.items():
+        client, server = route['client'], route['server']
+        queries = f"{route['queries']}/{route['budget'] if route['budget'] is not None else '-'}"
+        print(f"{name:<16}{client['p50']:>11.1f}{client['p95']:>8.1f}{client['p99']:>8.1f}"
+              f"{server['p50']:>12.1f}{server['p95']:>8.1f}{server['p99']:>8.1f}"
+              f"{queries:>9}{route['peak_kib']:>10.0f}{client['errors'] + server['errors']:>8}")
+    print("(latencies in ms; queries as most seen / budget)")
+
+
+def compare(results, baseline, latency_threshold, memory_threshold, noise_ms=1.0):
+    """Regressions of `results` against `baseline`, as readable lines."""
+    regressions = []
+    for name, route in results['routes'].items():
+        old = baseline['routes'].get(name)
+        if old is None:
+            continue
+        for transport in ('client', 'server'):
+            new_p95, old_p95 = route[transport]['p95'], old[transport]['p95']
+            # Sub-millisecond differences are noise, whatever the ratio
+            if new_p95 > old_p95 * (1 + latency_threshold) and new_p95 - old_p95 > noise_ms:
+                regressions.append(f"{name}: {transport} p95 {old_p95:.1f} -> {new_p95:.1f} ms")
+        if route['queries'] > old['queries']:
+            regressions.append(f"{name}: {old['queries']} -> {route['queries']} queries")
+        if route['peak_kib'] > old['peak_kib'] * (1 + memory_threshold) and route['peak_kib'] - old['peak_kib'] > 64:
+            regressions.append(f"{name}: peak memory {old['peak_kib']:.0f} -> {route['peak_kib']:.0f} KiB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--scale', choices=SCALES, default='small', help="Named post volume to seed.")
+    parser.add_argument('--posts', type=int, help="Posts to seed, overriding --scale.")
+    parser.add_argument('--requests', type=int, default=30, help="Timed requests per route and transport.")
+    parser.add_argument('--anonymous', action='store_true', help="Send anonymous requests.")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    parser.add_argument('--baseline', help="Compare against the results in this JSON file.")
+    parser.add_argument('--latency-threshold', type=float, default=0.20,
+                        help="Allowed p95 slowdown as a fraction (default 0.20).")
+    parser.add_argument('--memory-threshold', type=float, default=0.50,
+                        help="Allowed peak memory growth as a fraction (default 0.50).")
+    options = parser.parse_args()
+
+    setup_environment()
+    from django.conf import settings
+    from django.contrib.auth.models import Group, User
+
+    from blog import urls
+    from blog.models import DEFAULT_IMAGE_URL, Post
+
+    # Measure production behaviour: budgets are logged, not raised, and the
+    # warnings would drown the report
+    settings.BLOG_QUERY_BUDGET_STRICT = False
+    logging.getLogger('blog.queries').setLevel(logging.ERROR)
+
+    posts = options.posts or SCALES[options.scale]
+    started = time.perf_counter()
+    seed(posts)
+    print(f"Seeded {posts} posts in {time.perf_counter() - started:.0f}s")
+
+    user = None
+    if not options.anonymous:
+        user = User.objects.create_user('bench-editor', password='password123')
+        user.groups.add(Group.objects.get(name='Editors'))
+    sessions = Sessions(user)
+
+    sample = list(Post.objects.filter(is_published=True).order_by('?').values('pk', 'slug', 'category_id')[:50])
+    count = options.requests + WARMUP
+    # Deleted and published drafts: one per request of each transport, plus the memory pass
+    drafts = [
+        post.pk for post in Post.objects.bulk_create(
+            Post(title=f'Benchmark draft {i}', slug=f'benchmark-draft-{i}', content='Draft.',
+                 img_url=DEFAULT_IMAGE_URL)
+            for i in range(4 * count + 2)
+        )
+    ]
+    patterns = urls.urlpatterns
+
+    client = run_client(route_paths(patterns, count, sample, drafts), sessions)
+    server = run_server(route_paths(patterns, count, sample, drafts), sessions)
+    peaks = measure_memory(route_paths(patterns, 1, sample, drafts), sessions)
+    results = {
+        'meta': {
+            'posts': posts,
+            'requests': options.requests,
+            'anonymous': options.anonymous,
+            'python': platform.python_version(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        'routes': summarize(patterns, client, server, peaks),
+    }
+    print(f"{posts} posts, {options.requests} requests per route, "
+          f"{'anonymous' if options.anonymous else 'signed in as an editor'}")
+    print_results(results['routes'])
+    print(f"Peak RSS {results['meta']['max_rss_kib'] / 1024:.0f} MiB")
+
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if options.baseline:
+        with open(options.baseline) as file:
+            baseline = json.load(file)
+        for key in ('posts', 'anonymous'):
+            if baseline['meta'].get(key) != results['meta'][key]:
+                print(f"Warning: baseline was run with {key}={baseline['meta'].get(key)}")
+        regressions = compare(results, baseline, options.latency_threshold, options.memory_threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == '__main__':
+    main()
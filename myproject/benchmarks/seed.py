@@ -0,0 +1,95 @@
+"""
+seed.py
+
+Synthetic data for benchmarks, at realistic volumes:
+- Users (Authors) who own the posts, categories, and posts with varied
+  titles, body lengths, publish state and dates spread over three years
+- Posts go through transfer.PostImporter, so they are written in batched
+  transactions with unique slugs and search entries, like a real import
+- Generation is seeded, so two runs at the same scale hold the same data
+
+Usage: python -m benchmarks.seed [--scale small|medium|large] [--posts N]
+(seeds a throwaway database and reports how long it took)
+"""
+
+import argparse
+import random
+import time
+from datetime import timedelta
+
+from . import setup_environment
+
+# Posts per named scale
+SCALES = {'small': 10_000, 'medium': 100_000, 'large': 1_000_000}
+
+WORDS = (
+    'alps archive autumn bakery bicycle bridge cafe canyon castle city coast coffee '
+    'desert diary django festival forest garden glacier guide harbour hiking island '
+    'journey kitchen lake library market morning mountain museum night noodles ocean '
+    'painting park python recipe river road sunset street summer temple train travel '
+    'valley village weekend winter'
+).split()
+
+
+def post_rows(count, usernames, categories, published=0.9, seed=0):
+    # Import rows (see transfer.FIELDS), generated lazily
+    from django.utils import timezone
+
+    rng = random.Random(seed)
+    now = timezone.now()
+    for _ in range(count):
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 7))).capitalize()
+        yield {
+            'title': title,
+            'content': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(40, 400))),
+            'category': rng.choice(categories),
+            'author': rng.choice(usernames),
+            'is_published': rng.random() < published,
+            'create_at': (now - timedelta(seconds=rng.randint(0, 3 * 365 * 86400))).isoformat(),
+        }
+
+
+def seed(posts, users=None, categories=20, published=0.9, batch_size=1000, on_batch=None):
+    """Create `posts` posts (and their authors and categories); returns the authors' usernames."""
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import Group, User
+
+    from blog.transfer import PostImporter
+
+    users = users or max(1, posts // 100)
+    # Hashing is deliberately slow; every author shares one password
+    password = make_password('password123')
+    usernames = [f'author{i}' for i in range(users)]
+    created = User.objects.bulk_create(
+        [User(username=name, password=password) for name in usernames], batch_size=batch_size,
+    )
+    authors = Group.objects.get(name='Authors')
+    User.groups.through.objects.bulk_create(
+        [User.groups.through(user_id=user.pk, group_id=authors.pk) for user in created], batch_size=batch_size,
+    )
+    names = [f'Category {i}' for i in range(categories)]
+    PostImporter(batch_size).run(
+        enumerate(post_rows(posts, usernames, names, published), 1), on_batch=on_batch,
+    )
+    return usernames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--scale', choices=SCALES, default='small', help="Named post volume.")
+    parser.add_argument('--posts', type=int, help="Posts to create, overriding --scale.")
+    parser.add_argument('--users', type=int, help="Authors to create (default: one per 100 posts).")
+    parser.add_argument('--categories', type=int, default=20)
+    options = parser.parse_args()
+
+    setup_environment()
+    posts = options.posts or SCALES[options.scale]
+    started = time.perf_counter()
+    seed(posts, options.users, options.categories,
+         on_batch=lambda created: print(f"\r{created} posts", end='', flush=True))
+    elapsed = time.perf_counter() - started
+    print(f"\r{posts} posts in {elapsed:.1f}s ({posts / elapsed:.0f} posts/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+sessions.py
+
+Database writes per page view under each session/messages configuration:
+- database: Django's defaults, database sessions and messages stored in a
+  cookie with the session as overflow
+- signed_cookies: the whole session in a signed cookie, nothing stored
+- blog: settings.py's engine (blog/sessions.py) and cookie messages
+- Every visitor browses the way a signed-in editor does: an anonymous
+  redirect, logging in, listings, posts, search, publishing and hiding a
+  post, then logging out; the write statements run (each its own
+  transaction on SQLite) are counted per page view, session writes apart,
+  as are the session reads that reached the database
+
+Usage: python -m benchmarks.sessions [--visitors N]
+"""
+
+import argparse
+import time
+
+from . import seed_posts, setup_environment
+
+CONFIGS = {
+    'database': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'MESSAGE_STORAGE': 'django.contrib.messages.storage.fallback.FallbackStorage',
+    },
+    'signed_cookies': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.signed_cookies',
+        'MESSAGE_STORAGE': 'django.contrib.messages.storage.cookie.CookieStorage',
+    },
+    'blog': {},
+}
+WRITES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class WriteCounter:
+    """Execute wrapper counting write statements, and the statements on django_session."""
+
+    def __init__(self):
+        self.writes = 0
+        self.session_writes = 0
+        self.session_reads = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        statement = sql.lstrip().upper()
+        on_sessions = 'DJANGO_SESSION' in statement
+        if statement.startswith(WRITES):
+            self.writes += 1
+            self.session_writes += on_sessions
+        else:
+            self.session_reads += on_sessions
+        return execute(sql, params, many, context)
+
+
+def visit(client, username, slugs, post_id):
+    """One visitor's pages; returns how many requests were served."""
+    from django.urls import reverse
+
+    responses = [
+        client.get(reverse('blog:dashboard'), follow=True),  # to the login page, with a message
+        client.post(reverse('blog:login'), {'username': username, 'password': 'password123'}, follow=True),
+        client.get(reverse('blog:index')),
+        *(client.get(reverse('blog:details', kwargs={'slug': slug})) for slug in slugs),
+        client.get(reverse('blog:search'), {'q': 'benchmark'}),
+        # Publish and hide, each back to the dashboard with a message
+        *(client.get(reverse('blog:publish_post', kwargs={'post_id': post_id}), follow=True) for _ in range(2)),
+        client.get(reverse('blog:logout'), follow=True),
+    ]
+    return sum(1 + len(getattr(response, 'redirect_chain', ())) for response in responses)
+
+
+def run(config, users, slugs, post_id):
+    from django.db import connection
+    from django.test import Client, override_settings
+
+    counter = WriteCounter()
+    pages = 0
+    with override_settings(**config), connection.execute_wrapper(counter):
+        started = time.perf_counter()
+        for user in users:
+            # Each visitor has a browser (and cookies) of its own
+            pages += visit(Client(), user.username, slugs, post_id)
+        elapsed = time.perf_counter() - started
+    return pages, counter, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--visitors', type=int, default=20, help="Visitors per configuration.")
+    options = parser.parse_args()
+
+    setup_environment()
+    from django.conf import settings
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import Group, User
+
+    from blog.models import Post
+    from blog.sessions import lru
+
+    settings.BLOG_QUERY_BUDGET_STRICT = False
+    slugs = seed_posts(20)[:5]
+    post_id = Post.objects.get(slug=slugs[-1]).pk
+    editors = Group.objects.get(name='Editors')
+    password = make_password('password123')
+
+    print(f"{'configuration':<16}{'pages':>7}{'writes':>8}{'session':>9}{'writes/page':>13}"
+          f"{'session reads':>15}{'ms/page':>9}")
+    for name, config in CONFIGS.items():
+        users = User.objects.bulk_create(
+            User(username=f'{name}-{i}', password=password) for i in range(options.visitors)
+        )
+        editors.user_set.add(*users)
+        lru.clear()
+        pages, counter, elapsed = run(config, users, slugs, post_id)
+        print(f"{name:<16}{pages:>7}{counter.writes:>8}{counter.session_writes:>9}"
+              f"{counter.writes / pages:>13.2f}{counter.session_reads:>15}{elapsed * 1000 / pages:>9.1f}")
+    print("(writes: INSERT/UPDATE/DELETE statements, each a transaction; session: those on django_session)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+sqlite_concurrency.py
+
+Mixed readers and writers against one SQLite file, before and after tuning:
+- baseline: rollback journal, deferred transactions and a new connection
+  per operation, as with the stock DATABASES setting
+- tuned: the PRAGMAs, IMMEDIATE transactions and persistent connections of
+  settings.DATABASES, with reads on the read-only 'replica' connection
+- Readers load a listing page worth of posts; writers edit a post inside a
+  transaction, the way edit_post does
+
+Usage: python -m benchmarks.sqlite_concurrency [--seconds S] [--readers R] [--writers W]
+"""
+
+import argparse
+import random
+import statistics
+import threading
+import time
+
+from . import percentile, seed_posts, setup_environment
+
+
+def configure(tuned, options):
+    # Settings dicts are shared by every thread's connection, so changing
+    # them affects connections opened from now on
+    from django.db import connections
+
+    for conn in connections.all(initialized_only=True):
+        conn.close()
+    settings_dict = connections['default'].settings_dict
+    if tuned:
+        settings_dict['OPTIONS'] = dict(options)
+    else:
+        settings_dict['OPTIONS'] = {'init_command': 'PRAGMA journal_mode=delete'}
+    # Switch the file's journal mode now, while no other connection is open
+    connections['default'].ensure_connection()
+    connections['default'].close()
+
+
+def run(tuned, slugs, seconds, readers, writers):
+    from django.db import connections, transaction
+    from django.db.utils import OperationalError
+
+    from blog import db
+    from blog.models import Post
+
+    results = {'read': [], 'write': [], 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def read():
+        # Runs as a read-only view would, on the replica when tuned
+        token = db.reading.set(tuned)
+        try:
+            posts = Post.objects.filter(is_published=True).select_related('category').defer('content')
+            list(posts[:5])
+            posts.count()
+        finally:
+            db.reading.reset(token)
+
+    def write():
+        with transaction.atomic():
+            post = Post.objects.get(slug=random.choice(slugs))
+            post.content = f'Edited at {time.time()}. ' * 40
+            post.save()
+
+    def worker(kind, operation):
+        latencies = []
+        errors = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                operation()
+            except OperationalError:
+                # "database is locked"
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+            if not tuned:
+                # Django reconnects on every request without CONN_MAX_AGE
+                connections.close_all()
+        connections.close_all()
+        with lock:
+            results[kind].extend(latencies)
+            results['errors'] += errors
+
+    threads = [threading.Thread(target=worker, args=('read', read)) for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=('write', write)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    label = 'tuned' if tuned else 'baseline'
+    for kind in ('read', 'write'):
+        latencies = results[kind] or [0]
+        print(f"{label:<10}{kind:<7}{len(results[kind]) / seconds:>10.0f}"
+              f"{statistics.median(latencies) * 1000:>10.1f}{percentile(latencies, 0.99) * 1000:>10.1f}"
+              f"{results['errors'] if kind == 'write' else '':>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--posts', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_environment()
+    from django.db import connections
+
+    options = dict(connections['default'].settings_dict['OPTIONS'])
+    slugs = seed_posts(args.posts)
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds:g}s each")
+    print(f"{'':<10}{'':<7}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>10}")
+    for tuned in (False, True):
+        configure(tuned, options)
+        run(tuned, slugs, args.seconds, args.readers, args.writers)
+
+
+if __name__ == '__main__':
+    main()
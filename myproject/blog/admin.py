@@ -1,6 +1,78 @@
+import os
+
 from django.contrib import admin
-from .models import Post,Category
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+
+from .models import Post,Category,Job,OutboxEmail,RequestProfile
+from . import outbox, profiling
 # Register your models here.
 
 admin.site.register(Post)
-admin.site.register(Category)
\ No newline at end of file
+admin.site.register(Category)
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'key', 'status', 'attempts', 'run_after', 'updated_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('key',)
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'run_after', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'to')
+    # Bodies can hold password reset links
+    exclude = ('body',)
+    actions = ['retry_messages']
+
+    @admin.action(description="Retry selected messages")
+    def retry_messages(self, request, queryset):
+        self.message_user(request, f"{outbox.retry(queryset)} message(s) queued again.")
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'path', 'status', 'duration_ms', 'query_count', 'sql_ms', 'template_ms', 'stacks')
+    list_filter = ('method', 'status', 'mode')
+    search_fields = ('path',)
+    fields = ('created_at', 'method', 'path', 'status', 'user', 'mode', 'duration_ms', 'sql_ms', 'template_ms',
+              'stacks', 'template_timings', 'query_timings')
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/stacks/', self.admin_site.admin_view(self.stacks_view), name='blog_requestprofile_stacks'),
+        ] + super().get_urls()
+
+    def stacks_view(self, request, pk):
+        # Download the folded stacks / cProfile dump for a flame graph viewer
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        if not self.has_view_permission(request, profile):
+            raise PermissionDenied
+        filename = profiling.stack_path(profile.stack_file)
+        if not os.path.exists(filename):
+            raise Http404("The stacks file is gone.")
+        return FileResponse(open(filename, 'rb'), as_attachment=True, filename=profile.stack_file)
+
+    @admin.display(description="Stacks")
+    def stacks(self, obj):
+        return format_html('<a href="{}">{}</a>', reverse('admin:blog_requestprofile_stacks', args=[obj.pk]), obj.stack_file)
+
+    @admin.display(description="Templates (ms)")
+    def template_timings(self, obj):
+        return format_html_join('', '<div>{} &nbsp; {}</div>', ((f'{ms:.1f}', name) for name, ms in obj.templates))
+
+    @admin.display(description="SQL (ms, slowest first)")
+    def query_timings(self, obj):
+        return format_html_join('', '<div><code>{}</code> &nbsp; <code>{}</code></div>', ((f'{ms:.2f}', sql) for sql, ms in obj.queries))
@@ -1,5 +1,5 @@
 from django.apps import AppConfig
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_migrate,pre_save,post_save,post_delete,m2m_changed
 
 class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -8,4 +8,61 @@ class BlogConfig(AppConfig):
     # Connect signals for creating groups and permissions after migrations
     def ready(self):
         from blog.signals import create_groups_permissions
-        post_migrate.connect(create_groups_permissions)
\ No newline at end of file
+        post_migrate.connect(create_groups_permissions)
+
+        # Keep the search index in sync with posts and their categories
+        from blog.models import Post,Category
+        from blog.signals import (update_post_search_index,remove_post_search_index,
+                                  update_category_search_index,remove_category_search_index)
+        post_save.connect(update_post_search_index, sender=Post)
+        post_delete.connect(remove_post_search_index, sender=Post)
+        post_save.connect(update_category_search_index, sender=Category)
+        post_delete.connect(remove_category_search_index, sender=Category)
+
+        # Resize uploaded images off-request
+        from blog.signals import queue_image_renditions
+        post_save.connect(queue_image_renditions, sender=Post)
+
+        # Keep the categories' published post counts, before the pages
+        # (and the category navigation) showing them are invalidated
+        from blog.signals import update_category_counts,remove_category_counts
+        post_save.connect(update_category_counts, sender=Post)
+        post_delete.connect(remove_category_counts, sender=Post)
+
+        # Invalidate cached pages showing the changed post or category
+        from blog.signals import remember_post_state,invalidate_post_pages,invalidate_category_pages
+        pre_save.connect(remember_post_state, sender=Post)
+        post_save.connect(invalidate_post_pages, sender=Post)
+        post_delete.connect(invalidate_post_pages, sender=Post)
+        post_save.connect(invalidate_category_pages, sender=Category)
+        post_delete.connect(invalidate_category_pages, sender=Category)
+
+        # Refresh precomputed related posts off-request
+        from blog.signals import queue_related_posts_refresh
+        post_save.connect(queue_related_posts_refresh, sender=Post)
+        post_delete.connect(queue_related_posts_refresh, sender=Post)
+
+        # Reload cached roles when memberships or permissions change
+        from django.contrib.auth.models import User,Group
+        from blog.signals import invalidate_member_roles,invalidate_group_roles,invalidate_user_roles
+        m2m_changed.connect(invalidate_member_roles, sender=User.groups.through)
+        m2m_changed.connect(invalidate_member_roles, sender=User.user_permissions.through)
+        m2m_changed.connect(invalidate_group_roles, sender=Group.permissions.through)
+        post_delete.connect(invalidate_group_roles, sender=Group)
+        post_save.connect(invalidate_user_roles, sender=User)
+        post_delete.connect(invalidate_user_roles, sender=User)
+
+        # Profiles' stacks files go with their records
+        from blog.models import RequestProfile
+        from blog.signals import remove_profile_stacks
+        post_delete.connect(remove_profile_stacks, sender=RequestProfile)
+
+        # Write buffered post views once responses are sent
+        from django.core.signals import request_finished
+        from blog.popularity import flush_views
+        request_finished.connect(flush_views)
+
+        # Per-request query recording for query budgets
+        from django.db.backends.signals import connection_created
+        from blog.instrumentation import install_query_recorder
+        connection_created.connect(install_query_recorder)
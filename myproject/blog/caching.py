@@ -0,0 +1,220 @@
+"""
+caching.py
+
+Whole-page cache for anonymous readers:
+- cache_anonymous_page() serves anonymous GETs of a view from the 'pages' cache
+- Views tag what a page shows (listing, post:<id>, category:<id>); an entry is
+  only served while its tag versions are current, so invalidating a post
+  just bumps a few version keys
+- Versions start with the time they were made, so they double as
+  Last-Modified dates; 'listing' is the site-wide content version
+- A short refill lock lets one request re-render a page while concurrent
+  requests get the stale copy (or wait briefly) instead of piling onto the DB
+"""
+
+import asyncio
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+
+PAGE_CACHE_ALIAS = 'pages'
+FRAGMENT_CACHE_ALIAS = 'fragments'
+KEY_PREFIX = 'blog:page:'
+TAG_PREFIX = 'blog:tag:'
+
+# How long a refill may hold the lock, and how long other requests wait for it
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2.0
+LOCK_POLL = 0.05
+
+
+def page_cache():
+    return caches[PAGE_CACHE_ALIAS]
+
+
+def page_timeout():
+    return getattr(settings, 'BLOG_PAGE_CACHE_TIMEOUT', 600)
+
+
+def fragment_cache():
+    return caches[FRAGMENT_CACHE_ALIAS]
+
+
+def fragment_timeout():
+    return getattr(settings, 'BLOG_FRAGMENT_CACHE_TIMEOUT', 3600)
+
+
+# Tags
+
+def new_version():
+    # "<hex nanoseconds>-<random>": unique, and ordered by creation time
+    return f'{time.time_ns():x}-{uuid.uuid4().hex[:8]}'
+
+
+def version_time(version):
+    # Unix time a tag version was made, or None for versions without one
+    stamp, dash, _ = str(version).partition('-')
+    try:
+        return int(stamp, 16) // 10**9 if dash else None
+    except ValueError:
+        return None
+
+
+def tag_versions(tags):
+    # Current version of each tag, creating versions for tags never seen before
+    cache = page_cache()
+    keys = {TAG_PREFIX + tag: tag for tag in tags}
+    found = cache.get_many(keys)
+    for key in keys.keys() - found.keys():
+        cache.add(key, new_version(), None)
+        found[key] = cache.get(key)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def versioned_key(prefix, tags):
+    # A cache key that changes whenever one of the tags is invalidated, by any process
+    versions = sorted(tag_versions(tags).items())
+    return prefix + hashlib.md5(repr(versions).encode(), usedforsecurity=False).hexdigest()
+
+
+def invalidate_tags(*tags):
+    # Every cached page carrying one of these tags becomes stale
+    version = new_version()
+    page_cache().set_many({TAG_PREFIX + tag: version for tag in tags}, None)
+
+
+def tag_page(request, *tags):
+    """
+    Declare what the page being rendered depends on.
+
+    Call it before querying the data the tags stand for: versions are
+    captured right away, so a change made during rendering makes the
+    stored page stale instead of being lost.
+    """
+    versions = getattr(request, '_page_cache_versions', None)
+    if versions is not None:
+        versions.update(tag_versions(tags))
+
+
+def post_tags(post_id, category_id, published):
+    # Pages showing a post: its own page, its category's related lists and,
+    # while published, the listing pages
+    tags = {f'post:{post_id}', f'category:{category_id}'}
+    if published:
+        tags.add('listing')
+    return tags
+
+
+# Page cache
+
+def _is_cacheable_request(request):
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return False
+    # Pages carrying a flash message are one-off
+    return not len(get_messages(request))
+
+
+def _is_cacheable_response(response):
+    return response.status_code == 200 and not response.streaming and not response.cookies
+
+
+def _page_key(request):
+    digest = hashlib.md5(request.get_full_path().encode(), usedforsecurity=False).hexdigest()
+    return KEY_PREFIX + digest
+
+
+def _is_fresh(versions):
+    return bool(versions) and tag_versions(versions) == versions
+
+
+def _served(response, state):
+    response['X-Page-Cache'] = state
+    return response
+
+
+def _lookup(key):
+    # (cached entry or None, whether it can be served as is)
+    entry = page_cache().get(key)
+    return entry, entry is not None and _is_fresh(entry[0])
+
+
+def _store(request, key, response):
+    if hasattr(response, 'render') and callable(response.render):
+        response.render()
+    if request._page_cache_versions and _is_cacheable_response(response):
+        page_cache().set(key, (request._page_cache_versions, response), page_timeout())
+    return _served(response, 'miss')
+
+
+def cache_anonymous_page(view_func):
+    """Serve anonymous GET requests of a tagged (sync or async) view from the page cache."""
+
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            if not _is_cacheable_request(request):
+                return await view_func(request, *args, **kwargs)
+
+            # Page cache reads are local and quick, so they run on the event loop
+            key = _page_key(request)
+            entry, fresh = _lookup(key)
+            if fresh:
+                return _served(entry[1], 'hit')
+
+            lock_key = key + ':lock'
+            if not page_cache().add(lock_key, 1, LOCK_TIMEOUT):
+                # Another request is refilling this page
+                if entry is not None:
+                    return _served(entry[1], 'stale')
+                deadline = time.monotonic() + LOCK_WAIT
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(LOCK_POLL)
+                    entry, fresh = _lookup(key)
+                    if fresh:
+                        return _served(entry[1], 'hit')
+                return _served(await view_func(request, *args, **kwargs), 'miss')
+
+            try:
+                request._page_cache_versions = {}
+                return _store(request, key, await view_func(request, *args, **kwargs))
+            finally:
+                page_cache().delete(lock_key)
+
+        return async_wrapper
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not _is_cacheable_request(request):
+            return view_func(request, *args, **kwargs)
+
+        key = _page_key(request)
+        entry, fresh = _lookup(key)
+        if fresh:
+            return _served(entry[1], 'hit')
+
+        lock_key = key + ':lock'
+        if not page_cache().add(lock_key, 1, LOCK_TIMEOUT):
+            # Another request is refilling this page
+            if entry is not None:
+                return _served(entry[1], 'stale')
+            deadline = time.monotonic() + LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(LOCK_POLL)
+                entry, fresh = _lookup(key)
+                if fresh:
+                    return _served(entry[1], 'hit')
+            return _served(view_func(request, *args, **kwargs), 'miss')
+
+        try:
+            request._page_cache_versions = {}
+            return _store(request, key, view_func(request, *args, **kwargs))
+        finally:
+            page_cache().delete(lock_key)
+
+    return wrapper
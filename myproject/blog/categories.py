@@ -0,0 +1,84 @@
+"""
+categories.py
+
+Category listings and their post counts:
+- Category.published_post_count is kept by the post signals with F()
+  updates, so concurrent saves can't lose a change; imports add each
+  batch's counts themselves
+- Bulk queryset updates skip the signals: reconcile() recomputes every
+  count from one grouped query and fixes the ones that drifted
+  (python manage.py reconcile_category_counts)
+- The category navigation is cached under the 'listing' tag version, which
+  every count change and category change invalidates (after the counts are
+  written: see apps.py)
+"""
+
+from collections import Counter
+
+from django.core.cache import cache
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .caching import invalidate_tags, versioned_key
+from .models import Category, Post
+
+NAV_KEY = 'blog:category-nav:'
+NAV_TIMEOUT = 3600
+
+
+def count_changes(previous, current):
+    """{category id: change} between two (category_id, is_published) states of a post, None when absent."""
+    changes = Counter()
+    if previous and previous['is_published'] and previous['category_id'] is not None:
+        changes[previous['category_id']] -= 1
+    if current and current['is_published'] and current['category_id'] is not None:
+        changes[current['category_id']] += 1
+    return {pk: change for pk, change in changes.items() if change}
+
+
+def adjust_counts(changes):
+    # Never below zero, even when a count had drifted. The callers
+    # invalidate 'listing' once the counts are written
+    for pk, change in changes.items():
+        Category.objects.filter(pk=pk).update(published_post_count=Greatest(F('published_post_count') + change, 0))
+
+
+def reconcile():
+    """Recompute every published_post_count; returns how many were wrong."""
+    counts = dict(
+        Post.objects.filter(is_published=True, category__isnull=False)
+        .values_list('category').annotate(total=Count('id')).order_by()
+    )
+    stale = []
+    for category in Category.objects.only('id', 'published_post_count'):
+        if category.published_post_count != counts.get(category.pk, 0):
+            category.published_post_count = counts.get(category.pk, 0)
+            stale.append(category)
+    if stale:
+        Category.objects.bulk_update(stale, ['published_post_count'], batch_size=500)
+        invalidate_tags('listing', *(f'category:{category.pk}' for category in stale))
+    return len(stale)
+
+
+def nav_categories():
+    return Category.objects.filter(published_post_count__gt=0).order_by('name').values('id', 'name', 'published_post_count')
+
+
+def category_nav():
+    """Categories with published posts, by name: [{'id', 'name', 'published_post_count'}, ...]."""
+    key = versioned_key(NAV_KEY, ['listing'])
+    nav = cache.get(key)
+    if nav is None:
+        nav = list(nav_categories())
+        cache.set(key, nav, NAV_TIMEOUT)
+    return nav
+
+
+async def acategory_nav():
+    # Same as category_nav(), through the async ORM
+    key = versioned_key(NAV_KEY, ['listing'])
+    nav = await cache.aget(key)
+    if nav is None:
+        nav = [category async for category in nav_categories()]
+        await cache.aset(key, nav, NAV_TIMEOUT)
+    return nav
@@ -0,0 +1,107 @@
+"""
+conditional.py
+
+Conditional GETs for pages, answered before the view queries or renders:
+- A page's validators come from the tag versions of what it shows (see
+  caching.py) and, for a post, its updated_at
+- The ETag also covers who is reading, as the header differs per user
+- Matching If-None-Match / If-Modified-Since requests get a 304 straight away;
+  other responses carry the validators and must be revalidated before reuse
+"""
+
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .caching import tag_versions, version_time
+from .roles import ALL_USERS_TAG, user_tag
+
+
+def tag_validators(tags, updated_at=None, reader=None):
+    """(etag, last_modified) of a document showing `tags`, as seen by `reader`."""
+    versions = tag_versions(tags)
+    state = repr((reader, sorted(versions.items())))
+    etag = quote_etag(hashlib.md5(state.encode(), usedforsecurity=False).hexdigest())
+    times = [version_time(version) for version in versions.values()]
+    if updated_at is not None:
+        times.append(int(updated_at.timestamp()))
+    # Versions written before they carried a time leave only the ETag to go by
+    last_modified = None if None in times else max(times)
+    return etag, last_modified
+
+
+def page_validators(user, tags, updated_at=None):
+    """(etag, last_modified) of a page showing `tags` to `user`."""
+    tags = list(tags)
+    if user.is_authenticated:
+        # Signed-in pages show the user's name and role-dependent links
+        tags += [ALL_USERS_TAG, user_tag(user.pk)]
+    return tag_validators(tags, updated_at, user.pk)
+
+
+def _with_validators(response, user, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Browsers may keep the page, but must check it is current first
+    patch_cache_control(response, no_cache=True, private=user.is_authenticated)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def conditional_page(page_state):
+    """
+    Answer conditional GETs of a (sync or async) view with 304 from cheap validators.
+
+    `page_state(request, *args, **kwargs)` returns (tags, updated_at) for the
+    page, or None to leave the response to the view (e.g. a 404); async
+    views may use a coroutine. Validators are taken before the view runs, so
+    a change made meanwhile only costs the client a full response next time.
+    """
+    def bypassed(request):
+        # Only plain GETs are validated; pages carrying a flash message are one-off
+        return request.method not in ('GET', 'HEAD') or len(get_messages(request))
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                if bypassed(request):
+                    return await view_func(request, *args, **kwargs)
+                user = await request.auser()
+                state = page_state(request, *args, **kwargs)
+                if iscoroutinefunction(page_state):
+                    state = await state
+                if state is None:
+                    return await view_func(request, *args, **kwargs)
+
+                etag, last_modified = page_validators(user, *state)
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = await view_func(request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                return _with_validators(response, user, etag, last_modified)
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if bypassed(request):
+                return view_func(request, *args, **kwargs)
+            state = page_state(request, *args, **kwargs)
+            if state is None:
+                return view_func(request, *args, **kwargs)
+
+            etag, last_modified = page_validators(request.user, *state)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            return _with_validators(response, request.user, etag, last_modified)
+        return wrapper
+    return decorator
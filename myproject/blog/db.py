@@ -0,0 +1,64 @@
+"""
+db.py
+
+Database routing between the primary and a read-only connection:
+- Writes, and reads outside read-only views, go to the primary ('default')
+- read_only() marks a GET-only view; its queries are routed to READ_ALIAS,
+  a read-only connection to the same SQLite file (or a real replica)
+- Without a READ_ALIAS database configured, everything stays on the primary
+"""
+
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.db import DEFAULT_DB_ALIAS, connections
+
+READ_ALIAS = 'replica'
+
+# Set while a read-only view runs; copied into the threads async views query from
+reading = ContextVar('blog_db_reading', default=False)
+
+
+def read_alias():
+    return READ_ALIAS if READ_ALIAS in connections.settings else DEFAULT_DB_ALIAS
+
+
+class ReadReplicaRouter:
+    """Send read-only views' queries to READ_ALIAS, everything else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        return read_alias() if reading.get() else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Explicit, or objects loaded from the replica would be saved back to it
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != READ_ALIAS
+
+
+def read_only(view_func):
+    """Route the ORM reads of a (sync or async) GET-only view to the read-only connection."""
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            token = reading.set(request.method in ('GET', 'HEAD'))
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                reading.reset(token)
+        return async_wrapper
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        token = reading.set(request.method in ('GET', 'HEAD'))
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            reading.reset(token)
+    return wrapper
@@ -0,0 +1,240 @@
+"""
+feeds.py
+
+RSS / Atom feeds (site-wide and per category) and an XML sitemap of published posts:
+- Documents are streamed: posts are read through a chunked iterator and
+  written out a chunk at a time, so memory doesn't grow with the post count
+- A finished document is kept in the page cache along with the tag versions
+  of what it lists ('listing', category:<id>), so publishing, unpublishing
+  or editing a listed post replaces it
+- ETag / Last-Modified come from the same versions, and matching conditional
+  GETs get a 304 without touching the database
+- The sitemap index splits posts into pages of fixed id ranges, so a page
+  keeps listing the same posts as the blog grows
+"""
+
+import hashlib
+import io
+from datetime import datetime, timezone as dt_timezone
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import F, Max
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import feedgenerator, timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.xmlutils import SimplerXMLGenerator
+from django.views.decorators.http import require_safe
+
+from .caching import page_cache, page_timeout
+from .conditional import tag_validators
+from .db import read_alias
+from .instrumentation import query_budget
+from .models import Category, Post
+
+SITE_TITLE = 'My Blog'
+CACHE_PREFIX = 'blog:feed:'
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+# Posts written out (and fetched from the database) per chunk
+CHUNK_SIZE = 100
+
+
+def feed_length():
+    return getattr(settings, 'BLOG_FEED_ITEMS', 50)
+
+
+def sitemap_page_size():
+    # Ids per sitemap page; the protocol allows up to 50,000 URLs per file
+    return getattr(settings, 'BLOG_SITEMAP_PAGE_SIZE', 5000)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+# Feeds
+
+class StreamingFeedMixin:
+    """feedgenerator feed written out one chunk of items at a time."""
+
+    closing_tags = ''
+
+    def latest_post_date(self):
+        # Items aren't kept around, so the date is passed in as `updated`
+        return self.feed['updated']
+
+    def stream(self, items):
+        # The document without items, cut where the items go
+        buffer = io.StringIO()
+        self.write(buffer, 'utf-8')
+        yield buffer.getvalue().removesuffix(self.closing_tags)
+
+        handler = SimplerXMLGenerator(buffer, 'utf-8', short_empty_elements=True)
+        for chunk in chunked(items, CHUNK_SIZE):
+            buffer.seek(0)
+            buffer.truncate()
+            self.items = []
+            for item in chunk:
+                self.add_item(**item)
+            self.write_items(handler)
+            yield buffer.getvalue()
+        self.items = []
+        yield self.closing_tags
+
+
+class RssFeed(StreamingFeedMixin, feedgenerator.Rss201rev2Feed):
+    closing_tags = '</channel></rss>'
+
+
+class AtomFeed(StreamingFeedMixin, feedgenerator.Atom1Feed):
+    closing_tags = '</feed>'
+
+
+FEED_TYPES = {'rss': RssFeed, 'atom': AtomFeed}
+
+
+def feed_items(request, posts):
+    for post in posts:
+        link = request.build_absolute_uri(post.get_absolute_url())
+        yield {
+            'title': post.title,
+            'link': link,
+            'unique_id': link,
+            'description': post.excerpt,
+            'pubdate': post.create_at,
+            'updateddate': post.updated_at,
+            'author_name': post.user.username if post.user else None,
+            'categories': [post.category.name] if post.category else (),
+        }
+
+
+# Sitemaps
+
+def sitemap_index_xml(request, pages):
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{SITEMAP_NS}">\n'
+    for chunk in chunked(pages, CHUNK_SIZE):
+        yield ''.join(
+            f"<sitemap><loc>{escape(request.build_absolute_uri(reverse('blog:sitemap_page', args=[page['page']])))}</loc>"
+            f"<lastmod>{page['lastmod'].isoformat()}</lastmod></sitemap>\n"
+            for page in chunk
+        )
+    yield '</sitemapindex>\n'
+
+
+def sitemap_xml(request, posts):
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NS}">\n'
+    for chunk in chunked(posts, CHUNK_SIZE):
+        yield ''.join(
+            f'<url><loc>{escape(request.build_absolute_uri(post.get_absolute_url()))}</loc>'
+            f'<lastmod>{post.updated_at.isoformat()}</lastmod></url>\n'
+            for post in chunk
+        )
+    yield '</urlset>\n'
+
+
+# Caching
+
+def _cache_while_streaming(chunks, key, etag):
+    # The document is stored once it has been sent in full
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    page_cache().set(key, (etag, ''.join(parts)), page_timeout())
+
+
+def cached_document(request, tags, content_type, render):
+    """
+    Serve the document listing `tags`, from the page cache while they are unchanged.
+
+    render(last_modified) looks up what it needs (raising Http404 if
+    missing) and returns an iterator of text chunks. The chunks run their
+    queries while the response streams, so they pick connections explicitly.
+    """
+    etag, last_modified = tag_validators(tags)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        key = CACHE_PREFIX + hashlib.md5(request.path.encode(), usedforsecurity=False).hexdigest()
+        entry = page_cache().get(key)
+        if entry is not None and entry[0] == etag:
+            response = HttpResponse(entry[1], content_type=content_type)
+        else:
+            chunks = render(last_modified)
+            response = StreamingHttpResponse(_cache_while_streaming(chunks, key, etag), content_type=content_type)
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'BLOG_FEED_MAX_AGE', 300))
+    return response
+
+
+# Views
+
+@query_budget(3)
+@require_safe
+def post_feed(request, kind, category_id=None):
+    # Latest published posts, site-wide or of one category
+    if kind not in FEED_TYPES:
+        raise Http404("No such feed.")
+    feed_type = FEED_TYPES[kind]
+    tags = ['listing'] if category_id is None else [f'category:{category_id}']
+
+    def render(last_modified):
+        posts = Post.objects.using(read_alias()).filter(is_published=True)
+        title = SITE_TITLE
+        if category_id is not None:
+            category = get_object_or_404(Category.objects.using(read_alias()), pk=category_id)
+            posts = posts.filter(category=category)
+            title = f'{SITE_TITLE}: {category.name}'
+        updated = datetime.fromtimestamp(last_modified, dt_timezone.utc) if last_modified else timezone.now()
+        feed = feed_type(
+            title=title, link=request.build_absolute_uri(reverse('blog:index')),
+            description=f'Latest posts from {title}', feed_url=request.build_absolute_uri(),
+            language=settings.LANGUAGE_CODE, updated=updated,
+        )
+        posts = posts.select_related('category', 'user').only(
+            'title', 'slug', 'excerpt', 'create_at', 'updated_at', 'category__name', 'user__username',
+        )[:feed_length()]
+        return feed.stream(feed_items(request, posts.iterator(chunk_size=CHUNK_SIZE)))
+
+    return cached_document(request, tags, feed_type.content_type, render)
+
+
+@query_budget(3)
+@require_safe
+def sitemap_index(request):
+    # One entry per sitemap page holding published posts, with its latest change
+    def render(last_modified):
+        size = sitemap_page_size()
+        pages = (
+            Post.objects.using(read_alias()).filter(is_published=True).order_by()
+            .values(page=(F('id') - 1) / size + 1).annotate(lastmod=Max('updated_at')).order_by('page')
+        )
+        return sitemap_index_xml(request, pages.iterator(chunk_size=CHUNK_SIZE))
+
+    return cached_document(request, ['listing'], 'application/xml', render)
+
+
+@query_budget(3)
+@require_safe
+def sitemap_page(request, page):
+    # Published posts with ids in the page's range
+    def render(last_modified):
+        size = sitemap_page_size()
+        posts = (
+            Post.objects.using(read_alias())
+            .filter(is_published=True, pk__gt=(page - 1) * size, pk__lte=page * size)
+            .order_by('pk').only('slug', 'updated_at')
+        )
+        if page < 1 or not posts.exists():
+            raise Http404("No such sitemap page.")
+        return sitemap_xml(request, posts.iterator(chunk_size=CHUNK_SIZE))
+
+    return cached_document(request, ['listing'], 'application/xml', render)
@@ -9,8 +9,9 @@ Defines all Django forms for the blog app:
 
 from django import forms
 from django.contrib.auth.models import User
-from .models import Category, Post
+from .models import Category, Post, DEFAULT_IMAGE_URL, IMAGE_PENDING
 from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
 from django.core.validators import MinLengthValidator
 
 class RegisterForm(forms.ModelForm):
@@ -117,13 +118,19 @@ class PostForm(forms.ModelForm):
         fields = ['title', 'content', 'category', 'img_url']
 
     def save(self, commit=True):
-        """Save post and set default image if not provided."""
+        """Save post, queue image renditions and set default image if not provided."""
         post = super().save(commit=False)
         cleaned_data = super().clean()
         if cleaned_data.get('img_url'):
             post.img_url = cleaned_data['img_url']
+            # Renditions of a newly uploaded image are built by the background worker
+            if isinstance(cleaned_data['img_url'], UploadedFile):
+                post.img_renditions = {}
+                post.image_status = IMAGE_PENDING
         else:
-            post.img_url = "https://upload.wikimedia.org/wikipedia/commons/thumb/a/ac/No_image_available.svg/2048px-No_image_available.svg.png"
+            post.img_url = DEFAULT_IMAGE_URL
+            post.img_renditions = {}
+            post.image_status = ''
         if commit:
             post.save()
         return post
@@ -0,0 +1,96 @@
+"""
+images.py
+
+Responsive renditions for post images:
+- Resizes an original image to thumbnail/card/hero widths with Pillow
+- Writes a JPEG and a WebP file per width under content-hashed names
+- Returns the rendition map stored in Post.img_renditions
+"""
+
+import hashlib
+import io
+import os
+
+from PIL import Image, ImageOps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils.text import slugify
+
+# (name, width in px); cards render at ~110px, so "card" covers 2x/3x screens
+RENDITIONS = (
+    ('thumbnail', 160),
+    ('card', 320),
+    ('hero', 1200),
+)
+RENDITION_DIR = 'blog/posts/renditions'
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+
+def _digest(source):
+    # Short content hash of the original, used to name its renditions
+    sha = hashlib.sha256()
+    source.seek(0)
+    for chunk in iter(lambda: source.read(64 * 1024), b''):
+        sha.update(chunk)
+    source.seek(0)
+    return sha.hexdigest()[:12]
+
+
+def _open_rgb(source, max_width):
+    image = Image.open(source)
+    # Let the JPEG decoder downscale by 1/2..1/8 while decoding, which is
+    # far cheaper than decoding the full multi-megapixel original.
+    image.draft('RGB', (max_width, max_width))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _encode(image, fmt, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def build_renditions(source, storage=default_storage):
+    """
+    Generate every rendition of an image file object.
+
+    Widths larger than the original are skipped (the smallest one is always
+    produced). Returns {name: {'width', 'height', 'jpeg', 'webp'}} with
+    storage names, ready to be saved in Post.img_renditions.
+    """
+    digest = _digest(source)
+    stem = slugify(os.path.splitext(os.path.basename(source.name or 'image'))[0])[:40] or 'image'
+    widths = sorted(RENDITIONS, key=lambda item: item[1], reverse=True)
+
+    renditions = {}
+    with _open_rgb(source, widths[0][1]) as image:
+        current = image
+        for name, width in widths:
+            if width >= image.width and (name, width) != widths[-1]:
+                continue
+            if width < current.width:
+                height = max(1, round(current.height * width / current.width))
+                # Each size is reduced from the previous, larger one.
+                current = current.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+            base = f'{RENDITION_DIR}/{stem}-{digest}-{current.width}'
+            renditions[name] = {
+                'width': current.width,
+                'height': current.height,
+                'jpeg': _save(storage, f'{base}.jpg', _encode(current, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)),
+                'webp': _save(storage, f'{base}.webp', _encode(current, 'WEBP', quality=WEBP_QUALITY, method=4)),
+            }
+    return renditions
+
+
+def _save(storage, name, content):
+    # Names are content-hashed, so an existing file already holds these bytes.
+    if storage.exists(name):
+        return name
+    return storage.save(name, content)
@@ -0,0 +1,165 @@
+"""
+instrumentation.py
+
+Per-request query instrumentation:
+- QueryRecorder hooks database execution and records every query of a request
+- Identical SQL shapes repeated within a request are flagged as likely N+1s
+- query_budget() declares how many queries a view may run; QueryBudgetMiddleware
+  checks each request against it and logs (or, in strict mode, raises) on overruns
+"""
+
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('blog.queries')
+
+# Lists of placeholders, as produced by __in lookups, share one shape
+IN_LIST_RE = re.compile(r'\((?:%s, )+%s\)')
+SPACE_RE = re.compile(r'\s+')
+# Transaction control is not counted; tests add savepoints production never runs
+TRANSACTION_RE = re.compile(r'\s*(SAVEPOINT|RELEASE|ROLLBACK|BEGIN|COMMIT)\b', re.IGNORECASE)
+
+
+# Recorder of the request being handled; sync_to_async copies it into the
+# thread where async views' queries run
+active_recorder = ContextVar('active_query_recorder', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def record_query(execute, sql, params, many, context):
+    # Execute wrapper installed on every connection, passing queries to the active recorder
+    recorder = active_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection, **kwargs):
+    """
+    connection_created receiver: route the connection's queries to record_query().
+
+    Database connections are per thread, so a recorder cannot simply wrap the
+    connections it sees; async views query from another thread. The wrapper
+    goes first in the list, as connection.execute_wrapper() pops the last one.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def query_shape(sql):
+    # Parameters are passed separately, so the SQL text is already a template
+    return IN_LIST_RE.sub('(%s, ...)', SPACE_RE.sub(' ', sql.strip()))
+
+
+class QueryRecorder:
+    """Database execute wrapper collecting (sql, seconds) for every query."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if not TRANSACTION_RE.match(sql):
+                self.queries.append((sql, time.perf_counter() - started))
+
+    @contextmanager
+    def record(self):
+        # Connections opened before the receiver was connected are covered too
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+        token = active_recorder.set(self)
+        try:
+            yield self
+        finally:
+            active_recorder.reset(token)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(seconds for _, seconds in self.queries)
+
+    def repeated(self, threshold=None):
+        # {shape: count} for statements run at least `threshold` times
+        if threshold is None:
+            threshold = getattr(settings, 'BLOG_QUERY_REPEAT_THRESHOLD', 3)
+        shapes = Counter(query_shape(sql) for sql, _ in self.queries)
+        return {shape: count for shape, count in shapes.items() if count >= threshold}
+
+
+def query_budget(limit):
+    """
+    Declare the most queries a request to the decorated view may run.
+
+    The budget covers the whole request, session and user lookups included.
+    It is stored on the function, so it survives decorators that use
+    functools.wraps.
+    """
+    def decorator(view_func):
+        view_func.query_budget = limit
+        return view_func
+    return decorator
+
+
+class QueryBudgetMiddleware:
+    # Middleware recording each request's queries and checking them against the view's budget.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+        return self.finish(request, recorder, response)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = await self.get_response(request)
+        return self.finish(request, recorder, response)
+
+    def finish(self, request, recorder, response):
+        request.query_recorder = recorder
+        self.check(request, recorder)
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(recorder.count)
+        return response
+
+    def check(self, request, recorder):
+        problems = []
+        # The view's budget survives decorators through functools.wraps
+        match = getattr(request, 'resolver_match', None)
+        budget = getattr(match.func, 'query_budget', None) if match else None
+        if budget is not None and recorder.count > budget:
+            problems.append(f"{recorder.count} queries, budget is {budget}")
+        for shape, count in recorder.repeated().items():
+            problems.append(f"possible N+1, {count}x: {shape[:200]}")
+        if not problems:
+            return
+        message = f"{request.method} {request.path}: " + "; ".join(problems)
+        if getattr(settings, 'BLOG_QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
@@ -0,0 +1,144 @@
+"""
+jobs.py
+
+Database-backed background jobs:
+- enqueue() stores idempotent jobs keyed by a unique key
+- claim_jobs(), complete() and fail() are used by the run_worker command
+- Job handlers are registered by kind and run in worker processes
+"""
+
+import traceback
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .caching import invalidate_tags, post_tags
+from . import related
+from .images import build_renditions
+from .models import IMAGE_FAILED, IMAGE_READY, Job, Post
+
+# Retry delays grow as BACKOFF_BASE * 2 ** (attempt - 1), capped at BACKOFF_MAX
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=1)
+
+# Running jobs whose worker died are handed out again after this long
+STALE_AFTER = timedelta(minutes=15)
+
+HANDLERS = {}
+
+
+def register(kind, on_failure=None):
+    # Decorator registering a job handler; on_failure runs once retries are exhausted
+    def decorator(func):
+        HANDLERS[kind] = (func, on_failure)
+        return func
+    return decorator
+
+
+def enqueue(kind, key, payload=None, max_attempts=5, rearm=False):
+    """
+    Queue a job unless one with the same key exists.
+
+    Pending, running and finished jobs are left alone; a job that failed
+    for good is reset so the work is tried again. With rearm=True a
+    finished job is queued again too, for work that must be redone after
+    every change (one pending job still covers many changes).
+    """
+    restart = [Job.FAILED, Job.DONE] if rearm else [Job.FAILED]
+    try:
+        with transaction.atomic():
+            return Job.objects.create(kind=kind, key=key, payload=payload or {}, max_attempts=max_attempts)
+    except IntegrityError:
+        Job.objects.filter(key=key, status__in=restart).update(
+            status=Job.PENDING, attempts=0, run_after=timezone.now(), last_error=''
+        )
+        return Job.objects.get(key=key)
+
+
+def requeue_stale():
+    # Hand out jobs again whose worker disappeared mid-run
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=timezone.now() - STALE_AFTER).update(
+        status=Job.PENDING, locked_at=None
+    )
+
+
+def claim_jobs(limit):
+    # Atomically move up to `limit` due jobs from pending to running
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.PENDING, run_after__lte=now).order_by('run_after')
+    claimed = [
+        pk for pk in due.values_list('pk', flat=True)[:limit]
+        # the status guard makes the claim safe against other workers
+        if Job.objects.filter(pk=pk, status=Job.PENDING).update(
+            status=Job.RUNNING, locked_at=now, attempts=F('attempts') + 1
+        )
+    ]
+    return list(Job.objects.filter(pk__in=claimed).order_by('run_after'))
+
+
+def run_job(kind, payload):
+    # Entry point executed inside a worker process
+    handler, on_failure = HANDLERS[kind]
+    return handler(**payload)
+
+
+def complete(job):
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, locked_at=None, last_error='')
+
+
+def fail(job, error):
+    # Schedule a retry with exponential backoff, or give up after max_attempts
+    if job.attempts >= job.max_attempts:
+        Job.objects.filter(pk=job.pk).update(status=Job.FAILED, locked_at=None, last_error=error)
+        handler, on_failure = HANDLERS.get(job.kind, (None, None))
+        if on_failure:
+            on_failure(**job.payload)
+        return
+    delay = min(BACKOFF_BASE * 2 ** (job.attempts - 1), BACKOFF_MAX)
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.PENDING, locked_at=None, last_error=error, run_after=timezone.now() + delay
+    )
+
+
+def format_error(error):
+    return ''.join(traceback.format_exception(error))[-4000:]
+
+
+# Job handlers
+
+def post_renditions_failed(post_id, source):
+    # The dashboard card shows the status; updated_at is part of its cache key
+    Post.objects.filter(pk=post_id, img_url=source).update(image_status=IMAGE_FAILED, updated_at=timezone.now())
+
+
+@register('post_renditions', on_failure=post_renditions_failed)
+def build_post_renditions(post_id, source):
+    # Resize a post's uploaded image; a no-op once the image has been replaced
+    post = Post.objects.filter(pk=post_id, img_url=source).only('id', 'img_url').first()
+    if post is None:
+        return
+    with post.img_url.storage.open(source, 'rb') as image:
+        renditions = build_renditions(image, storage=post.img_url.storage)
+    updated = Post.objects.filter(pk=post_id, img_url=source).update(
+        img_renditions=renditions, image_status=IMAGE_READY, updated_at=timezone.now()
+    )
+    if updated:
+        # update() skips the post_save signals, so drop cached pages showing the old image
+        post = Post.objects.filter(pk=post_id).values('category_id', 'is_published').get()
+        invalidate_tags(*post_tags(post_id, post['category_id'], post['is_published']))
+
+
+def queue_post_renditions(post):
+    enqueue('post_renditions', f'post_renditions:{post.pk}:{post.img_url.name}',
+            {'post_id': post.pk, 'source': post.img_url.name})
+
+
+@register('related_posts')
+def refresh_related_posts(post_id):
+    related.refresh_post(post_id)
+
+
+def queue_related_posts(post_id):
+    enqueue('related_posts', f'related_posts:{post_id}', {'post_id': post_id}, rearm=True)
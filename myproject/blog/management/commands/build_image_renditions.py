@@ -0,0 +1,34 @@
+from PIL import UnidentifiedImageError
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog.images import build_renditions
+from blog.models import IMAGE_READY, Post
+
+
+class Command(BaseCommand):
+    help = "Generate resized JPEG/WebP renditions for existing post images."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rebuild renditions that already exist.")
+
+    def handle(self, *args, **options):
+        built = skipped = failed = 0
+        posts = Post.objects.only('id', 'img_url', 'img_renditions').order_by('id')
+        for post in posts.iterator(chunk_size=200):
+            name = str(post.img_url or '')
+            # External images (e.g. the default placeholder) are not ours to resize
+            if not name or name.startswith(('http://', 'https://')) or (post.img_renditions and not options['force']):
+                skipped += 1
+                continue
+            try:
+                with post.img_url.storage.open(name, 'rb') as source:
+                    renditions = build_renditions(source, storage=post.img_url.storage)
+            except (OSError, UnidentifiedImageError) as error:
+                failed += 1
+                self.stderr.write(f"Post {post.pk}: could not process {name}: {error}")
+                continue
+            # update() avoids the save() signals; only the renditions change
+            Post.objects.filter(pk=post.pk).update(img_renditions=renditions, image_status=IMAGE_READY, updated_at=timezone.now())
+            built += 1
+        self.stdout.write(self.style.SUCCESS(f"Renditions built for {built} posts ({skipped} skipped, {failed} failed)."))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog import sessions
+
+
+class Command(BaseCommand):
+    help = "Delete expired sessions in short batches, so requests aren't kept waiting for the write lock."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=1000, help="Sessions deleted per transaction.")
+        parser.add_argument('--pause', type=float, default=0.05, help="Seconds to wait between batches.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = sessions.delete_expired(options['batch'], options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {count} expired sessions in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.models import Post
+from blog.transfer import FORMATS, export_rows, guess_format, write_rows
+
+
+class Command(BaseCommand):
+    help = "Stream every post (or only published ones) to a JSON lines or CSV file, or - for stdout."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to write, or - for standard output.")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to csv for .csv files, jsonl otherwise.")
+        parser.add_argument('--published', action='store_true', help="Only export published posts.")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['path'])
+        posts = Post.objects.filter(is_published=True) if options['published'] else Post.objects.all()
+        rows = export_rows(posts)
+        if options['path'] == '-':
+            write_rows(self.stdout, fmt, rows)
+            return
+        try:
+            file = open(options['path'], 'w', encoding='utf-8', newline='')
+        except OSError as error:
+            raise CommandError(error)
+        with file:
+            count = write_rows(file, fmt, rows)
+        self.stdout.write(self.style.SUCCESS(f"Exported {count} posts to {options['path']}."))
@@ -0,0 +1,50 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.transfer import FORMATS, PostImporter, guess_format, read_rows
+
+
+class Command(BaseCommand):
+    help = "Stream posts from a JSON lines or CSV file (or - for stdin) into the blog in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or - for standard input.")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to csv for .csv files, jsonl otherwise.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Posts written per transaction.")
+        parser.add_argument('--author', help="Username of posts without an author column.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        author = None
+        if options['author']:
+            author = User.objects.filter(username=options['author']).first()
+            if author is None:
+                raise CommandError(f"No user named {options['author']!r}.")
+        fmt = options['format'] or guess_format(options['path'])
+
+        def report_error(number, error):
+            self.stderr.write(f"Line {number}: {error}")
+
+        def report_progress(created):
+            self.stdout.write(f"{created} posts imported...")
+
+        importer = PostImporter(options['batch_size'], author)
+        if options['path'] == '-':
+            importer.run(read_rows(sys.stdin, fmt), report_error, report_progress)
+        else:
+            try:
+                file = open(options['path'], encoding='utf-8', newline='')
+            except OSError as error:
+                raise CommandError(error)
+            with file:
+                importer.run(read_rows(file, fmt), report_error, report_progress)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {importer.created} posts ({importer.failed} rows skipped)."
+        ))
+        if importer.created:
+            # Similarities and image renditions are only computed in bulk
+            self.stdout.write("Run rebuild_related_posts (and build_image_renditions for uploaded images) next.")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog import popularity
+
+
+class Command(BaseCommand):
+    help = "Move the popularity epoch to now, rescaling every post's stored score."
+
+    def handle(self, *args, **options):
+        epoch = popularity.rebase()
+        self.stdout.write(self.style.SUCCESS(f"Popularity scores rebased to {epoch:%Y-%m-%d %H:%M:%S %Z}."))
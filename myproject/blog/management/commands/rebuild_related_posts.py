@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog import related
+
+
+class Command(BaseCommand):
+    help = "Recompute the content-similarity related posts of every published post."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=related.TOP_K, help="Neighbours stored per post.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = related.rebuild(options['k'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Related posts rebuilt for {count} posts in {time.monotonic() - started:.1f}s."
+        ))
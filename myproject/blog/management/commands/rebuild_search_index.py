@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from blog.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for published posts in one bulk pass."
+
+    def handle(self, *args, **options):
+        # Needed after bulk changes that bypass Post signals (queryset.update, raw SQL, imports).
+        indexed = get_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt: {indexed} published posts indexed."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog import categories
+
+
+class Command(BaseCommand):
+    help = "Recompute every category's published post count from one grouped query."
+
+    def handle(self, *args, **options):
+        fixed = categories.reconcile()
+        self.stdout.write(self.style.SUCCESS(f"Reconciled category counts: {fixed} corrected."))
@@ -0,0 +1,79 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from blog import jobs, worker
+
+
+class Command(BaseCommand):
+    help = "Process queued background jobs (image renditions, ...) with a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2,
+                            help="Size of the process pool; 0 runs jobs in this process.")
+        parser.add_argument('--batch', type=int, default=10, help="Jobs claimed per poll.")
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit once no due jobs are left.")
+
+    def new_pool(self, processes):
+        return ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=worker.init_process,
+        )
+
+    def handle(self, *args, **options):
+        pool = self.new_pool(options['processes']) if options['processes'] > 0 else None
+        try:
+            while True:
+                jobs.requeue_stale()
+                claimed = jobs.claim_jobs(options['batch'])
+                if not claimed:
+                    if options['once']:
+                        break
+                    # Don't hold an idle SQLite connection between polls
+                    connections.close_all()
+                    time.sleep(options['poll'])
+                    continue
+                if pool is None:
+                    self.run_inline(claimed)
+                elif not self.run_pooled(pool, claimed):
+                    # A crashed child breaks the whole pool; start a fresh one
+                    pool.shutdown(cancel_futures=True)
+                    pool = self.new_pool(options['processes'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+    def run_inline(self, claimed):
+        for job in claimed:
+            try:
+                jobs.run_job(job.kind, job.payload)
+            except Exception as error:
+                self.finish(job, error)
+            else:
+                self.finish(job, None)
+
+    def run_pooled(self, pool, claimed):
+        # Returns False when the pool broke and has to be replaced
+        futures = {pool.submit(worker.execute, job.kind, job.payload): job for job in claimed}
+        healthy = True
+        for future in as_completed(futures):
+            error = future.exception()
+            healthy = healthy and not isinstance(error, BrokenProcessPool)
+            self.finish(futures[future], error)
+        return healthy
+
+    def finish(self, job, error):
+        if error is None:
+            jobs.complete(job)
+            self.stdout.write(f"Job {job.pk} ({job.kind}) done")
+        else:
+            jobs.fail(job, jobs.format_error(error))
+            self.stderr.write(f"Job {job.pk} ({job.kind}) failed on attempt {job.attempts}: {error}")
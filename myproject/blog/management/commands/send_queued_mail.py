@@ -0,0 +1,37 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from blog import outbox
+
+
+class Command(BaseCommand):
+    help = "Deliver queued email from the outbox in batches over one reused connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=50, help="Messages claimed per poll.")
+        parser.add_argument('--poll', type=float, default=5.0, help="Seconds to sleep when the outbox is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit once no due messages are left.")
+
+    def handle(self, *args, **options):
+        connection = get_connection()
+        try:
+            while True:
+                outbox.requeue_stale()
+                batch = outbox.claim(options['batch'])
+                if not batch:
+                    # Don't keep the mail relay or SQLite connections open while idle
+                    connection.close()
+                    if options['once']:
+                        break
+                    connections.close_all()
+                    time.sleep(options['poll'])
+                    continue
+                sent, failed = outbox.deliver(batch, connection)
+                self.stdout.write(f"Sent {sent} message(s), {failed} failed")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
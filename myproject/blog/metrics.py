@@ -0,0 +1,268 @@
+"""
+metrics.py
+
+Request metrics in the Prometheus text format:
+- MetricsMiddleware counts requests per route name, method and status, and
+  observes latency, database queries and time (from the query recorder's
+  execute wrapper) and template render time (from the template backend)
+- Every process keeps its metrics in memory and saves them to its own file in
+  BLOG_METRICS_DIR at most every BLOG_METRICS_FLUSH_INTERVAL seconds; the
+  /metrics view adds up all the files, so every WSGI worker is counted
+- Files of exited workers stay, keeping counters monotonic: empty the
+  directory when the server is (re)started, not while it runs
+"""
+
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.urls import Resolver404, resolve
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+
+from .instrumentation import query_budget
+from .profiling import add_template_timer, template_timers
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'blog_http_requests_total': ('counter', "Requests handled, by route, method and status.", None),
+    'blog_http_request_duration_seconds': ('histogram', "Time to produce the response, by route.", SECONDS_BUCKETS),
+    'blog_http_request_db_queries': ('histogram', "Database queries per request, by route.", QUERY_BUCKETS),
+    'blog_http_request_db_seconds': ('histogram', "Time in database queries per request, by route.", SECONDS_BUCKETS),
+    'blog_http_request_template_seconds': ('histogram', "Time rendering templates per request, by route.", SECONDS_BUCKETS),
+}
+
+
+def metrics_dir():
+    return getattr(settings, 'BLOG_METRICS_DIR', os.path.join(settings.BASE_DIR, 'var', 'metrics'))
+
+
+class Registry:
+    """Counters and histograms of this process, saved to a file of its own."""
+
+    def __init__(self):
+        self.start()
+
+    def start(self):
+        # A forked child gets new locks, in case the parent held them
+        self.lock = threading.Lock()
+        # Threads share the file (and its temporary copy): one writes at a time
+        self.flush_lock = threading.Lock()
+        # Named after the process and its start, so a reused pid gets a new file
+        self.filename = f'{os.getpid()}-{time.time_ns():x}.json'
+        self.last_flush = 0.0
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # (name, labels) -> value, and -> [count per bucket..., +Inf count, sum]
+            self.counters = defaultdict(float)
+            self.histograms = {}
+
+    def inc(self, name, labels, amount=1):
+        with self.lock:
+            self.counters[name, labels] += amount
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        with self.lock:
+            counts = self.histograms.get((name, labels))
+            if counts is None:
+                counts = self.histograms[name, labels] = [0] * (len(buckets) + 1) + [0.0]
+            # Stored per bucket; cumulated when rendered
+            index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+            counts[index] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, dict(labels), list(counts)] for (name, labels), counts in self.histograms.items()],
+            }
+
+    def flush(self, wait=True):
+        # Atomically replace this process's file; without `wait`, leave it to
+        # a thread already writing it
+        if not self.flush_lock.acquire(blocking=wait):
+            return
+        try:
+            directory = metrics_dir()
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, self.filename)
+            with open(path + '.tmp', 'w') as file:
+                json.dump(self.snapshot(), file)
+            os.replace(path + '.tmp', path)
+            self.last_flush = time.monotonic()
+        finally:
+            self.flush_lock.release()
+
+    def maybe_flush(self):
+        if time.monotonic() - self.last_flush >= getattr(settings, 'BLOG_METRICS_FLUSH_INTERVAL', 1.0):
+            self.flush(wait=False)
+
+
+registry = Registry()
+# Workers forked from a preloaded parent start empty, with files of their own
+os.register_at_fork(after_in_child=registry.start)
+
+
+@atexit.register
+def flush_on_exit():
+    if registry.counters or registry.histograms:
+        registry.flush()
+
+
+def collect():
+    """Metrics of every process, added up: ({(name, labels): value}, {(name, labels): counts})."""
+    counters, histograms = defaultdict(float), {}
+    directory = metrics_dir()
+    names = os.listdir(directory) if os.path.isdir(directory) else []
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            continue  # removed meanwhile
+        for metric, labels, value in data['counters']:
+            counters[metric, tuple(sorted(labels.items()))] += value
+        for metric, labels, counts in data['histograms']:
+            key = (metric, tuple(sorted(labels.items())))
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], counts)]
+            else:
+                histograms[key] = counts
+    return counters, histograms
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in pairs) + '}'
+
+
+def format_value(value):
+    if math.isinf(value):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def render(counters, histograms):
+    """The metrics in the Prometheus text exposition format."""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+            continue
+        for (metric, labels), counts in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, math.inf), counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", format_value(bound))])} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {format_value(counts[-1])}')
+            lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def route_name(request):
+    # The URL name keeps the label set small; unknown paths share one value
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        # Redirected by a middleware before the view was resolved
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return 'unmatched'
+    return match.view_name or 'unnamed'
+
+
+class RequestTimer:
+    """Template time of one request, and what to record once it is done."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.template_seconds = 0.0
+        self.token = add_template_timer(self.add_template)
+
+    def add_template(self, name, seconds):
+        self.template_seconds += seconds
+
+    def finish(self, request, response):
+        duration = time.perf_counter() - self.started
+        template_timers.reset(self.token)
+        route = (('route', route_name(request)),)
+        method = request.method if request.method in METHODS else 'other'
+        registry.inc('blog_http_requests_total', (('method', method), *route, ('status', str(response.status_code))))
+        registry.observe('blog_http_request_duration_seconds', route, duration)
+        registry.observe('blog_http_request_template_seconds', route, self.template_seconds)
+        # Recorded by QueryBudgetMiddleware, which runs inside this one
+        recorder = getattr(request, 'query_recorder', None)
+        if recorder is not None:
+            registry.observe('blog_http_request_db_queries', route, recorder.count)
+            registry.observe('blog_http_request_db_seconds', route, recorder.duration)
+        registry.maybe_flush()
+        return response
+
+
+class MetricsMiddleware:
+    # Middleware recording request metrics; goes first in MIDDLEWARE to time the whole stack.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = RequestTimer()
+        return timer.finish(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        timer = RequestTimer()
+        return timer.finish(request, await self.get_response(request))
+
+
+@query_budget(2)
+@require_safe
+@never_cache
+def metrics(request):
+    # Prometheus scrape endpoint, for BLOG_METRICS_TOKEN as a bearer token or,
+    # without one set, for signed-in staff only
+    token = getattr(settings, 'BLOG_METRICS_TOKEN', None)
+    if token:
+        allowed = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = request.user.is_staff
+    if not allowed:
+        return HttpResponseForbidden("Metrics need a valid bearer token.")
+    registry.flush()
+    return HttpResponse(render(*collect()), content_type=CONTENT_TYPE)
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+def has_fts5(connection):
+    # SQLite can be built without FTS5; blog.search then uses SimpleSearchBackend too.
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_search_index(apps, schema_editor):
+    # The FTS5 index only exists on SQLite with FTS5; other databases use SimpleSearchBackend.
+    if not has_fts5(schema_editor.connection):
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS blog_post_fts "
+        "USING fts5(title, content, category, tokenize='porter unicode61')"
+    )
+    schema_editor.execute(
+        "INSERT INTO blog_post_fts(rowid, title, content, category) "
+        "SELECT p.id, p.title, p.content, COALESCE(c.name, '') "
+        "FROM blog_post p LEFT JOIN blog_category c ON c.id = p.category_id "
+        "WHERE p.is_published"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if not has_fts5(schema_editor.connection):
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS blog_post_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_post_ordering_and_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='img_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
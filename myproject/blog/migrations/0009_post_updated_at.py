@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_create_at(apps, schema_editor):
+    # Existing posts count as unchanged since they were written
+    Post = apps.get_model('blog', 'Post')
+    Post.objects.update(updated_at=models.F('create_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_outbox_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_create_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:05
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counts(apps, schema_editor):
+    # Same grouped query as blog.categories.reconcile()
+    Category = apps.get_model('blog', 'Category')
+    Post = apps.get_model('blog', 'Post')
+    counts = (
+        Post.objects.filter(is_published=True, category__isnull=False)
+        .values_list('category').annotate(total=Count('id')).order_by()
+    )
+    for category_id, total in counts:
+        Category.objects.filter(pk=category_id).update(published_post_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_post_view_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='published_post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def blank_sent_bodies(apps, schema_editor):
+    # Messages sent before the outbox started emptying them
+    OutboxEmail = apps.get_model('blog', 'OutboxEmail')
+    OutboxEmail.objects.filter(status='sent').exclude(body='').update(body='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_category_published_post_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(blank_sent_bodies, migrations.RunPython.noop),
+    ]
@@ -1,31 +1,109 @@
+import math
+
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
-from django.utils.text import slugify
+from django.utils.text import slugify,Truncator
 from django.urls import reverse
+from django.utils import timezone
 
 # Category model for blog post categories
 class Category(models.Model):
     name = models.CharField(max_length=100)
+    published_post_count = models.PositiveIntegerField(default=0, editable=False) # kept by signals, see blog/categories.py
+
+    # Method to get the URL of the category's listing
+    def get_absolute_url(self):
+        return reverse('blog:category', kwargs={'category_id': self.pk})
 
     def __str__(self):
         return self.name
 
+# Processing states of a post's image renditions
+IMAGE_PENDING = 'pending'
+IMAGE_READY = 'ready'
+IMAGE_FAILED = 'failed'
+IMAGE_STATUS_CHOICES = [
+    (IMAGE_PENDING, 'Processing'),
+    (IMAGE_READY, 'Ready'),
+    (IMAGE_FAILED, 'Failed'),
+]
+
+# Shown for posts without an image of their own
+DEFAULT_IMAGE_URL = "https://upload.wikimedia.org/wikipedia/commons/thumb/a/ac/No_image_available.svg/2048px-No_image_available.svg.png"
+
+# Stored summary of a post's content, shown on listing cards
+EXCERPT_WORDS = 30
+WORDS_PER_MINUTE = 200
+# Post fields only blog/popularity.py writes, with UPDATEs of its own
+VIEW_COUNTER_FIELDS = ('view_count', 'popularity')
+
 # Post model for blog posts
 class Post(models.Model):
     title = models.CharField(max_length=100)
     content = models.TextField()
     img_url = models.ImageField(null=True,upload_to='blog/posts/images') # provides a path to the blog post images
     create_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True) # Last-Modified of the post's page
     slug = models.SlugField(unique=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True) # foreign key to Category model
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True) # foreign key to User model
     is_published = models.BooleanField(default=False)
+    img_renditions = models.JSONField(default=dict, blank=True, editable=False) # resized copies of img_url, see blog/images.py
+    image_status = models.CharField(max_length=10, choices=IMAGE_STATUS_CHOICES, blank=True, editable=False) # progress of the renditions job
+    excerpt = models.TextField(blank=True, editable=False) # first words of content, so listings can skip loading it
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveSmallIntegerField(default=1, editable=False) # minutes
+    view_count = models.PositiveIntegerField(default=0, editable=False) # written by blog/popularity.py only
+    popularity = models.FloatField(default=0, editable=False) # decayed view score, see blog/popularity.py
+
+    class Meta:
+        # Newest first, with id as a tie-breaker so pagination is deterministic
+        ordering = ['-create_at', '-id']
+        # Indexes matched to the listing queries in views.py
+        indexes = [
+            # index: published posts, newest first
+            models.Index(fields=['-create_at', '-id'], condition=models.Q(is_published=True), name='post_published_recent_idx'),
+            # details: related posts in the same category
+            models.Index(fields=['category', '-create_at', '-id'], condition=models.Q(is_published=True), name='post_category_recent_idx'),
+            # dashboard: an author's own posts
+            models.Index(fields=['user', '-create_at', '-id'], name='post_user_recent_idx'),
+            # dashboard: every post, for editors
+            models.Index(fields=['-create_at', '-id'], name='post_recent_idx'),
+            # index sidebar: most read and trending published posts
+            models.Index(fields=['-view_count', '-id'], condition=models.Q(is_published=True), name='post_most_read_idx'),
+            models.Index(fields=['-popularity', '-id'], condition=models.Q(is_published=True), name='post_trending_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        # Automatically generate slug from title
+        # Leave the view counters to their batched flushes: saving a copy
+        # loaded earlier would undo the views counted since
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in VIEW_COUNTER_FIELDS and field.attname not in deferred
+            ]
+        # Automatically generate a unique slug from title
         if not self.slug:
-            self.slug = slugify(self.title)
+            self.slug = unique_slugs([self.title])[0]
+        # Refresh the stored excerpt whenever the content is loaded, i.e. may have changed
+        if 'content' not in self.get_deferred_fields():
+            self.update_summary()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'content' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'excerpt', 'word_count', 'reading_time'}
+        # auto_now only applies to the fields being saved
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'updated_at'}
         super().save(*args, **kwargs)
+
+    # Method to compute the excerpt, word count and reading time from the content
+    def update_summary(self):
+        words = self.content.split()
+        self.word_count = len(words)
+        self.reading_time = max(1, math.ceil(len(words) / WORDS_PER_MINUTE))
+        self.excerpt = Truncator(" ".join(words[:EXCERPT_WORDS + 1])).words(EXCERPT_WORDS)
     
     # Property to get the formatted image URL to handle both local and external URLs
     @property
@@ -34,10 +112,202 @@ class Post(models.Model):
             return self.img_url
         
         return self.img_url.url
+
+    # Helpers to build responsive <img>/<picture> markup from the stored renditions,
+    # falling back to the original image when no renditions exist (yet)
+    def rendition_url(self, name, fmt='jpeg'):
+        rendition = self.img_renditions.get(name)
+        if not rendition:
+            return self.formatted_url
+        return self.img_url.storage.url(rendition[fmt])
+
+    def _srcset(self, fmt):
+        renditions = sorted(self.img_renditions.values(), key=lambda item: item['width'])
+        return ", ".join(f"{self.img_url.storage.url(item[fmt])} {item['width']}w" for item in renditions)
+
+    @property
+    def thumbnail_url(self):
+        return self.rendition_url('thumbnail')
+
+    @property
+    def card_url(self):
+        return self.rendition_url('card')
+
+    @property
+    def hero_url(self):
+        return self.rendition_url('hero')
+
+    @property
+    def srcset(self):
+        return self._srcset('jpeg')
+
+    @property
+    def webp_srcset(self):
+        return self._srcset('webp')
     
     # Method to get the absolute URL for the view blog post 
     def get_absolute_url(self):
         return reverse('blog:details', kwargs={'slug': self.slug})
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.title
+
+# Unique slugs: "<slugified title>", or "<slugified title>-<n>" once taken.
+# Bases leave room for the suffix within the slug's max_length.
+SLUG_SUFFIX_ROOM = 8
+# Distinct bases looked up per query, keeping the OR'd ranges well below
+# SQLite's expression depth limit (1000)
+SLUG_QUERY_CHUNK = 300
+
+def slug_base(value):
+    max_length = Post._meta.get_field('slug').max_length
+    return slugify(value)[:max_length - SLUG_SUFFIX_ROOM].strip('-') or 'post'
+
+def unique_slugs(values):
+    """
+    Unique slugs for a batch of titles (or wanted slugs), in order.
+
+    Taken slugs are read with one query per SLUG_QUERY_CHUNK distinct bases:
+    a base's slug and its numbered variants sort from "base" to just below
+    "base." ('-' is the only slug character before '.'), so each base is
+    one range scan of the slug index.
+    """
+    bases = [slug_base(value) for value in values]
+    distinct = sorted(set(bases))
+    taken = set()
+    for start in range(0, len(distinct), SLUG_QUERY_CHUNK):
+        chunk = distinct[start:start + SLUG_QUERY_CHUNK]
+        ranges = Q(*(Q(slug__gte=base, slug__lt=base + '.') for base in chunk), _connector=Q.OR)
+        # Unordered, or SQLite walks the whole table in Meta.ordering order instead
+        taken.update(Post.objects.filter(ranges).order_by().values_list('slug', flat=True))
+
+    slugs = []
+    counters = {}
+    for base in bases:
+        number = counters.get(base, 1)
+        slug = base if number == 1 else f'{base}-{number}'
+        while slug in taken:
+            number += 1
+            slug = f'{base}-{number}'
+        counters[base] = number
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+# Background job queue, processed outside the request by `manage.py run_worker`
+class Job(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50) # name of a handler registered in blog/jobs.py
+    key = models.CharField(max_length=255, unique=True) # idempotency key, one job per unit of work
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now) # retry backoff pushes this forward
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # the worker polls for due pending jobs
+            models.Index(fields=['run_after'], condition=models.Q(status='pending'), name='job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} [{self.status}]"
+
+
+# Precomputed content-similarity neighbours of a post, see blog/related.py
+class RelatedPost(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_from')
+    score = models.FloatField() # cosine similarity of the TF-IDF vectors
+    rank = models.PositiveSmallIntegerField() # 0 is the closest neighbour
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'rank'], name='relatedpost_post_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} -> {self.related_id} ({self.score:.3f})"
+
+
+# Outgoing email, delivered in batches by the send_queued_mail command (see blog/outbox.py)
+class OutboxEmail(models.Model):
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (DEAD, 'Dead letter'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField() # emptied once sent, see blog/outbox.py
+    from_email = models.CharField(max_length=255, blank=True) # blank means DEFAULT_FROM_EMAIL
+    to = models.JSONField(default=list) # list of recipient addresses
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=6)
+    run_after = models.DateTimeField(default=timezone.now) # retry backoff pushes this forward
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the mail worker polls for due pending messages
+            models.Index(fields=['run_after'], condition=models.Q(status='pending'), name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} [{self.status}]"
+
+
+# A request captured by blog/profiling.py; its stacks are a file in BLOG_PROFILING_DIR
+class RequestProfile(models.Model):
+    created_at = models.DateTimeField(auto_now_add=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    status = models.PositiveSmallIntegerField()
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    mode = models.CharField(max_length=10) # 'sample' (folded stacks) or 'cprofile'
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    sql_ms = models.FloatField()
+    template_ms = models.FloatField()
+    queries = models.JSONField(default=list) # [sql, ms], slowest first
+    templates = models.JSONField(default=list) # [template name, ms], in render order
+    stack_file = models.CharField(max_length=100)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+
+# Time the stored Post.popularity scores are relative to (see blog/popularity.py);
+# a single row, moved forward when the scores are rebased
+class PopularityEpoch(models.Model):
+    started_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Popularity epoch {self.started_at:%Y-%m-%d %H:%M}"
@@ -0,0 +1,103 @@
+"""
+outbox.py
+
+Email outbox, so requests never wait on the mail relay:
+- queue_mail() stores a message; the send_queued_mail command delivers it
+- Messages are claimed in batches and sent over one reused backend connection
+- Failures are retried with exponential backoff, then kept as dead letters
+- Sent messages keep their headers but not their body, which may carry a
+  password reset link
+"""
+
+from contextlib import suppress
+from datetime import timedelta
+
+from django.core.mail import EmailMessage
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .jobs import format_error
+from .models import OutboxEmail
+
+# Retry delays grow as BACKOFF_BASE * 2 ** (attempt - 1), capped at BACKOFF_MAX
+BACKOFF_BASE = timedelta(minutes=1)
+BACKOFF_MAX = timedelta(hours=1)
+
+# Messages claimed by a worker that died are handed out again after this long
+STALE_AFTER = timedelta(minutes=10)
+
+
+def queue_mail(subject, body, to, from_email=None):
+    # Store a message for the delivery worker; the from address defaults to DEFAULT_FROM_EMAIL
+    return OutboxEmail.objects.create(subject=subject, body=body, to=list(to), from_email=from_email or '')
+
+
+def requeue_stale():
+    return OutboxEmail.objects.filter(
+        status=OutboxEmail.SENDING, locked_at__lt=timezone.now() - STALE_AFTER
+    ).update(status=OutboxEmail.PENDING, locked_at=None)
+
+
+def claim(limit):
+    # Atomically move up to `limit` due messages from pending to sending
+    now = timezone.now()
+    due = OutboxEmail.objects.filter(status=OutboxEmail.PENDING, run_after__lte=now).order_by('run_after')
+    ids = list(due.values_list('pk', flat=True)[:limit])
+    # the status guard keeps concurrent workers from claiming the same rows
+    OutboxEmail.objects.filter(pk__in=ids, status=OutboxEmail.PENDING).update(
+        status=OutboxEmail.SENDING, locked_at=now, attempts=F('attempts') + 1
+    )
+    return list(OutboxEmail.objects.filter(pk__in=ids, status=OutboxEmail.SENDING, locked_at=now).order_by('run_after'))
+
+
+def as_email(message, connection):
+    return EmailMessage(
+        message.subject, message.body, message.from_email or None, message.to, connection=connection,
+    )
+
+
+def fail(message, error):
+    # Schedule a retry with exponential backoff, or dead-letter the message
+    if message.attempts >= message.max_attempts:
+        OutboxEmail.objects.filter(pk=message.pk).update(status=OutboxEmail.DEAD, locked_at=None, last_error=error)
+        return
+    delay = min(BACKOFF_BASE * 2 ** (message.attempts - 1), BACKOFF_MAX)
+    OutboxEmail.objects.filter(pk=message.pk).update(
+        status=OutboxEmail.PENDING, locked_at=None, last_error=error, run_after=timezone.now() + delay,
+    )
+
+
+def deliver(batch, connection):
+    """
+    Send claimed messages over one backend connection; returns (sent, failed).
+
+    The connection is opened once and reused. After an error it is closed,
+    since the server may have dropped it, and reopened for the next message.
+    """
+    sent = []
+    failed = 0
+    for message in batch:
+        try:
+            connection.open()
+            if not connection.send_messages([as_email(message, connection)]):
+                raise RuntimeError("The email backend did not accept the message.")
+        except Exception as error:
+            with suppress(Exception):
+                connection.close()
+            fail(message, format_error(error))
+            failed += 1
+        else:
+            sent.append(message.pk)
+    OutboxEmail.objects.filter(pk__in=sent).update(
+        status=OutboxEmail.SENT, locked_at=None, last_error='', sent_at=timezone.now(), body='',
+    )
+    return len(sent), failed
+
+
+def retry(queryset):
+    # Give dead letters (or any messages) a fresh set of attempts. Messages a
+    # worker is sending are left to it, unless its claim is stale (see requeue_stale)
+    sending = Q(status=OutboxEmail.SENDING, locked_at__gte=timezone.now() - STALE_AFTER)
+    return queryset.exclude(status=OutboxEmail.SENT).exclude(sending).update(
+        status=OutboxEmail.PENDING, attempts=0, run_after=timezone.now(), locked_at=None,
+    )
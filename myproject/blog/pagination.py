@@ -0,0 +1,171 @@
+"""
+pagination.py
+
+Keyset (cursor) pagination for post listings:
+- Pages are fetched by seeking on (create_at, id) instead of COUNT + OFFSET
+- Next/previous links carry opaque cursor tokens
+- An optional cached approximate total, or a known one (e.g. a stored
+  count), feeds the "Page X of Y" label; a total keyed on cache tags (see
+  caching.py) is recounted as soon as one of them is invalidated
+- aget_page()/acount() do the same through the async ORM, for async views
+"""
+
+import base64
+import binascii
+import json
+import math
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .caching import versioned_key
+
+
+class CursorPage:
+    """A single page of results plus the cursors to move around it."""
+
+    def __init__(self, object_list, paginator, number, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.number = number
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Paginate a queryset newest first, keyed on (create_at, id).
+
+    The cost of a page is one indexed range scan of per_page + 1 rows,
+    whatever its depth. Page numbers are carried inside the cursor, so they
+    are only as exact as the cached total used for the page count.
+    """
+
+    def __init__(self, queryset, per_page, count_cache_key=None, count_timeout=300, total=None, count_tags=()):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count_cache_key = count_cache_key
+        self.count_timeout = count_timeout
+        self.count_tags = count_tags
+        if total is not None:
+            self.__dict__['count'] = total
+
+    def count_key(self):
+        # The cache key of the total, changing with the versions of count_tags
+        if self.count_tags:
+            return versioned_key(self.count_cache_key, self.count_tags)
+        return self.count_cache_key
+
+    @cached_property
+    def count(self):
+        # Approximate total, only computed when a cache key is given.
+        if self.count_cache_key is None:
+            return None
+        return cache.get_or_set(self.count_key(), self.queryset.count, self.count_timeout)
+
+    async def acount(self):
+        # Fills the count property, so templates never query from the event loop.
+        if 'count' not in self.__dict__:
+            value = None
+            if self.count_cache_key is not None:
+                key = self.count_key()
+                value = await cache.aget(key)
+                if value is None:
+                    value = await self.queryset.acount()
+                    await cache.aset(key, value, self.count_timeout)
+            self.__dict__['count'] = value
+        return self.count
+
+    @cached_property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def encode_cursor(self, post, direction, number):
+        payload = json.dumps([direction, post.create_at.isoformat(), post.pk, number], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        # Return (direction, create_at, pk, number), or None for a missing/garbled token.
+        if not token:
+            return None
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            direction, create_at, pk, number = json.loads(base64.urlsafe_b64decode(padded))
+            if direction not in ('next', 'prev'):
+                return None
+            return direction, datetime.fromisoformat(create_at), int(pk), max(1, int(number))
+        except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+            return None
+
+    def get_page(self, cursor=None):
+        # Like Paginator.get_page(), an invalid cursor falls back to the first page.
+        position = self.decode_cursor(cursor) or ('next', None, None, 1)
+        page = self._page(position, list(self._rows(position)))
+        if page is None:
+            return self.get_page(None)
+        return page
+
+    async def aget_page(self, cursor=None):
+        position = self.decode_cursor(cursor) or ('next', None, None, 1)
+        page = self._page(position, [row async for row in self._rows(position)])
+        if page is None:
+            return await self.aget_page(None)
+        return page
+
+    def _rows(self, position):
+        # The per_page + 1 rows after (or before) the cursor position
+        direction, create_at, pk, number = position
+        queryset = self.queryset
+        if direction == 'prev':
+            queryset = queryset.filter(Q(create_at__gte=create_at) & (Q(create_at__gt=create_at) | Q(id__gt=pk)))
+            return queryset.order_by('create_at', 'id')[:self.per_page + 1]
+        if create_at is not None:
+            queryset = queryset.filter(Q(create_at__lte=create_at) & (Q(create_at__lt=create_at) | Q(id__lt=pk)))
+        return queryset.order_by('-create_at', '-id')[:self.per_page + 1]
+
+    def _page(self, position, rows):
+        # None when a backward page reached the start of the listing
+        direction, create_at, pk, number = position
+        if direction == 'prev':
+            return self._backward_page(rows, number)
+        return self._forward_page(rows, create_at, number)
+
+    def _forward_page(self, rows, create_at, number):
+        object_list = rows[:self.per_page]
+        next_cursor = previous_cursor = None
+        if len(rows) > self.per_page:
+            next_cursor = self.encode_cursor(object_list[-1], 'next', number + 1)
+        if create_at is not None and object_list:
+            previous_cursor = self.encode_cursor(object_list[0], 'prev', number - 1)
+        return CursorPage(object_list, self, number, next_cursor, previous_cursor)
+
+    def _backward_page(self, rows, number):
+        if len(rows) <= self.per_page:
+            # Reached the start of the listing; the caller shows a full first page.
+            return None
+        object_list = rows[:self.per_page][::-1]
+        next_cursor = self.encode_cursor(object_list[-1], 'next', number + 1)
+        previous_cursor = self.encode_cursor(object_list[0], 'prev', number - 1)
+        return CursorPage(object_list, self, max(2, number), next_cursor, previous_cursor)
@@ -0,0 +1,251 @@
+"""
+popularity.py
+
+Post view counting, without a write per page view:
+- count_views marks the details view: a GET answered with the post (or a
+  304, or the cached page) adds a hit to this process's in-memory buffer
+- The buffer is flushed at most every BLOG_VIEW_FLUSH_INTERVAL seconds,
+  after a response is sent, with one batched UPDATE per SLUG_CHUNK posts;
+  exiting processes flush what is left
+- Post.view_count counts every view; Post.popularity is a view score that
+  halves every BLOG_POPULARITY_HALF_LIFE seconds. It is stored relative to
+  POPULARITY_EPOCH (a view weighs 2 ** (half-lives since the epoch)), so
+  old scores never need rewriting and the indexes order posts by their
+  decayed score as is. Floats overflow about 1000 half-lives after the
+  epoch, so a flush more than REBASE_AFTER half-lives past it first moves
+  the epoch (PopularityEpoch) to now and rescales every score, in the same
+  transaction (python manage.py rebase_popularity does it by hand);
+  half-lives under MIN_HALF_LIFE are refused
+- A flush that fails puts its views back into the buffer for the next one
+- popular_posts and trending_posts read the two partial indexes on Post
+- Pages showing them are tagged 'popular' (see caching.py). A flush
+  invalidates that tag at most once per BLOG_POPULAR_CACHE_TIMEOUT seconds
+  across all processes, so busy posts don't keep emptying the index's page
+  cache; the cached sidebar is keyed on the tag's version
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, FloatField, IntegerField, Value, When
+from django.utils import timezone
+
+from .caching import invalidate_tags, page_cache, versioned_key
+from .instrumentation import active_recorder
+from .models import PopularityEpoch, Post
+
+logger = logging.getLogger('blog.popularity')
+
+# Epoch of the stored scores until the first rebase
+POPULARITY_EPOCH = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+# Scores are rebased this many half-lives after their epoch (2 ** 256 leaves
+# ample room below the float limit of 2 ** 1024), and half-lives shorter than
+# MIN_HALF_LIFE seconds, which would rebase every few days, are refused
+REBASE_AFTER = 256
+MIN_HALF_LIFE = 3600
+# Slugs per UPDATE, keeping the CASE expressions well below SQLite's
+# expression depth limit (1000)
+SLUG_CHUNK = 300
+SIDEBAR_KEY = 'blog:popular-posts:'
+# Held in the shared page cache while the 'popular' tag is not to be bumped again
+REFRESH_KEY = 'blog:popular-refreshed'
+# Tags of the pages and data showing the rankings: published posts and their views
+SIDEBAR_TAGS = ('listing', 'popular')
+
+
+def half_life():
+    seconds = getattr(settings, 'BLOG_POPULARITY_HALF_LIFE', 7 * 24 * 3600)
+    if seconds < MIN_HALF_LIFE:
+        raise ImproperlyConfigured(f"BLOG_POPULARITY_HALF_LIFE must be at least {MIN_HALF_LIFE} seconds.")
+    return seconds
+
+
+def sidebar_timeout():
+    return getattr(settings, 'BLOG_POPULAR_CACHE_TIMEOUT', 60)
+
+
+def current_epoch():
+    """Time the stored scores are relative to."""
+    epoch = PopularityEpoch.objects.filter(pk=1).values_list('started_at', flat=True).first()
+    return epoch or POPULARITY_EPOCH
+
+
+def half_lives(now=None, epoch=None):
+    # Half-lives from the epoch to `now`
+    now = now or timezone.now()
+    return (now - (epoch or current_epoch())).total_seconds() / half_life()
+
+
+def view_weight(now=None, epoch=None):
+    """Popularity a view adds at `now`."""
+    return 2.0 ** half_lives(now, epoch)
+
+
+def decayed(popularity, now=None, epoch=None):
+    """A stored popularity as the score of views decayed to `now`."""
+    # Multiplied rather than divided by the weight, which may overflow
+    return popularity * 2.0 ** -half_lives(now, epoch)
+
+
+def rebase(now=None):
+    """Move the epoch to `now`, rescaling every stored score; returns the new epoch."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        # Scores long decayed underflow to 0, which is what they are worth
+        factor = 2.0 ** -half_lives(now)
+        Post.objects.filter(popularity__gt=0).update(popularity=F('popularity') * factor)
+        PopularityEpoch.objects.update_or_create(pk=1, defaults={'started_at': now})
+    return now
+
+
+class ViewBuffer:
+    """Views per post slug counted by this process since its last flush."""
+
+    def __init__(self):
+        self.start()
+
+    def start(self):
+        # A forked child starts empty, or it would flush its parent's views too
+        self.lock = threading.Lock()
+        self.hits = Counter()
+        self.last_flush = time.monotonic()
+
+    def add(self, slug):
+        with self.lock:
+            self.hits[slug] += 1
+
+    def restore(self, hits):
+        with self.lock:
+            self.hits.update(hits)
+
+    def take(self):
+        with self.lock:
+            hits, self.hits = self.hits, Counter()
+            self.last_flush = time.monotonic()
+        return hits
+
+    def flush(self, now=None):
+        """Write the buffered views to the database; returns how many."""
+        hits = self.take()
+        if not hits:
+            return 0
+        now = now or timezone.now()
+        slugs = list(hits)
+        # Not part of the request that happens to trigger the flush
+        token = active_recorder.set(None)
+        try:
+            with transaction.atomic():
+                # Read in the transaction, so a concurrent rebase can't
+                # leave these views weighed against the old epoch
+                epoch = current_epoch()
+                if half_lives(now, epoch) > REBASE_AFTER:
+                    epoch = rebase(now)
+                weight = view_weight(now, epoch)
+                for start in range(0, len(slugs), SLUG_CHUNK):
+                    chunk = slugs[start:start + SLUG_CHUNK]
+                    Post.objects.filter(slug__in=chunk).update(
+                        view_count=F('view_count') + Case(
+                            *(When(slug=slug, then=Value(hits[slug])) for slug in chunk),
+                            default=Value(0), output_field=IntegerField(),
+                        ),
+                        popularity=F('popularity') + Case(
+                            *(When(slug=slug, then=Value(hits[slug] * weight)) for slug in chunk),
+                            default=Value(0.0), output_field=FloatField(),
+                        ),
+                    )
+            if page_cache().add(REFRESH_KEY, 1, sidebar_timeout()):
+                invalidate_tags('popular')
+        except Exception:
+            self.restore(hits)
+            raise
+        finally:
+            active_recorder.reset(token)
+        return sum(hits.values())
+
+    def flush_if_due(self):
+        if self.hits and time.monotonic() - self.last_flush >= getattr(settings, 'BLOG_VIEW_FLUSH_INTERVAL', 10.0):
+            try:
+                self.flush()
+            except Exception:
+                # The response is already sent; the views wait for the next flush
+                logger.exception("Could not flush %d buffered post views", sum(self.hits.values()))
+
+
+buffer = ViewBuffer()
+os.register_at_fork(after_in_child=buffer.start)
+
+
+@atexit.register
+def flush_on_exit():
+    if buffer.hits:
+        buffer.flush()
+
+
+def flush_views(sender, **kwargs):
+    # request_finished receiver: the response has been sent
+    buffer.flush_if_due()
+
+
+def count_views(view_func):
+    """Count the views of a (sync or async) view taking the post's slug."""
+    def counted(request, slug, response):
+        if request.method == 'GET' and response.status_code in (200, 304):
+            buffer.add(slug)
+        return response
+
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, slug, *args, **kwargs):
+            return counted(request, slug, await view_func(request, slug, *args, **kwargs))
+        return async_wrapper
+
+    @wraps(view_func)
+    def wrapper(request, slug, *args, **kwargs):
+        return counted(request, slug, view_func(request, slug, *args, **kwargs))
+    return wrapper
+
+
+def popular_posts(count=5):
+    # Most read published posts, from post_most_read_idx
+    return Post.objects.filter(is_published=True, view_count__gt=0).order_by('-view_count', '-id').only('id', 'title', 'slug', 'updated_at')[:count]
+
+
+def trending_posts(count=5):
+    # Published posts by decayed popularity, from post_trending_idx
+    return Post.objects.filter(is_published=True, popularity__gt=0).order_by('-popularity', '-id').only('id', 'title', 'slug', 'updated_at')[:count]
+
+
+def sidebar():
+    """{'popular': [...], 'trending': [...]} for the index page, cached until they change."""
+    key = versioned_key(SIDEBAR_KEY, SIDEBAR_TAGS)
+    lists = cache.get(key)
+    if lists is None:
+        count = getattr(settings, 'BLOG_POPULAR_POSTS', 5)
+        lists = {'popular': list(popular_posts(count)), 'trending': list(trending_posts(count))}
+        cache.set(key, lists, sidebar_timeout())
+    return lists
+
+
+async def asidebar():
+    # Same as sidebar(), through the async ORM
+    key = versioned_key(SIDEBAR_KEY, SIDEBAR_TAGS)
+    lists = await cache.aget(key)
+    if lists is None:
+        count = getattr(settings, 'BLOG_POPULAR_POSTS', 5)
+        lists = {
+            'popular': [post async for post in popular_posts(count)],
+            'trending': [post async for post in trending_posts(count)],
+        }
+        await cache.aset(key, lists, sidebar_timeout())
+    return lists
@@ -0,0 +1,268 @@
+"""
+profiling.py
+
+On-demand profiling of single requests:
+- ProfilingMiddleware profiles a request when a staff user asks for it (the
+  X-Profile header or ?profile=1), or a random BLOG_PROFILING_SAMPLE_RATE
+  fraction of all requests
+- Call stacks are taken by a sampler thread and saved as folded stacks
+  (flamegraph.pl, speedscope, inferno), or with BLOG_PROFILING_MODE =
+  'cprofile' saved as a cProfile dump (snakeviz, flameprof). Both cover the
+  thread handling the request: under WSGI an async view runs in asgiref's
+  event loop thread, and shows up as a wait for it; under ASGI it is included
+- The request's SQL (from the query recorder) and template render times
+  (ProfiledDjangoTemplates) are stored with it as a RequestProfile, browsable
+  in the admin
+- Requests that aren't profiled cost a header lookup and a random() call
+"""
+
+import cProfile
+import os
+import random
+import sys
+import sysconfig
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+
+from .instrumentation import QueryRecorder, active_recorder
+from .models import RequestProfile
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_PARAM = 'profile'
+MODES = ('sample', 'cprofile')
+# SQL statements kept per profile, slowest first
+MAX_QUERIES = 200
+
+# Callbacks (template name, seconds) of the request being handled, called
+# by the template backend; profiles and request metrics add theirs
+template_timers = ContextVar('template_timers', default=())
+
+
+def add_template_timer(timer):
+    # Returns the token to reset template_timers with
+    return template_timers.set((*template_timers.get(), timer))
+
+
+def profile_dir():
+    return getattr(settings, 'BLOG_PROFILING_DIR', os.path.join(settings.BASE_DIR, 'var', 'profiles'))
+
+
+def stack_path(name):
+    return os.path.join(profile_dir(), name)
+
+
+# Folded stacks
+
+# Frames are labelled with paths relative to these, longest first
+PATH_PREFIXES = sorted(
+    {os.path.join(str(path), '') for path in (settings.BASE_DIR, *sysconfig.get_paths().values())},
+    key=len, reverse=True,
+)
+
+
+def frame_label(code):
+    filename = code.co_filename
+    for prefix in PATH_PREFIXES:
+        if filename.startswith(prefix):
+            filename = filename[len(prefix):]
+            break
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """Counts the call stacks of one thread, read from a background thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.labels = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='blog-profiler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                if code not in self.labels:
+                    self.labels[code] = frame_label(code)
+                stack.append(self.labels[code])
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        # One "outer;...;inner count" line per distinct stack
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+# Templates
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        timers = template_timers.get()
+        if not timers:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            seconds = time.perf_counter() - started
+            for timer in timers:
+                timer(self.origin.template_name, seconds)
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend timing each template rendered while a timer is set."""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return ProfiledTemplate(template.template, self)
+
+
+# Requests
+
+class Profiler:
+    """Everything captured while one request is handled."""
+
+    def __init__(self, mode=None):
+        self.mode = mode or getattr(settings, 'BLOG_PROFILING_MODE', 'sample')
+        if self.mode not in MODES:
+            raise ValueError(f"BLOG_PROFILING_MODE must be one of {MODES}, not {self.mode!r}")
+        self.templates = []
+        self.duration = 0.0
+        self.queries = []
+        self._stack = ExitStack()
+
+    def __enter__(self):
+        # The budget middleware's recorder, when it runs, also holds the
+        # queries made before this point (session, user)
+        self.recorder = active_recorder.get()
+        if self.recorder is None:
+            self.recorder = self._stack.enter_context(QueryRecorder().record())
+        self._token = add_template_timer(lambda name, seconds: self.templates.append((name, seconds)))
+        if self.mode == 'cprofile':
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            interval = getattr(settings, 'BLOG_PROFILING_INTERVAL', 0.001)
+            self.sampler = StackSampler(threading.get_ident(), interval)
+            self.sampler.start()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration = time.perf_counter() - self.started
+        if self.mode == 'cprofile':
+            self.profiler.disable()
+        else:
+            self.sampler.stop()
+        template_timers.reset(self._token)
+        self.queries = list(self.recorder.queries)
+        self._stack.close()
+
+    def write_stacks(self):
+        """Save the stacks under profile_dir(); returns the file name."""
+        os.makedirs(profile_dir(), exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        if self.mode == 'cprofile':
+            name += '.prof'
+            self.profiler.dump_stats(stack_path(name))
+        else:
+            name += '.folded'
+            with open(stack_path(name), 'w', encoding='utf-8') as file:
+                file.write(self.sampler.folded())
+        return name
+
+    def save(self, request, response):
+        """Store the profile as a models.RequestProfile."""
+        queries = sorted(self.queries, key=lambda query: query[1], reverse=True)
+        user = getattr(request, 'user', None)
+        # Storing the profile isn't part of the request being measured
+        token = active_recorder.set(None)
+        try:
+            record = RequestProfile.objects.create(
+                method=request.method,
+                path=request.get_full_path()[:255],
+                status=response.status_code,
+                user_id=user.pk if user is not None and user.is_authenticated else None,
+                mode=self.mode,
+                duration_ms=self.duration * 1000,
+                query_count=len(self.queries),
+                sql_ms=sum(seconds for _, seconds in self.queries) * 1000,
+                template_ms=sum(seconds for _, seconds in self.templates) * 1000,
+                queries=[[sql, seconds * 1000] for sql, seconds in queries[:MAX_QUERIES]],
+                templates=[[name, seconds * 1000] for name, seconds in self.templates],
+                stack_file=self.write_stacks(),
+            )
+            prune_profiles()
+        finally:
+            active_recorder.reset(token)
+        return record
+
+
+def prune_profiles():
+    # Keep the newest BLOG_PROFILING_KEEP profiles; signals remove the files
+    keep = getattr(settings, 'BLOG_PROFILING_KEEP', 200)
+    stale = RequestProfile.objects.order_by('-created_at', '-id').values_list('pk', flat=True)[keep:]
+    if stale:
+        RequestProfile.objects.filter(pk__in=list(stale)).delete()
+
+
+def profile_requested(request):
+    # Cheap checks only: the user is loaded just when a flag is present
+    return PROFILE_HEADER in request.headers or PROFILE_PARAM in request.GET
+
+
+def sampled():
+    rate = getattr(settings, 'BLOG_PROFILING_SAMPLE_RATE', 0.0)
+    return rate > 0 and random.random() < rate
+
+
+class ProfilingMiddleware:
+    # Middleware profiling requests on demand; must come after AuthenticationMiddleware.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not ((profile_requested(request) and request.user.is_staff) or sampled()):
+            return self.get_response(request)
+        with Profiler() as profile:
+            response = self.get_response(request)
+        profile.save(request, response)
+        return response
+
+    async def __acall__(self, request):
+        if not ((profile_requested(request) and (await request.auser()).is_staff) or sampled()):
+            return await self.get_response(request)
+        with Profiler() as profile:
+            response = await self.get_response(request)
+        await sync_to_async(profile.save)(request, response)
+        return response
@@ -0,0 +1,365 @@
+"""
+related.py
+
+Content-similarity "related posts":
+- Builds TF-IDF vectors over the title and content of published posts
+- Finds each post's top-k cosine neighbours with blocked NumPy matrix products
+- Stores them in RelatedPost and keeps the vectors on disk, so a single saved
+  or (un)published post can be refreshed without a full rebuild: its row of
+  the vector and id files is rewritten in place (unpublished posts leave a
+  zeroed row, with id 0, until the next rebuild)
+- The vocabulary and IDF weights are fitted by rebuilds only, so a refresh
+  rebuilds everything instead once the index has REFIT_GROWTH times as many
+  rows as the posts it was fitted on, or when most of the post's words are
+  new to it (MAX_UNKNOWN_SHARE)
+"""
+
+import math
+import os
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .caching import invalidate_tags
+from .models import Post, RelatedPost
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+TOP_K = 5
+MAX_FEATURES = 50000
+# Vocabularies larger than this are randomly projected down to it, which
+# preserves cosine similarity closely and keeps 100k posts in ~100 MB.
+DIMENSIONS = 256
+# Rows per similarity block, sized so a block product stays around 128 MB
+BLOCK_CELLS = 2 ** 25
+CHUNK_SIZE = 2000
+SEED = 20250722
+# When a refresh rebuilds the index instead, see refresh_post()
+REFIT_GROWTH = 2
+MAX_UNKNOWN_SHARE = 0.5
+
+TOKEN_RE = re.compile(r'[a-z0-9]{2,}')
+STOP_WORDS = frozenset(
+    'a an and are as at be but by for from has have he her his i in is it its of on or our '
+    'she that the their them they this to was we were what when which who will with you your'.split()
+)
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def document(title, content):
+    # The title counts twice: it is the most descriptive part of a post
+    return f'{title} {title} {content}'
+
+
+def index_path():
+    return getattr(settings, 'BLOG_RELATED_INDEX_PATH', os.path.join(settings.BASE_DIR, 'var', 'related_posts.npz'))
+
+
+def row_paths(path):
+    # Raw int64 ids and float32 vectors beside the vocabulary file, one row per post
+    base = os.path.splitext(path)[0]
+    return f'{base}.ids', f'{base}.vectors'
+
+
+class RelatedIndex:
+    """TF-IDF vocabulary plus the unit-length vectors of every published post."""
+
+    def __init__(self, terms, idf, ids, vectors, fitted=None):
+        self.terms = list(terms)
+        self.columns = {term: column for column, term in enumerate(self.terms)}
+        self.idf = idf.astype(np.float32)
+        self.ids = ids.astype(np.int64)
+        self.vectors = vectors.astype(np.float32)
+        self.dimensions = vectors.shape[1]
+        # Number of posts the vocabulary and IDF weights were fitted on
+        self.fitted = len(self.ids) if fitted is None else fitted
+        self._projection = None
+
+    # Building and vectorising
+
+    @classmethod
+    def build(cls, documents):
+        """Fit a vocabulary and vectorise every (id, text) from a re-iterable source."""
+        df = Counter()
+        count = 0
+        for _, text in documents():
+            df.update(set(tokenize(text)))
+            count += 1
+        terms = [term for term, _ in df.most_common(MAX_FEATURES)]
+        idf = np.array([math.log((1 + count) / (1 + df[term])) + 1 for term in terms], dtype=np.float32)
+        dimensions = max(1, min(len(terms), DIMENSIONS))
+        index = cls(terms, idf, np.empty(0, np.int64), np.empty((0, dimensions), np.float32), count)
+
+        ids, blocks, chunk = [], [], []
+        for item in documents():
+            chunk.append(item)
+            if len(chunk) == CHUNK_SIZE:
+                ids.extend(pk for pk, _ in chunk)
+                blocks.append(index.vectorize([text for _, text in chunk]))
+                chunk = []
+        if chunk:
+            ids.extend(pk for pk, _ in chunk)
+            blocks.append(index.vectorize([text for _, text in chunk]))
+        index.ids = np.array(ids, dtype=np.int64)
+        index.vectors = np.vstack(blocks) if blocks else index.vectors
+        return index
+
+    @property
+    def projection(self):
+        # None means the TF-IDF columns are used as they are
+        if self._projection is None and len(self.terms) > self.dimensions:
+            rng = np.random.default_rng(SEED)
+            self._projection = (
+                rng.standard_normal((len(self.terms), self.dimensions), dtype=np.float32) / math.sqrt(self.dimensions)
+            )
+        return self._projection
+
+    def vectorize(self, texts):
+        # Sparse sublinear TF-IDF rows, projected to dense unit vectors
+        rows, columns, weights = [], [], []
+        for row, text in enumerate(texts):
+            counts = Counter(self.columns[token] for token in tokenize(text) if token in self.columns)
+            rows.extend([row] * len(counts))
+            columns.extend(counts.keys())
+            weights.extend(1 + math.log(value) for value in counts.values())
+        out = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        if rows:
+            rows = np.array(rows, dtype=np.int64)
+            columns = np.array(columns, dtype=np.int64)
+            weights = np.array(weights, dtype=np.float32) * self.idf[columns]
+            if self.projection is None:
+                out[rows, columns] = weights
+            else:
+                # rows are sorted, so each document's terms form one run to sum
+                starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+                out[rows[starts]] = np.add.reduceat(weights[:, None] * self.projection[columns], starts)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+    def unknown_share(self, text):
+        # Share of a text's words missing from the vocabulary
+        tokens = tokenize(text)
+        return sum(token not in self.columns for token in tokens) / len(tokens) if tokens else 0.0
+
+    def needs_refit(self, text=None):
+        return (
+            len(self.ids) >= REFIT_GROWTH * self.fitted
+            or (text is not None and self.unknown_share(text) > MAX_UNKNOWN_SHARE)
+        )
+
+    # Similarity
+
+    def neighbours(self, queries, exclude, k=TOP_K):
+        """
+        Top-k neighbours for each query vector, as lists of (post id, score).
+
+        exclude holds, per query, the row of the post itself (or -1).
+        """
+        results = []
+        if not len(self.ids):
+            return [[] for _ in range(len(queries))]
+        k = min(k, len(self.ids))
+        block = max(1, BLOCK_CELLS // len(self.ids))
+        for start in range(0, len(queries), block):
+            scores = queries[start:start + block] @ self.vectors.T
+            excluded = np.asarray(exclude[start:start + block])
+            has_self = excluded >= 0
+            scores[np.flatnonzero(has_self), excluded[has_self]] = -np.inf
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k < scores.shape[1] else \
+                np.tile(np.arange(scores.shape[1]), (len(scores), 1))
+            for row, candidates in enumerate(top):
+                ranked = candidates[np.argsort(-scores[row, candidates], kind='stable')]
+                results.append([
+                    (int(self.ids[column]), float(scores[row, column]))
+                    for column in ranked if scores[row, column] > 0
+                ])
+        return results
+
+    def all_neighbours(self, k=TOP_K):
+        return dict(zip(self.ids.tolist(), self.neighbours(self.vectors, np.arange(len(self.ids)), k)))
+
+    # Incremental updates
+
+    def row_of(self, post_id):
+        rows = np.flatnonzero(self.ids == post_id)
+        return int(rows[0]) if len(rows) else -1
+
+    def upsert(self, post_id, vector):
+        # Returns the post's row, appended if it had none
+        row = self.row_of(post_id)
+        if row >= 0:
+            self.vectors[row] = vector
+        else:
+            row = len(self.ids)
+            self.ids = np.append(self.ids, post_id)
+            self.vectors = np.vstack([self.vectors, vector[None, :]])
+        return row
+
+    def remove(self, post_id):
+        # Zeroes the post's row, which then matches nothing; returns it (or -1)
+        row = self.row_of(post_id)
+        if row >= 0:
+            self.ids[row] = 0
+            self.vectors[row] = 0
+        return row
+
+    # Persistence
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        suffix = f'.{os.getpid()}.tmp'
+        for target, array in zip(row_paths(path), (self.ids, self.vectors)):
+            array.tofile(target + suffix)
+            os.replace(target + suffix, target)
+        np.savez(path + suffix + '.npz', terms=np.array(self.terms, dtype=str), idf=self.idf,
+                 fitted=self.fitted, dimensions=self.dimensions)
+        os.replace(path + suffix + '.npz', path)
+
+    def save_row(self, path, row):
+        # Write one row of the vector and id files in place (or append it).
+        # The vector goes first: load() ignores a vector without its id
+        ids_path, vectors_path = row_paths(path)
+        for target, array in ((vectors_path, self.vectors), (ids_path, self.ids)):
+            with open(target, 'r+b') as file:
+                file.seek(row * array[row].nbytes)
+                file.write(array[row].tobytes())
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            terms, idf, fitted, dimensions = data['terms'].tolist(), data['idf'], int(data['fitted']), int(data['dimensions'])
+        ids_path, vectors_path = row_paths(path)
+        vectors = np.fromfile(vectors_path, dtype=np.float32).reshape(-1, dimensions)
+        ids = np.fromfile(ids_path, dtype=np.int64)[:len(vectors)]
+        return cls(terms, idf, ids, vectors[:len(ids)], fitted)
+
+
+@contextmanager
+def index_lock():
+    # Serialise read-modify-write cycles on the index file between workers
+    path = index_path() + '.lock'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as handle:
+        if fcntl:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        yield
+
+
+def published_documents():
+    # Stream (id, text) pairs without holding every article in memory
+    rows = Post.objects.filter(is_published=True).order_by('id').values_list('id', 'title', 'content')
+    return ((pk, document(title, content)) for pk, title, content in rows.iterator(chunk_size=CHUNK_SIZE))
+
+
+def store_neighbours(neighbours):
+    # Replace the RelatedPost rows of the given posts; returns the post ids touched
+    with transaction.atomic():
+        RelatedPost.objects.filter(post_id__in=list(neighbours)).delete()
+        RelatedPost.objects.bulk_create(
+            (
+                RelatedPost(post_id=post_id, related_id=related_id, score=score, rank=rank)
+                for post_id, items in neighbours.items()
+                for rank, (related_id, score) in enumerate(items)
+            ),
+            batch_size=5000,
+        )
+    return set(neighbours)
+
+
+def rebuild(k=TOP_K):
+    """Recompute every published post's neighbours from scratch."""
+    with index_lock():
+        return _rebuild(k)
+
+
+def _rebuild(k):
+    index = RelatedIndex.build(published_documents)
+    neighbours = index.all_neighbours(k)
+    with transaction.atomic():
+        RelatedPost.objects.all().delete()
+        store_neighbours(neighbours)
+    index.save(index_path())
+    invalidate_tags(*(f'post:{pk}' for pk in neighbours))
+    return len(neighbours)
+
+
+def refresh_post(post_id, k=TOP_K):
+    """
+    Bring one post's neighbours, and the lists it enters or leaves, up to date.
+
+    Terms missing from the stored vocabulary are ignored and the IDF weights
+    are kept, unless the index needs refitting: then everything is rebuilt.
+    """
+    with index_lock():
+        path = index_path()
+        if not all(os.path.exists(name) for name in (path, *row_paths(path))):
+            _rebuild(k)
+            return
+        index = RelatedIndex.load(path)
+        post = Post.objects.filter(pk=post_id, is_published=True).values('title', 'content').first()
+        text = document(post['title'], post['content']) if post is not None else None
+        if index.needs_refit(text):
+            _rebuild(k)
+            return
+
+        old_row = index.row_of(post_id)
+        old_scores = index.vectors @ index.vectors[old_row] if old_row >= 0 else np.zeros(len(index.ids), np.float32)
+        if post is None:
+            changed = index.remove(post_id)
+            RelatedPost.objects.filter(post_id=post_id).delete()
+            new_scores = np.zeros(len(index.ids), np.float32)
+        else:
+            vector = index.vectorize([text])[0]
+            changed = index.upsert(post_id, vector)
+            if old_row < 0:
+                old_scores = np.append(old_scores, 0)
+            new_scores = index.vectors @ vector
+
+        # Posts whose list this post may enter or leave: it scores at least
+        # their current k-th neighbour, before or after the change.
+        floors = dict(
+            RelatedPost.objects.filter(rank=k - 1, post_id__in=index.ids.tolist()).values_list('post_id', 'score')
+        )
+        floor = np.array([floors.get(pk, 0.0) for pk in index.ids.tolist()], dtype=np.float32)
+        entering = (new_scores >= floor) & (new_scores > 0)
+        leaving = (old_scores >= floor) & (old_scores > 0)
+        affected = set(index.ids[entering | leaving].tolist())
+        affected |= set(RelatedPost.objects.filter(related_id=post_id).values_list('post_id', flat=True))
+        affected.discard(post_id)
+        affected.discard(0)
+        if post is not None:
+            affected.add(post_id)
+
+        rows = [index.row_of(pk) for pk in affected]
+        rows = [row for row in rows if row >= 0]
+        neighbours = dict(zip(index.ids[rows].tolist(), index.neighbours(index.vectors[rows], rows, k)))
+        with transaction.atomic():
+            RelatedPost.objects.filter(post_id__in=affected - set(neighbours)).delete()
+            store_neighbours(neighbours)
+        if changed >= 0:
+            index.save_row(path, changed)
+    invalidate_tags(*(f'post:{pk}' for pk in affected | {post_id}))
+
+
+def related_posts(post, count=3):
+    # Precomputed neighbours of a post, best match first
+    return related_posts_of(post.slug, count)
+
+
+def related_posts_of(slug, count=3):
+    # Same, by slug, so it can be queried alongside the post itself
+    return (
+        Post.objects.filter(related_from__post__slug=slug, is_published=True)
+        .only('id', 'title', 'slug', 'updated_at').order_by('related_from__rank')[:count]
+    )
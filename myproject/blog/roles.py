@@ -0,0 +1,204 @@
+"""
+roles.py
+
+Cached roles (group names and permissions) of the signed-in user:
+- get_roles() loads them once per request and keeps them in the session,
+  stamped with tag versions from the shared cache
+- Signals bump the versions when memberships or permissions change, so a
+  stale session copy is reloaded on the next request
+- role_required() and the perms context processor use the cached roles
+  instead of querying the auth tables; aget_roles() serves async views
+"""
+
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.core.exceptions import PermissionDenied
+from django.utils.functional import SimpleLazyObject
+
+from .caching import invalidate_tags, tag_versions
+
+SESSION_KEY = '_blog_roles'
+EDITORS = 'Editors'
+
+# Bumped for a single user, or for everyone (group permissions changed)
+ALL_USERS_TAG = 'roles'
+
+
+def user_tag(user_id):
+    return f'roles:user:{user_id}'
+
+
+class Roles:
+    """Group names and "app_label.codename" permissions of one user."""
+
+    def __init__(self, groups=(), perms=(), is_superuser=False):
+        self.groups = tuple(groups)
+        self.perms = frozenset(perms)
+        self.is_superuser = is_superuser
+
+    def has_perm(self, perm):
+        return self.is_superuser or perm in self.perms
+
+    def has_module_perms(self, app_label):
+        return self.is_superuser or any(perm.startswith(app_label + '.') for perm in self.perms)
+
+    def in_group(self, name):
+        return name in self.groups
+
+    @property
+    def is_editor(self):
+        return self.in_group(EDITORS)
+
+
+ANONYMOUS = Roles()
+
+
+def load_roles(user):
+    # Three queries at most: groups, then user and group permissions
+    is_superuser = user.is_active and user.is_superuser
+    groups = user.groups.order_by('name').values_list('name', flat=True)
+    perms = () if is_superuser else user.get_all_permissions()
+    return Roles(groups, perms, is_superuser)
+
+
+async def aload_roles(user):
+    is_superuser = user.is_active and user.is_superuser
+    groups = [name async for name in user.groups.order_by('name').values_list('name', flat=True)]
+    perms = () if is_superuser else await user.aget_all_permissions()
+    return Roles(groups, perms, is_superuser)
+
+
+def _session_roles(session, user):
+    """
+    (roles stored in the session or None, current versions).
+
+    Versions are read before any loading, so a change made meanwhile
+    leaves the stored copy stale instead of being lost.
+    """
+    versions = tag_versions([ALL_USERS_TAG, user_tag(user.pk)])
+    entry = session.get(SESSION_KEY)
+    if entry and entry['user'] == user.pk and entry['versions'] == versions:
+        return Roles(entry['groups'], entry['perms'], entry['superuser']), versions
+    return None, versions
+
+
+def _remember(session, user, versions, roles):
+    session[SESSION_KEY] = {
+        'user': user.pk,
+        'versions': versions,
+        'groups': list(roles.groups),
+        'perms': sorted(roles.perms),
+        'superuser': roles.is_superuser,
+    }
+
+
+def get_roles(request):
+    """Roles of request.user, loaded at most once per request and session."""
+    roles = getattr(request, '_roles', None)
+    if roles is not None:
+        return roles
+
+    user = request.user
+    session = getattr(request, 'session', None)
+    if not user.is_authenticated:
+        roles = ANONYMOUS
+    elif session is None:
+        roles = load_roles(user)
+    else:
+        roles, versions = _session_roles(session, user)
+        if roles is None:
+            roles = load_roles(user)
+            _remember(session, user, versions, roles)
+    request._roles = roles
+    return roles
+
+
+async def aget_roles(request):
+    # get_roles() for async views; auser() also loads the session
+    roles = getattr(request, '_roles', None)
+    if roles is not None:
+        return roles
+
+    user = await request.auser()
+    session = getattr(request, 'session', None)
+    if not user.is_authenticated:
+        roles = ANONYMOUS
+    elif session is None:
+        roles = await aload_roles(user)
+    else:
+        roles, versions = _session_roles(session, user)
+        if roles is None:
+            roles = await aload_roles(user)
+            _remember(session, user, versions, roles)
+    request._roles = roles
+    return roles
+
+
+def invalidate_roles(user_ids=None):
+    # Roles of the given users, or of everyone, are reloaded on their next request
+    if user_ids is None:
+        invalidate_tags(ALL_USERS_TAG)
+    elif user_ids:
+        invalidate_tags(*(user_tag(pk) for pk in user_ids))
+
+
+def role_required(perm):
+    """Like permission_required(perm, raise_exception=True), using the cached roles."""
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                if not (await aget_roles(request)).has_perm(perm):
+                    raise PermissionDenied
+                return await view_func(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not get_roles(request).has_perm(perm):
+                raise PermissionDenied
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Template context
+
+class AppPerms:
+    # perms.<app_label>: truthy when the user has any permission of the app
+
+    def __init__(self, roles, app_label):
+        self.roles = roles
+        self.app_label = app_label
+
+    def __getitem__(self, codename):
+        return self.roles.has_perm(f'{self.app_label}.{codename}')
+
+    def __bool__(self):
+        return self.roles.has_module_perms(self.app_label)
+
+
+class RolePerms:
+    # Drop-in for the auth context processor's PermWrapper
+
+    def __init__(self, roles):
+        self.roles = roles
+
+    def __getitem__(self, app_label):
+        return AppPerms(self.roles, app_label)
+
+    def __iter__(self):
+        # Stops the template engine from treating this as a list
+        raise TypeError('RolePerms is not iterable.')
+
+    def __contains__(self, perm):
+        if '.' not in perm:
+            return bool(self[perm])
+        return self.roles.has_perm(perm)
+
+
+def roles_context(request):
+    # Context processor overriding the auth processor's perms; must come after it
+    roles = SimpleLazyObject(lambda: get_roles(request))
+    return {'roles': roles, 'perms': RolePerms(roles)}
@@ -0,0 +1,212 @@
+"""
+search.py
+
+Full-text search over published blog posts:
+- SQLite backend keeps an FTS5 index (blog_post_fts) in sync with Post rows
+- Simple backend falls back to plain filters on databases without FTS5,
+  including SQLite builds compiled without it
+- SearchResults exposes ranked results lazily so they work with Paginator
+"""
+
+import re
+import sqlite3
+from functools import cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Post
+
+FTS_TABLE = 'blog_post_fts'
+
+# Only plain word characters reach the index; FTS5 operators are never
+# taken from user input.
+TERM_RE = re.compile(r'\w+')
+MAX_TERMS = 10
+
+
+def parse_terms(query):
+    # Split a raw search string into lower-cased search terms.
+    return TERM_RE.findall((query or '').lower())[:MAX_TERMS]
+
+
+class SearchResults:
+    """Lazy, sliceable result set for a search, usable with Paginator."""
+
+    def __init__(self, backend, terms):
+        self.backend = backend
+        self.terms = terms
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.terms) if self.terms else 0
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        stop = self.count() if key.stop is None else key.stop
+        if not self.terms or stop <= start:
+            return []
+        return self.backend.fetch(self.terms, start, stop - start)
+
+
+class BaseSearchBackend:
+    """Interface shared by all search backends."""
+
+    def search(self, query):
+        return SearchResults(self, parse_terms(query))
+
+    def count(self, terms):
+        raise NotImplementedError
+
+    def fetch(self, terms, offset, limit):
+        raise NotImplementedError
+
+    # Index maintenance hooks, called from signals and management commands.
+    def index_post(self, post_id):
+        pass
+
+    def index_posts(self, post_ids):
+        # Posts created in bulk, which bypasses the save signals
+        for post_id in post_ids:
+            self.index_post(post_id)
+
+    def remove_post(self, post_id):
+        pass
+
+    def index_category(self, category_id):
+        pass
+
+    def rebuild(self):
+        return Post.objects.filter(is_published=True).count()
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Unindexed search for databases without a full-text engine."""
+
+    def _queryset(self, terms):
+        queryset = Post.objects.filter(is_published=True)
+        for term in terms:
+            queryset = queryset.filter(
+                Q(title__icontains=term) | Q(content__icontains=term) | Q(category__name__icontains=term)
+            )
+        return queryset.order_by('-create_at', '-id')
+
+    def count(self, terms):
+        return self._queryset(terms).count()
+
+    def fetch(self, terms, offset, limit):
+        return list(self._queryset(terms).select_related('category', 'user').defer('content')[offset:offset + limit])
+
+
+class SqliteFTSBackend(BaseSearchBackend):
+    """FTS5 backed search; the index rowid is the Post primary key."""
+
+    # Column weights for bm25(): title, content, category.
+    weights = (10.0, 1.0, 5.0)
+
+    insert_sql = (
+        f'INSERT INTO {FTS_TABLE}(rowid, title, content, category) '
+        'SELECT p.id, p.title, p.content, COALESCE(c.name, \'\') '
+        'FROM blog_post p LEFT JOIN blog_category c ON c.id = p.category_id '
+        'WHERE p.is_published'
+    )
+
+    def _match(self, terms):
+        # Every term must match; the last one is treated as a prefix so
+        # partially typed words still find results.
+        phrases = ['"%s"' % term for term in terms]
+        phrases[-1] += '*'
+        return ' '.join(phrases)
+
+    def count(self, terms):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                [self._match(terms)],
+            )
+            return cursor.fetchone()[0]
+
+    def fetch(self, terms, offset, limit):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, %s, %s, %s) LIMIT %s OFFSET %s',
+                [self._match(terms), *self.weights, limit, offset],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        posts = Post.objects.select_related('category', 'user').defer('content').filter(is_published=True).in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+    def index_post(self, post_id):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+            cursor.execute(self.insert_sql + ' AND p.id = %s', [post_id])
+
+    def index_posts(self, post_ids):
+        if not post_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', post_ids)
+            cursor.execute(f'{self.insert_sql} AND p.id IN ({placeholders})', post_ids)
+
+    def remove_post(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+    def index_category(self, category_id):
+        # Re-index the posts of a renamed (or deleted, category_id=None) category.
+        condition = 'category_id IS NULL' if category_id is None else 'category_id = %s'
+        params = [] if category_id is None else [category_id]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT id FROM blog_post WHERE {condition})',
+                params,
+            )
+            cursor.execute(f'{self.insert_sql} AND p.{condition}', params)
+
+    def rebuild(self):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(self.insert_sql)
+            indexed = cursor.rowcount
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        return indexed
+
+
+# Default backend per database vendor; override with settings.BLOG_SEARCH_BACKEND.
+VENDOR_BACKENDS = {
+    'sqlite': SqliteFTSBackend,
+}
+
+
+@cache
+def sqlite_has_fts5():
+    # Asked of the SQLite library Django's backend is built on, once per
+    # process, outside any request's queries
+    with sqlite3.connect(':memory:') as probe:
+        return bool(probe.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')").fetchone()[0])
+
+
+def get_backend():
+    # Return the configured search backend for the default database.
+    backend_path = getattr(settings, 'BLOG_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    if connection.vendor == 'sqlite' and not sqlite_has_fts5():
+        return SimpleSearchBackend()
+    return VENDOR_BACKENDS.get(connection.vendor, SimpleSearchBackend)()
+
+
+def search_posts(query):
+    # Ranked search results for a raw query string.
+    return get_backend().search(query)
@@ -0,0 +1,163 @@
+"""
+sessions.py
+
+Session engine (SESSION_ENGINE = 'blog.sessions') built on cached_db:
+- Sessions live in the database, with a copy in SESSION_CACHE_ALIAS (the
+  file-based 'sessions' cache, shared by every worker process)
+- Each process keeps the anonymous sessions it served last in a small LRU
+  front, so a session seen within BLOG_SESSION_LRU_TTL seconds skips even
+  the cache read; a change made by another worker shows up here after at
+  most that long. Signed-in sessions are always read from the shared cache,
+  so logging out or revoking a session takes effect on every worker at once
+- A session is written only when its data differs from what was loaded:
+  setting a key to the value it already has doesn't cost a database write
+- Expired sessions are deleted in short batches (clear_expired_sessions),
+  so the cleanup never holds SQLite's write lock for long
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.utils import timezone
+
+
+class SessionLRU:
+    """Serialized session data per session key, for a few seconds."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, state):
+        ttl = getattr(settings, 'BLOG_SESSION_LRU_TTL', 5.0)
+        size = getattr(settings, 'BLOG_SESSION_LRU_SIZE', 1000)
+        if ttl <= 0 or size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (state, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > size:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+lru = SessionLRU()
+
+
+def delete_expired(batch_size=1000, pause=0.0):
+    """Delete expired sessions, batch_size rows per transaction; returns how many."""
+    model = SessionStore.get_model_class()
+    now = timezone.now()
+    deleted = 0
+    while True:
+        keys = list(model.objects.filter(expire_date__lt=now).values_list('pk', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        deleted += model.objects.filter(pk__in=keys).delete()[0]
+        if pause:
+            # Let waiting writers in between batches
+            time.sleep(pause)
+
+
+class SessionStore(CachedDBStore):
+
+    def _state(self, data):
+        # What the session holds, comparable between load and save
+        return self.serializer().dumps(data)
+
+    def _loaded(self, data):
+        self._saved_state = self._state(data)
+        if self.session_key:
+            if data and SESSION_KEY not in data:
+                lru.put(self.session_key, self._saved_state)
+            else:
+                lru.discard(self.session_key)
+        return data
+
+    def _cached(self):
+        state = lru.get(self.session_key) if self.session_key else None
+        if state is None:
+            return None
+        self._saved_state = state
+        return self.serializer().loads(state)
+
+    def _unchanged(self, must_create):
+        if must_create or self.session_key is None:
+            return False
+        return self._state(self._get_session()) == getattr(self, '_saved_state', None)
+
+    def load(self):
+        data = self._cached()
+        return data if data is not None else self._loaded(super().load())
+
+    async def aload(self):
+        data = self._cached()
+        return data if data is not None else self._loaded(await super().aload())
+
+    def save(self, must_create=False):
+        if self._unchanged(must_create):
+            return
+        super().save(must_create)
+        self._loaded(self._get_session(no_load=True))
+
+    async def asave(self, must_create=False):
+        if self._unchanged(must_create):
+            return
+        await super().asave(must_create)
+        self._loaded(self._get_session(no_load=True))
+
+    def cycle_key(self):
+        # As in the signed_cookies backend: the new key is made when the
+        # session is saved at the end of the request, so logging in costs
+        # one INSERT instead of an INSERT and an UPDATE
+        data = self._session
+        key = self.session_key
+        self._session_key = None
+        self._session_cache = data
+        self.modified = True
+        if key:
+            self.delete(key)
+
+    async def acycle_key(self):
+        data = await self._aget_session()
+        key = self.session_key
+        self._session_key = None
+        self._session_cache = data
+        self.modified = True
+        if key:
+            await self.adelete(key)
+
+    def delete(self, session_key=None):
+        lru.discard(session_key or self.session_key)
+        super().delete(session_key)
+
+    async def adelete(self, session_key=None):
+        lru.discard(session_key or self.session_key)
+        await super().adelete(session_key)
+
+    @classmethod
+    def clear_expired(cls):
+        # Also used by Django's clearsessions command
+        delete_expired()
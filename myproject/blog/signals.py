@@ -1,4 +1,13 @@
+import os
+
 from django.contrib.auth.models import Group,Permission
+from blog.search import get_backend
+from blog.jobs import queue_post_renditions,queue_related_posts
+from blog.models import IMAGE_PENDING,Post
+from blog.caching import invalidate_tags,post_tags
+from blog.categories import adjust_counts,count_changes
+from blog.roles import invalidate_roles
+from blog.profiling import stack_path
 
 # Signal to create groups and permissions for the blog app
 def create_groups_permissions(sender, **kwargs):
@@ -38,4 +47,85 @@ def create_groups_permissions(sender, **kwargs):
         print("Groups and permissions created Successfully")
 
     except Exception as E:
-        print( f"An error occurred: {E}")
\ No newline at end of file
+        print( f"An error occurred: {E}")
+
+# Signals to keep the full-text search index in sync with published posts
+def update_post_search_index(sender, instance, **kwargs):
+    get_backend().index_post(instance.pk)
+
+def remove_post_search_index(sender, instance, **kwargs):
+    get_backend().remove_post(instance.pk)
+
+def update_category_search_index(sender, instance, **kwargs):
+    get_backend().index_category(instance.pk)
+
+def remove_category_search_index(sender, instance, **kwargs):
+    # Posts of a deleted category have had their category set to NULL
+    get_backend().index_category(None)
+
+
+# Signal to hand newly uploaded post images to the background worker
+def queue_image_renditions(sender, instance, **kwargs):
+    if instance.image_status == IMAGE_PENDING:
+        queue_post_renditions(instance)
+
+
+# Signals to invalidate cached pages showing a post or category
+def remember_post_state(sender, instance, **kwargs):
+    # Keep the stored category/publish state so post_save can tell what changed
+    instance._previous_state = None
+    if instance.pk:
+        instance._previous_state = Post.objects.filter(pk=instance.pk).values('category_id','is_published').first()
+
+def invalidate_post_pages(sender, instance, **kwargs):
+    tags = post_tags(instance.pk, instance.category_id, instance.is_published)
+    previous = getattr(instance, '_previous_state', None)
+    if previous:
+        tags |= post_tags(instance.pk, previous['category_id'], previous['is_published'])
+    invalidate_tags(*tags)
+
+def invalidate_category_pages(sender, instance, **kwargs):
+    invalidate_tags('listing', f'category:{instance.pk}')
+
+
+# Signals to keep the categories' published post counts
+def update_category_counts(sender, instance, **kwargs):
+    current = {'category_id': instance.category_id, 'is_published': instance.is_published}
+    adjust_counts(count_changes(getattr(instance, '_previous_state', None), current))
+
+def remove_category_counts(sender, instance, **kwargs):
+    previous = {'category_id': instance.category_id, 'is_published': instance.is_published}
+    adjust_counts(count_changes(previous, None))
+
+
+# Signal to refresh the precomputed related posts of a changed post
+def queue_related_posts_refresh(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_state', None)
+    if instance.is_published or (previous and previous['is_published']):
+        queue_related_posts(instance.pk)
+
+# Signals to reload cached roles when memberships or permissions change
+def invalidate_member_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    # User.groups / User.user_permissions, changed from either side
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_roles([instance.pk])
+    else:
+        # Clearing a group's members comes without their ids
+        invalidate_roles(pk_set)
+
+def invalidate_group_roles(sender, **kwargs):
+    # Group permissions changed or a group was deleted
+    if kwargs.get('action', 'post_').startswith('post_'):
+        invalidate_roles()
+
+def invalidate_user_roles(sender, instance, update_fields=None, **kwargs):
+    # is_active / is_superuser may have changed; logins only touch last_login
+    if update_fields is None or set(update_fields) - {'last_login'}:
+        invalidate_roles([instance.pk])
+
+# Signal to remove a deleted request profile's stacks file
+def remove_profile_stacks(sender, instance, **kwargs):
+    if instance.stack_file and os.path.exists(stack_path(instance.stack_file)):
+        os.remove(stack_path(instance.stack_file))
@@ -0,0 +1,58 @@
+"""
+blog_tags.py
+
+Template tags of the blog:
+- {% post_card post "variant" %} renders a post's card (or related-posts
+  link) from blog/includes/post_card.html and keeps the HTML in the
+  'fragments' cache, so a listing page is mostly assembled from cached cards
+- Keys hold the post's updated_at, which every edit, publish and image job
+  bumps, and the names of the related objects the variant shows: changed
+  posts get new keys and their old cards expire, nothing is deleted
+"""
+
+import hashlib
+
+from django import template
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from ..caching import fragment_cache, fragment_timeout
+
+register = template.Library()
+
+CARD_TEMPLATE = 'blog/includes/post_card.html'
+KEY_PREFIX = 'blog:card:'
+
+# variant: (template options, related objects shown on the card)
+VARIANTS = {
+    'listing': ({'words': 10}, ('category',)),
+    'dashboard': ({'words': 4, 'dashboard': True}, ('category',)),
+    # Dashboard of users who can publish: publish/hide button and author
+    'dashboard_editor': ({'words': 4, 'dashboard': True, 'editor': True}, ('category', 'user')),
+    'link': ({'link': True}, ()),
+}
+
+
+def card_key(post, variant):
+    related = VARIANTS[variant][1]
+    names = hashlib.md5('\n'.join(str(getattr(post, field)) for field in related).encode(), usedforsecurity=False).hexdigest()
+    return f'{KEY_PREFIX}{variant}:{post.pk}:{post.updated_at.timestamp()}:{names}'
+
+
+def render_card(post, variant):
+    options = VARIANTS[variant][0]
+    return get_template(CARD_TEMPLATE).render({'post': post, **options})
+
+
+@register.simple_tag
+def post_card(post, variant='listing'):
+    """The cached HTML of the post's card in the given variant."""
+    if variant not in VARIANTS:
+        raise template.TemplateSyntaxError(f"post_card variant must be one of {sorted(VARIANTS)}, not {variant!r}")
+    cache = fragment_cache()
+    key = card_key(post, variant)
+    html = cache.get(key)
+    if html is None:
+        html = render_card(post, variant)
+        cache.set(key, html, fragment_timeout())
+    return mark_safe(html)
@@ -1,3 +1,1569 @@
-from django.test import TestCase
+import io
+import json
+import os
+import pstats
+import re
+import shutil
+import smtplib
+import tempfile
+import threading
+import time
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from PIL import Image
+
+from django.contrib.auth.models import Group, User
+from django.core import mail
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import get_connection
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.http import HttpResponse
+from django.test import AsyncClient, Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.client import ClientHandler
+from django.test.utils import CaptureQueriesContext
+from django.urls import ResolverMatch, reverse
+from django.utils import timezone
+
+from . import caching, db, feeds, jobs, metrics, outbox, popularity, profiling, related, sessions, transfer, urls, views
+from .models import Category, Job, OutboxEmail, Post, RelatedPost, RequestProfile, unique_slugs
+from .forms import PostForm
+from .instrumentation import QueryBudgetExceeded, QueryBudgetMiddleware, query_budget
+from .pagination import CursorPaginator
+from .search import SimpleSearchBackend, SqliteFTSBackend, get_backend, search_posts
+from .templatetags import blog_tags
+from myproject import wsgi
+
+
+class BlogTestMixin:
+    """Starts every test with empty caches (the file-based ones in the test runner's directory)."""
+
+    def setUp(self):
+        super().setUp()
+        for cache in caches.all():
+            cache.clear()
+        sessions.lru.clear()
+        # Views counted by a test are never flushed, least of all at exit
+        popularity.buffer.take()
+        self.addCleanup(popularity.buffer.take)
+        # The replica mirrors default in tests, but as a second connection it
+        # can't see a TestCase's uncommitted data; read-only views stay on
+        # default, unless the test case asks for the replica database
+        if db.READ_ALIAS not in self.databases:
+            self.enterContext(mock.patch.object(db, 'READ_ALIAS', DEFAULT_DB_ALIAS))
+
+
+class BlogTestCase(BlogTestMixin, TestCase):
+    pass
+
+
+class SearchTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Travel')
+        cls.alps = Post.objects.create(
+            title='Hiking the Alps', content='Mountain trails and alpine lakes.',
+            category=cls.category, is_published=True, img_url='https://example.com/a.jpg',
+        )
+        cls.draft = Post.objects.create(
+            title='Alps draft', content='Unpublished notes about mountain huts.',
+            category=cls.category, img_url='https://example.com/b.jpg',
+        )
+
+    def test_only_published_posts_are_found(self):
+        self.assertEqual(list(search_posts('mountain')[:10]), [self.alps])
+
+    def test_index_follows_publish_toggle_and_delete(self):
+        self.draft.is_published = True
+        self.draft.save()
+        self.assertEqual(search_posts('huts').count(), 1)
+        self.draft.delete()
+        self.assertEqual(search_posts('huts').count(), 0)
+
+    def test_category_rename_is_reindexed(self):
+        self.category.name = 'Adventure'
+        self.category.save()
+        self.assertEqual(list(search_posts('adventure')[:10]), [self.alps])
+
+    def test_title_matches_rank_first(self):
+        other = Post.objects.create(
+            title='City breaks', content='Nothing like the alps for a weekend away.',
+            category=self.category, is_published=True, img_url='https://example.com/c.jpg',
+        )
+        self.assertEqual(list(search_posts('alps')[:10]), [self.alps, other])
+
+    def test_operators_in_query_are_ignored(self):
+        self.assertEqual(search_posts('"alp* (').count(), 1)
+        self.assertEqual(search_posts('  ').count(), 0)
+
+    def test_sqlite_without_fts5_uses_simple_backend(self):
+        self.assertIsInstance(get_backend(), SqliteFTSBackend)
+        with mock.patch('blog.search.sqlite_has_fts5', return_value=False):
+            self.assertIsInstance(get_backend(), SimpleSearchBackend)
+            self.assertEqual(list(search_posts('mountain')[:10]), [self.alps])
+
+    def test_search_view_is_public(self):
+        response = self.client.get(reverse('blog:search'), {'q': 'hiking'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Hiking the Alps')
+
+
+class CursorPaginationTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Identical timestamps force the id tie-breaker to be used.
+        cls.posts = [
+            Post.objects.create(
+                title=f'Post {i}', content='Body', is_published=True, img_url='https://example.com/p.jpg',
+            )
+            for i in range(12)
+        ]
+        Post.objects.update(create_at=cls.posts[0].create_at)
+        cls.newest_first = sorted(cls.posts, key=lambda post: post.pk, reverse=True)
+
+    def test_walks_forward_and_back_without_gaps(self):
+        paginator = CursorPaginator(Post.objects.all(), 5)
+        pages = [paginator.get_page(None)]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        self.assertEqual([post for page in pages for post in page], self.newest_first)
+        self.assertEqual([page.number for page in pages], [1, 2, 3])
+
+        previous = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual(list(previous), list(pages[1]))
+        self.assertEqual(previous.number, 2)
+        first = paginator.get_page(previous.previous_cursor)
+        self.assertEqual(list(first), list(pages[0]))
+        self.assertFalse(first.has_previous())
+
+    def test_garbled_cursor_returns_first_page(self):
+        page = CursorPaginator(Post.objects.all(), 5).get_page('not-a-cursor')
+        self.assertEqual(page.number, 1)
+        self.assertEqual(list(page), self.newest_first[:5])
+
+    def test_total_is_cached(self):
+        paginator = CursorPaginator(Post.objects.all(), 5, count_cache_key='test:post-count')
+        self.assertEqual(paginator.num_pages, 3)
+        Post.objects.all().delete()
+        self.assertEqual(CursorPaginator(Post.objects.all(), 5, count_cache_key='test:post-count').num_pages, 3)
+
+    def test_tagged_total_is_recounted_when_listing_changes(self):
+        def num_pages():
+            published = Post.objects.filter(is_published=True)
+            return CursorPaginator(published, 5, count_cache_key='test:post-count:', count_tags=['listing']).num_pages
+        self.assertEqual(num_pages(), 3)
+        # A bulk update sends no signals, so nothing invalidates the tag yet
+        Post.objects.filter(pk__in=[post.pk for post in self.posts[:3]]).update(is_published=False)
+        self.assertEqual(num_pages(), 3)
+        caching.invalidate_tags('listing')
+        self.assertEqual(num_pages(), 2)
+
+    def test_index_links_to_next_cursor(self):
+        response = self.client.get(reverse('blog:index'))
+        self.assertContains(response, '?cursor=' + response.context['post_list'].next_cursor)
+        self.assertContains(response, 'Page 1 of 3.')
+
+    def test_index_total_follows_published_posts(self):
+        self.assertContains(self.client.get(reverse('blog:index')), 'Page 1 of 3.')
+        for i in range(4):
+            Post.objects.create(title=f'New {i}', content='Body', is_published=True, img_url='https://example.com/p.jpg')
+        self.assertContains(self.client.get(reverse('blog:index')), 'Page 1 of 4.')
+
+
+class QueryPlanTests(BlogTestCase):
+    """Every query a listing view runs against blog_post must be served by an index."""
+
+    # A bare "SCAN blog_post" is a full table scan; "SCAN ... USING INDEX" is not.
+    TABLE_SCAN_RE = re.compile(r'\bSCAN blog_post\b(?! USING)')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='password123')
+        cls.author.groups.add(Group.objects.get(name='Authors'))
+        cls.editor = User.objects.create_user('editor', password='password123')
+        cls.editor.groups.add(Group.objects.get(name='Editors'))
+        category = Category.objects.create(name='Travel')
+        for i in range(12):
+            cls.post = Post.objects.create(
+                title=f'Post {i}', content='Body', category=category, user=cls.author,
+                is_published=i % 2 == 0, img_url='https://example.com/p.jpg',
+            )
+
+    def assertIndexedQueries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        post_queries = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT') and re.search(r'FROM "blog_post"', query['sql'])
+        ]
+        self.assertTrue(post_queries, f'{url} ran no post queries')
+        with connection.cursor() as cursor:
+            for sql in post_queries:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = '\n'.join(row[-1] for row in cursor.fetchall())
+                with self.subTest(url=url, sql=sql):
+                    self.assertNotRegex(plan, self.TABLE_SCAN_RE)
+                    self.assertNotIn('TEMP B-TREE', plan)
+        return response
+
+    def test_index(self):
+        next_cursor = self.assertIndexedQueries(reverse('blog:index')).context['post_list'].next_cursor
+        self.assertIsNotNone(next_cursor)
+        self.assertIndexedQueries(reverse('blog:index') + f'?cursor={next_cursor}')
+
+    def test_details(self):
+        self.client.force_login(self.author)
+        self.assertIndexedQueries(self.post.get_absolute_url())
+
+    def test_category(self):
+        url = self.post.category.get_absolute_url()
+        next_cursor = self.assertIndexedQueries(url).context['post_list'].next_cursor
+        self.assertIsNotNone(next_cursor)
+        self.assertIndexedQueries(url + f'?cursor={next_cursor}')
+
+    def test_author_dashboard(self):
+        self.client.force_login(self.author)
+        self.assertIndexedQueries(reverse('blog:dashboard'))
+
+    def test_editor_dashboard(self):
+        self.client.force_login(self.editor)
+        self.assertIndexedQueries(reverse('blog:dashboard'))
+
+
+class ImageRenditionTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.category = Category.objects.create(name='Travel')
+
+    def upload(self, size=(2400, 1600), name='photo.jpg'):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 80, 40)).save(buffer, 'JPEG', quality=95)
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def save_form(self, upload):
+        form = PostForm(
+            {'title': 'A photo story', 'content': 'Twenty characters or more.', 'category': self.category.pk},
+            {'img_url': upload},
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        post = form.save()
+        self.assertEqual(post.image_status, 'pending')
+        call_command('run_worker', once=True, processes=0, stdout=io.StringIO())
+        post.refresh_from_db()
+        return post
+
+    def test_upload_builds_jpeg_and_webp_renditions(self):
+        post = self.save_form(self.upload())
+        self.assertEqual(post.image_status, 'ready')
+        self.assertEqual(
+            {name: item['width'] for name, item in post.img_renditions.items()},
+            {'thumbnail': 160, 'card': 320, 'hero': 1200},
+        )
+        for item in post.img_renditions.values():
+            self.assertTrue(default_storage.exists(item['jpeg']))
+            with default_storage.open(item['webp']) as webp:
+                self.assertEqual(Image.open(webp).format, 'WEBP')
+        self.assertEqual(post.card_url, default_storage.url(post.img_renditions['card']['jpeg']))
+        self.assertIn(' 1200w', post.srcset)
+        self.assertTrue(post.webp_srcset.endswith('.webp 1200w'))
+
+    def test_small_image_is_not_upscaled(self):
+        post = self.save_form(self.upload(size=(200, 100)))
+        self.assertEqual({item['width'] for item in post.img_renditions.values()}, {160})
+        self.assertEqual(post.hero_url, post.formatted_url)
+
+    def test_backfill_command(self):
+        post = Post.objects.create(title='Old post', content='Body', img_url=default_storage.save('old.jpg', self.upload()))
+        call_command('build_image_renditions', stdout=io.StringIO())
+        post.refresh_from_db()
+        self.assertEqual(set(post.img_renditions), {'thumbnail', 'card', 'hero'})
+
+
+class JobQueueTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        jobs.register('test_job')(self.handler)
+        self.addCleanup(jobs.HANDLERS.pop, 'test_job')
+
+    def handler(self, fail=False):
+        self.calls.append(fail)
+        if fail:
+            raise RuntimeError('boom')
+
+    def run_worker(self):
+        call_command('run_worker', once=True, processes=0, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_enqueue_is_idempotent(self):
+        first = jobs.enqueue('test_job', 'same-key')
+        second = jobs.enqueue('test_job', 'same-key')
+        self.assertEqual(first.pk, second.pk)
+        self.run_worker()
+        jobs.enqueue('test_job', 'same-key')
+        self.run_worker()
+        self.assertEqual(self.calls, [False])
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_failures_back_off_then_give_up(self):
+        jobs.enqueue('test_job', 'failing', {'fail': True}, max_attempts=2)
+        self.run_worker()
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertGreater(job.run_after, job.updated_at)
+
+        # not due yet: the backoff keeps it out of the next poll
+        self.run_worker()
+        self.assertEqual(len(self.calls), 1)
+
+        Job.objects.update(run_after=job.created_at)
+        self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+        # re-enqueueing a dead job retries it from scratch
+        jobs.enqueue('test_job', 'failing', {'fail': True})
+        self.assertEqual(Job.objects.get().status, Job.PENDING)
+
+
+class PageCacheTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Travel')
+        cls.other_category = Category.objects.create(name='Food')
+        cls.post = Post.objects.create(
+            title='Hiking the Alps', content='Mountain trails.', category=cls.category,
+            is_published=True, img_url='https://example.com/a.jpg',
+        )
+        cls.draft = Post.objects.create(
+            title='Street food', content='Draft.', category=cls.other_category, img_url='https://example.com/b.jpg',
+        )
+
+    def get_index(self):
+        return self.client.get(reverse('blog:index'))
+
+    def test_anonymous_index_is_served_from_cache(self):
+        self.assertEqual(self.get_index()['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.get_index()
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Hiking the Alps')
+
+    def test_post_changes_invalidate_listing(self):
+        self.get_index()
+        self.post.title = 'Hiking the Dolomites'
+        self.post.save()
+        response = self.get_index()
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Hiking the Dolomites')
+
+        self.post.delete()
+        self.assertNotContains(self.get_index(), 'Hiking the Dolomites')
+
+    def test_unrelated_changes_keep_listing_cached(self):
+        self.get_index()
+        self.draft.title = 'Street food notes'
+        self.draft.save()
+        self.assertEqual(self.get_index()['X-Page-Cache'], 'hit')
+
+        # publishing the draft changes what the listing shows
+        self.draft.is_published = True
+        self.draft.save()
+        self.assertContains(self.get_index(), 'Street food notes')
+
+    def test_concurrent_refill_serves_stale_copy(self):
+        self.get_index()
+        self.post.title = 'Hiking the Dolomites'
+        self.post.save()
+        # simulate another request holding the refill lock
+        key = caching._page_key(self.client.get(reverse('blog:index')).wsgi_request) + ':lock'
+        caching.page_cache().add(key, 1, 30)
+        self.post.title = 'Hiking the Pyrenees'
+        self.post.save()
+        response = self.get_index()
+        self.assertEqual(response['X-Page-Cache'], 'stale')
+        self.assertContains(response, 'Hiking the Dolomites')
+
+    def test_logged_in_users_bypass_cache(self):
+        self.get_index()
+        self.client.force_login(User.objects.create_user('reader', password='password123'))
+        self.assertNotIn('X-Page-Cache', self.get_index())
+
+
+class RelatedPostsTests(BlogTestCase):
+
+    TOPICS = {
+        'python': 'python django orm queryset migrations views templates',
+        'garden': 'garden tomatoes compost soil seeds watering',
+        'travel': 'travel flights hotels passport luggage itinerary',
+    }
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(BLOG_RELATED_INDEX_PATH=f'{directory}/related.npz')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.posts = {
+            (topic, i): Post.objects.create(
+                title=f'{topic.title()} notes {i}', content=f'{words} {words.split()[i]}',
+                is_published=True, img_url='https://example.com/p.jpg',
+            )
+            for topic, words in self.TOPICS.items() for i in range(3)
+        }
+
+    def neighbours(self, post):
+        return list(related.related_posts(post, count=2))
+
+    def test_rebuild_finds_posts_on_the_same_topic(self):
+        self.assertEqual(related.rebuild(k=2), 9)
+        for (topic, i), post in self.posts.items():
+            expected = {self.posts[topic, j] for j in range(3) if j != i}
+            self.assertEqual(set(self.neighbours(post)), expected)
+
+    def test_details_is_a_single_lookup(self):
+        related.rebuild(k=2)
+        post = self.posts['garden', 0]
+        reader = User.objects.create_user('reader', password='password123')
+        reader.groups.add(Group.objects.get(name='Readers'))
+        self.client.force_login(reader)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(post.get_absolute_url())
+        self.assertEqual(set(response.context['releted_post']), {self.posts['garden', 1], self.posts['garden', 2]})
+        self.assertEqual(sum('blog_relatedpost' in query['sql'] for query in context.captured_queries), 1)
+
+    def test_refresh_follows_new_and_unpublished_posts(self):
+        related.rebuild(k=2)
+        newcomer = Post.objects.create(
+            title='Garden notes again', content=self.posts['garden', 0].content,
+            is_published=True, img_url='https://example.com/p.jpg',
+        )
+        vocabulary = os.stat(related.index_path()).st_mtime_ns
+        ids_path, vectors_path = related.row_paths(related.index_path())
+        size = os.path.getsize(vectors_path)
+        call_command('run_worker', once=True, processes=0, stdout=io.StringIO())
+        self.assertIn(self.posts['garden', 0], self.neighbours(newcomer))
+        self.assertIn(newcomer, self.neighbours(self.posts['garden', 0]))
+        # One row appended, the vocabulary left alone
+        self.assertEqual(os.stat(related.index_path()).st_mtime_ns, vocabulary)
+        self.assertEqual(os.path.getsize(vectors_path) - size, size // 9)
+        self.assertEqual(os.path.getsize(ids_path), 10 * 8)
+
+        newcomer.is_published = False
+        newcomer.save()
+        call_command('run_worker', once=True, processes=0, stdout=io.StringIO())
+        self.assertFalse(RelatedPost.objects.filter(related=newcomer).exists())
+        self.assertEqual(len(self.neighbours(self.posts['garden', 0])), 2)
+
+    def test_index_fitted_on_few_posts_is_refitted(self):
+        Post.objects.all().delete()
+        call_command('run_worker', once=True, processes=0, stdout=io.StringIO())
+        first = Post.objects.create(title='Python tips', content=self.TOPICS['python'], is_published=True,
+                                    img_url='https://example.com/p.jpg')
+        call_command('run_worker', once=True, processes=0, stdout=io.StringIO())
+        self.assertEqual(related.RelatedIndex.load(related.index_path()).fitted, 1)
+        # Every word of the next posts is new to a vocabulary fitted on one post
+        posts = [
+            Post.objects.create(title=f'Garden notes {i}', content=self.TOPICS['garden'], is_published=True,
+                                img_url='https://example.com/p.jpg')
+            for i in range(2)
+        ]
+        call_command('run_worker', once=True, processes=0, stdout=io.StringIO())
+        self.assertEqual(self.neighbours(posts[0]), [posts[1]])
+        self.assertEqual(related.RelatedIndex.load(related.index_path()).fitted, 3)
+        self.assertEqual(self.neighbours(first), [])
+
+
+class ExcerptTests(BlogTestCase):
+
+    def test_summary_is_maintained_on_save(self):
+        post = Post.objects.create(title='Long read', content='word ' * 450, img_url='https://example.com/p.jpg')
+        self.assertEqual((post.word_count, post.reading_time), (450, 3))
+        self.assertEqual(post.excerpt, 'word ' * 29 + 'word…')
+
+        post.content = 'Short and sweet.'
+        post.save(update_fields=['content'])
+        post.refresh_from_db()
+        self.assertEqual((post.excerpt, post.word_count, post.reading_time), ('Short and sweet.', 3, 1))
+
+    def test_listings_do_not_load_article_bodies(self):
+        author = User.objects.create_user('author', password='password123')
+        author.groups.add(Group.objects.get(name='Authors'))
+        for i in range(3):
+            Post.objects.create(
+                title=f'Post {i}', content='body ' * 2000, user=author, is_published=True,
+                img_url='https://example.com/p.jpg',
+            )
+        self.client.force_login(author)
+        for url in (reverse('blog:index'), reverse('blog:dashboard'), reverse('blog:search') + '?q=post'):
+            with self.subTest(url=url), CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertContains(response, 'body body')
+            self.assertFalse([query for query in context.captured_queries if '"blog_post"."content"' in query['sql']])
+
+
+class QueryBudgetTests(BlogTestCase):
+    """Every blog URL declares a query budget and stays within it without N+1 patterns."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.editor = User.objects.create_user('editor', email='editor@example.com', password='password123')
+        cls.editor.groups.add(Group.objects.get(name='Editors'))
+        categories = [Category.objects.create(name=f'Category {i}') for i in range(3)]
+        for i in range(12):
+            author = User.objects.create_user(f'author{i}', password='password123')
+            cls.post = Post.objects.create(
+                title=f'Post {i}', content='Body', category=categories[i % 3], user=author,
+                is_published=True, img_url='https://example.com/p.jpg',
+            )
+        cls.doomed = Post.objects.create(title='Doomed', content='Body', img_url='https://example.com/p.jpg')
+
+    def url_kwargs(self, name):
+        return {
+            'details': {'slug': self.post.slug},
+            'category': {'category_id': self.post.category_id},
+            'reset_password': {'uidb64': 'MQ', 'token': 'invalid-token'},
+            'edit_post': {'post_id': self.post.id},
+            'delete_post': {'post_id': self.doomed.id},
+            'publish_post': {'post_id': self.post.id},
+            'feed': {'kind': 'rss'},
+            'category_feed': {'category_id': self.post.category_id, 'kind': 'atom'},
+            'sitemap_page': {'page': 1},
+        }.get(name, {})
+
+    def test_every_url_is_within_budget(self):
+        for pattern in urls.urlpatterns:
+            budget = getattr(pattern.callback, 'query_budget', None)
+            url = reverse(f'blog:{pattern.name}', kwargs=self.url_kwargs(pattern.name))
+            for user in (None, self.editor):
+                with self.subTest(url=url, user=user):
+                    self.assertIsNotNone(budget, f'{pattern.name} has no @query_budget')
+                    self.client.logout()
+                    if user:
+                        self.client.force_login(user)
+                    response = self.client.get(url, {'q': 'post'} if pattern.name == 'search' else {})
+                    self.assertWithinBudget(response, budget)
+
+    def test_post_forms_are_within_budget(self):
+        self.client.force_login(self.editor)
+        data = {'title': 'Fresh post', 'content': 'Long enough to pass validation.', 'category': self.post.category_id}
+        response = self.client.post(reverse('blog:new_post'), data)
+        self.assertWithinBudget(response, views.new_post.query_budget)
+        response = self.client.post(reverse('blog:edit_post', kwargs={'post_id': self.post.id}), data)
+        self.assertWithinBudget(response, views.edit_post.query_budget)
+        self.assertEqual(Post.objects.filter(title='Fresh post').count(), 2)
+
+    def assertWithinBudget(self, response, budget):
+        recorder = response.wsgi_request.query_recorder
+        self.assertLessEqual(recorder.count, budget, [sql for sql, _ in recorder.queries])
+        self.assertEqual(recorder.repeated(), {})
+
+    @override_settings(BLOG_QUERY_BUDGET_STRICT=True)
+    def test_repeated_queries_fail_in_strict_mode(self):
+        # Rendering category names without select_related is the classic N+1
+        @query_budget(100)
+        def listing(request):
+            return HttpResponse(', '.join(post.category.name for post in Post.objects.exclude(category=None)))
+
+        request = RequestFactory().get('/')
+        request.resolver_match = ResolverMatch(listing, (), {})
+        middleware = QueryBudgetMiddleware(lambda request: listing(request))
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'possible N+1'):
+            middleware(request)
+
+
+class AccessControlTests(BlogTestCase):
+
+    def test_anonymous_users_are_limited_to_public_routes(self):
+        for path in ('/', '/about', '/search', '/reset_password/MQ/abc-123', '/media/missing.jpg'):
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertNotEqual(response.get('Location'), reverse('blog:login'))
+        for path in ('/dashboard', '/new_post', '/details/some-post', '/reset_password/MQ'):
+            with self.subTest(path=path):
+                self.assertRedirects(self.client.get(path), reverse('blog:login'), fetch_redirect_response=False)
+
+    def test_signed_in_users_skip_login_and_register(self):
+        self.client.force_login(User.objects.create_user('reader', password='password123'))
+        for name in ('login', 'register'):
+            response = self.client.get(reverse(f'blog:{name}'))
+            self.assertRedirects(response, reverse('blog:dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(reverse('blog:about')).status_code, 200)
+
+    def test_routes_are_not_reversed_per_request(self):
+        self.client.get('/')
+        with mock.patch('myproject.middleware.reverse', side_effect=AssertionError):
+            self.assertEqual(self.client.get(reverse('blog:about')).status_code, 200)
+
+
+class RoleTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='password123')
+        cls.author.groups.add(Group.objects.get(name='Authors'))
+        cls.post = Post.objects.create(
+            title='Post', content='Body', user=cls.author, img_url='https://example.com/p.jpg',
+        )
+
+    def auth_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in context.captured_queries
+                if '"auth_group"' in query['sql'] or '"auth_permission"' in query['sql']]
+
+    def test_roles_are_loaded_once_per_session(self):
+        self.client.force_login(self.author)
+        self.assertTrue(self.auth_queries(reverse('blog:dashboard')))
+        self.assertEqual(self.auth_queries(reverse('blog:dashboard')), [])
+        self.assertEqual(self.auth_queries(reverse('blog:edit_post', kwargs={'post_id': self.post.id})), [])
+
+    def test_membership_changes_reload_roles(self):
+        self.client.force_login(self.author)
+        self.assertNotContains(self.client.get(reverse('blog:dashboard')), 'Publish Post')
+
+        Group.objects.get(name='Editors').user_set.add(self.author)
+        response = self.client.get(reverse('blog:dashboard'))
+        self.assertContains(response, 'Publish Post')
+        self.assertEqual(self.client.get(reverse('blog:publish_post', kwargs={'post_id': self.post.id})).status_code, 302)
+
+        self.author.groups.remove(Group.objects.get(name='Editors'))
+        self.assertEqual(self.client.get(reverse('blog:publish_post', kwargs={'post_id': self.post.id})).status_code, 403)
+
+    def test_group_permission_changes_reload_roles(self):
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get(reverse('blog:dashboard')).status_code, 200)
+        Group.objects.get(name='Authors').permissions.clear()
+        self.assertEqual(self.client.get(reverse('blog:dashboard')).status_code, 403)
+
+
+class OutboxTests(BlogTestCase):
+
+    def test_password_reset_only_queues_the_email(self):
+        User.objects.create_user('reader', email='reader@example.com', password='password123')
+        response = self.client.post(reverse('blog:forget_password'), {'email': 'reader@example.com'})
+        self.assertContains(response, 'Email has been sent')
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.PENDING)
+
+        call_command('send_queued_mail', once=True, stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['reader@example.com'])
+        self.assertIn('/reset_password/', mail.outbox[0].body)
+        message = OutboxEmail.objects.get()
+        self.assertEqual((message.status, message.body), (OutboxEmail.SENT, ''))
+
+        self.client.force_login(User.objects.create_superuser('admin', password='password123'))
+        change = self.client.get(reverse('admin:blog_outboxemail_change', args=[message.pk]))
+        self.assertContains(change, message.subject)
+        self.assertNotContains(change, 'name="body"')
+
+    def test_batches_share_one_connection(self):
+        for i in range(5):
+            outbox.queue_mail(f'Message {i}', 'Body', [f'user{i}@example.com'])
+        with mock.patch('blog.management.commands.send_queued_mail.get_connection',
+                        wraps=get_connection) as factory:
+            call_command('send_queued_mail', once=True, batch=2, stdout=io.StringIO())
+        self.assertEqual(factory.call_count, 1)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_failures_back_off_then_become_dead_letters(self):
+        message = outbox.queue_mail('Hello', 'Body', ['user@example.com'])
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=smtplib.SMTPServerDisconnected('gone')):
+            for attempt in range(1, message.max_attempts + 1):
+                call_command('send_queued_mail', once=True, stdout=io.StringIO())
+                message.refresh_from_db()
+                self.assertEqual(message.attempts, attempt)
+                if message.status == OutboxEmail.PENDING:
+                    self.assertGreater(message.run_after, timezone.now())
+                    OutboxEmail.objects.filter(pk=message.pk).update(run_after=timezone.now())
+        self.assertEqual(message.status, OutboxEmail.DEAD)
+        self.assertIn('SMTPServerDisconnected', message.last_error)
+
+        outbox.retry(OutboxEmail.objects.filter(pk=message.pk))
+        call_command('send_queued_mail', once=True, stdout=io.StringIO())
+        message.refresh_from_db()
+        self.assertEqual((message.status, len(mail.outbox)), (OutboxEmail.SENT, 1))
+
+    def test_retry_leaves_messages_being_sent(self):
+        sending, stale = (outbox.queue_mail(subject, 'Body', ['user@example.com']) for subject in ('Sending', 'Stale'))
+        OutboxEmail.objects.filter(pk=sending.pk).update(status=OutboxEmail.SENDING, locked_at=timezone.now())
+        OutboxEmail.objects.filter(pk=stale.pk).update(
+            status=OutboxEmail.SENDING, locked_at=timezone.now() - outbox.STALE_AFTER - timezone.timedelta(minutes=1),
+        )
+        self.assertEqual(outbox.retry(OutboxEmail.objects.all()), 1)
+        self.assertEqual(dict(OutboxEmail.objects.values_list('subject', 'status')),
+                         {'Sending': OutboxEmail.SENDING, 'Stale': OutboxEmail.PENDING})
+
+
+class AsyncViewTests(BlogTestCase):
+    """index, details and about served through the ASGI handler and async middleware."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', password='password123')
+        cls.reader.groups.add(Group.objects.get(name='Readers'))
+        category = Category.objects.create(name='Travel')
+        for i in range(7):
+            cls.post = Post.objects.create(
+                title=f'Post {i}', content='Body', category=category, user=cls.reader,
+                is_published=True, img_url='https://example.com/p.jpg',
+            )
+
+    async def test_read_pages(self):
+        client = AsyncClient()
+        response = await client.get(reverse('blog:index'))
+        self.assertContains(response, 'Post 6')
+        self.assertContains(response, 'Page 1 of 2')
+        self.assertEqual(response.asgi_request.query_recorder.count, 5)  # count + page + popular + trending + categories
+        self.assertEqual((await client.get(reverse('blog:index'))).headers['X-Page-Cache'], 'hit')
+        self.assertContains(await client.get(reverse('blog:about')), 'About')
+        self.assertRedirects(await client.get(self.post.get_absolute_url()), reverse('blog:login'),
+                             fetch_redirect_response=False)
+
+        await client.aforce_login(self.reader)
+        response = await client.get(self.post.get_absolute_url())
+        self.assertContains(response, 'Post 6')
+        self.assertContains(response, 'Post 5')  # same-category fallback
+        self.assertLessEqual(response.asgi_request.query_recorder.count, views.details.query_budget)
+        self.assertEqual((await client.get('/details/missing')).status_code, 404)
+        self.assertRedirects(await client.get(reverse('blog:login')), reverse('blog:dashboard'),
+                             fetch_redirect_response=False)
+
+
+class ReplicaRoutingTests(BlogTestMixin, TransactionTestCase):
+    """Read-only views through the router, reading committed data from the replica connection."""
+
+    databases = {'default', 'replica'}
+    # Keep the groups and roles the migrations created for the test cases after this one
+    serialized_rollback = True
+
+    def setUp(self):
+        super().setUp()
+        AsyncViewTests.setUpTestData.__func__(self)
+
+    def test_read_only_views_read_from_replica(self):
+        self.client.force_login(self.reader)
+        with CaptureQueriesContext(connections['replica']) as replica, \
+                CaptureQueriesContext(connections['default']) as default:
+            index = self.client.get(reverse('blog:index'))
+            details = self.client.get(self.post.get_absolute_url())
+        self.assertContains(index, 'Post 6')
+        self.assertContains(details, 'Post 5')
+        # The posts came from the replica, which was only read; the primary
+        # only kept the session
+        self.assertTrue(any('"blog_post"' in query['sql'] for query in replica))
+        self.assertTrue(all(query['sql'].startswith('SELECT') for query in replica))
+        self.assertFalse(any('"blog_post"' in query['sql'] for query in default))
+
+
+class WSGIViewTests(BlogTestCase):
+    """The same pages through the WSGI handler, which serves the views' sync twins."""
+
+    class Handler(wsgi.SyncViews, ClientHandler):
+        pass
+
+    @classmethod
+    def setUpTestData(cls):
+        AsyncViewTests.setUpTestData.__func__(cls)
+
+    def test_read_pages(self):
+        client = Client()
+        client.handler = self.Handler(enforce_csrf_checks=False)
+        response = client.get(reverse('blog:index'))
+        self.assertIs(response.wsgi_request.resolver_match.func, views.sync_index)
+        self.assertContains(response, 'Post 6')
+        self.assertContains(response, 'Page 1 of 2')
+        self.assertContains(response, 'Travel')
+        self.assertEqual(response.wsgi_request.query_recorder.count, 5)
+        self.assertEqual(client.get(reverse('blog:index'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertContains(client.get(reverse('blog:about')), 'About')
+        response = client.get(reverse('blog:category', kwargs={'category_id': self.post.category_id}))
+        self.assertIs(response.wsgi_request.resolver_match.func, views.sync_category)
+        self.assertContains(response, '(7)')
+        self.assertRedirects(client.get(self.post.get_absolute_url()), reverse('blog:login'),
+                             fetch_redirect_response=False)
+
+        client.force_login(self.reader)
+        response = client.get(self.post.get_absolute_url())
+        self.assertIs(response.wsgi_request.resolver_match.func, views.sync_details)
+        self.assertContains(response, 'Post 5')  # same-category fallback
+        self.assertLessEqual(response.wsgi_request.query_recorder.count, views.details.query_budget)
+        self.assertEqual(popularity.buffer.hits, {self.post.slug: 1})
+        self.assertEqual(client.get('/details/missing').status_code, 404)
+
+
+class MediaServingTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.data = bytes(range(256)) * 40
+        default_storage.save('blog/posts/photo.jpg', io.BytesIO(self.data))
+        default_storage.save('blog/posts/renditions/photo-0123456789ab-320.webp', io.BytesIO(b'webp'))
+
+    def get(self, path='/media/blog/posts/photo.jpg', **headers):
+        return self.client.get(path, headers=headers)
+
+    def test_full_file_with_validators(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+
+    def test_hashed_names_are_immutable(self):
+        response = self.get('/media/blog/posts/renditions/photo-0123456789ab-320.webp')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_conditional_requests(self):
+        first = self.get()
+        response = self.get(If_None_Match=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+        self.assertEqual(self.get(If_Modified_Since=first['Last-Modified']).status_code, 304)
+        self.assertEqual(self.get(If_None_Match='"stale"').status_code, 200)
+        self.assertEqual(self.get(If_Match='"stale"').status_code, 412)
+
+    def test_byte_ranges(self):
+        cases = {
+            'bytes=0-9': (0, 9),
+            'bytes=10000-': (10000, len(self.data) - 1),
+            'bytes=-5': (len(self.data) - 5, len(self.data) - 1),
+            'bytes=100-999999': (100, len(self.data) - 1),
+        }
+        for header, (start, end) in cases.items():
+            with self.subTest(header=header):
+                response = self.get(Range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(b''.join(response.streaming_content), self.data[start:end + 1])
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{len(self.data)}')
+                self.assertEqual(response['Content-Length'], str(end - start + 1))
+
+    def test_unsatisfiable_and_ignored_ranges(self):
+        response = self.get(Range=f'bytes={len(self.data)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+        # Multiple ranges, or an If-Range the file no longer matches, get the whole file
+        self.assertEqual(self.get(Range='bytes=0-1,5-6').status_code, 200)
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(Range='bytes=0-9', If_Range=etag).status_code, 206)
+        self.assertEqual(self.get(Range='bytes=0-9', If_Range='"old"').status_code, 200)
+
+    def test_offload_modes(self):
+        with self.settings(BLOG_MEDIA_OFFLOAD='x-accel-redirect'):
+            response = self.get()
+            self.assertEqual(response['X-Accel-Redirect'], '/protected-media/blog/posts/photo.jpg')
+            self.assertEqual(response.content, b'')
+            self.assertIn('ETag', response)
+            with open(os.path.join(self.media_root, 'blog/posts/café 100%?.jpg'), 'wb') as file:
+                file.write(self.data)
+            response = self.get('/media/blog/posts/caf%C3%A9%20100%25%3F.jpg')
+            self.assertEqual(response['X-Accel-Redirect'], '/protected-media/blog/posts/caf%C3%A9%20100%25%3F.jpg')
+        with self.settings(BLOG_MEDIA_OFFLOAD='x-sendfile'):
+            response = self.get()
+            self.assertEqual(response['X-Sendfile'], os.path.join(self.media_root, 'blog/posts/photo.jpg'))
+
+    def test_missing_and_unsafe_paths(self):
+        for path in ('/media/missing.jpg', '/media/blog/posts', '/media/../manage.py', '/media/%2e%2e/manage.py'):
+            with self.subTest(path=path):
+                self.assertEqual(self.get(path).status_code, 404)
+        self.assertEqual(self.client.post('/media/blog/posts/photo.jpg').status_code, 405)
+
+
+class ConditionalGetTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', password='password123')
+        cls.reader.groups.add(Group.objects.get(name='Readers'))
+        cls.category = Category.objects.create(name='Travel')
+        cls.post = Post.objects.create(
+            title='Hiking the Alps', content='Mountain trails.', category=cls.category,
+            is_published=True, img_url='https://example.com/a.jpg',
+        )
+
+    def test_updated_at_follows_saves(self):
+        created = self.post.updated_at
+        self.post.title = 'Hiking the Dolomites'
+        self.post.save(update_fields=['title'])
+        self.post.refresh_from_db()
+        self.assertGreater(self.post.updated_at, created)
+
+    def test_version_time(self):
+        self.assertAlmostEqual(caching.version_time(caching.new_version()), timezone.now().timestamp(), delta=2)
+        self.assertIsNone(caching.version_time('0123456789abcdef'))  # versions from before timestamps
+
+    def test_index_answers_304_without_queries(self):
+        response = self.client.get(reverse('blog:index'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('blog:index'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        since = self.client.get(reverse('blog:index'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+        # publishing changes the site-wide content version
+        etag = response['ETag']
+        self.post.is_published = False
+        self.post.save()
+        response = self.client.get(reverse('blog:index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_details_answers_304_after_one_lookup(self):
+        self.client.force_login(self.reader)
+        url = self.post.get_absolute_url()
+        etag = self.client.get(url)['ETag']
+        self.client.get(url)  # roles are now in the session
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(sum('"blog_post"' in query['sql'] for query in queries), 1)
+
+        # the page changes with the post, and differs per reader
+        self.post.content = 'Mountain trails and huts.'
+        self.post.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(User.objects.create_superuser('admin', password='password123'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pages_with_messages_are_rendered(self):
+        etag = self.client.get(reverse('blog:index'))['ETag']
+        self.client.get(reverse('blog:dashboard'))  # "You must be logged in" message
+        response = self.client.get(reverse('blog:index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+
+class DatabaseTuningTests(TestCase):
+
+    def test_connections_are_tuned(self):
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+        with connection.cursor() as cursor:
+            pragmas = {name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                       for name in ('busy_timeout', 'synchronous', 'cache_size', 'temp_store')}
+        self.assertEqual(pragmas, {'busy_timeout': 5000, 'synchronous': 1, 'cache_size': -20000, 'temp_store': 2})
+
+    def test_read_only_views_read_from_replica(self):
+        router = db.ReadReplicaRouter()
+
+        @db.read_only
+        def view(request):
+            return HttpResponse(router.db_for_read(Post))
+
+        @db.read_only
+        async def async_view(request):
+            return HttpResponse(router.db_for_read(Post))
+
+        factory = RequestFactory()
+        self.assertEqual(view(factory.get('/')).content, b'replica')
+        self.assertEqual(async_to_sync(async_view)(factory.get('/')).content, b'replica')
+        self.assertEqual(view(factory.post('/')).content, b'default')
+        self.assertEqual(router.db_for_read(Post), 'default')
+        self.assertEqual(router.db_for_write(Post, instance=Post(title='x')), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'blog'))
+
+
+class ImportExportTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('writer', password='password123')
+        self.travel = Category.objects.create(name='Travel')
+        Post.objects.create(title='Hiking the Alps', content='Trails.', category=self.travel, is_published=True)
+
+    def import_text(self, text, *args):
+        path = os.path.join(tempfile.mkdtemp(), 'posts.jsonl' if text.startswith('{') else 'posts.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_posts', path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_duplicate_titles_get_unique_slugs(self):
+        post = Post.objects.create(title='Hiking the Alps', content='Again.')
+        self.assertEqual(post.slug, 'hiking-the-alps-2')
+        with self.assertNumQueries(1):
+            slugs = unique_slugs(['Hiking the Alps', 'Hiking the alps!', 'Street food', 'hiking-the-alps'])
+        self.assertEqual(slugs, ['hiking-the-alps-3', 'hiking-the-alps-4', 'street-food', 'hiking-the-alps-5'])
+
+    def test_import_jsonl_in_batches(self):
+        rows = [
+            {'title': 'Hiking the Alps', 'content': 'More trails.', 'category': 'Travel', 'is_published': True,
+             'create_at': '2020-05-01T10:00:00+00:00'},
+            {'title': 'Street food', 'content': 'Noodles everywhere.', 'category': 'Food', 'author': 'writer',
+             'is_published': True},
+            {'content': 'No title'},
+            {'title': 'Draft', 'content': 'Notes.', 'author': 'nobody', 'category': 'Drafts'},
+            {'title': 'Draft', 'content': 'Notes.'},
+        ]
+        text = '\n'.join(json.dumps(row) for row in rows) + '\nnot json\n'
+        out, err = self.import_text(text, '--batch-size', '2', '--author', 'writer')
+        self.assertIn('Imported 3 posts (3 rows skipped)', out)
+        self.assertIn('Line 3: title: missing', err)
+        self.assertIn("Line 4: author: no user named 'nobody'", err)
+        self.assertIn('Line 6: invalid JSON', err)
+
+        alps = Post.objects.get(slug='hiking-the-alps-2')
+        self.assertEqual(alps.create_at.year, 2020)
+        self.assertEqual(alps.excerpt, 'More trails.')
+        self.assertEqual(alps.user, self.author)
+        self.assertEqual(Post.objects.get(slug='street-food').category.name, 'Food')
+        # Skipped rows create no categories
+        self.assertEqual(set(Category.objects.values_list('name', flat=True)), {'Travel', 'Food'})
+        self.assertEqual({post.slug for post in search_posts('noodles')[:10]}, {'street-food'})
+
+    def test_export_and_import_round_trip(self):
+        out = io.StringIO()
+        call_command('export_posts', '-', '--format', 'csv', stdout=out)
+        Post.objects.all().delete()
+        self.import_text(out.getvalue())
+        post = Post.objects.get()
+        self.assertEqual((post.slug, post.category, post.is_published), ('hiking-the-alps', self.travel, True))
+
+
+class FeedTests(BlogTestCase):
+
+    ATOM = '{http://www.w3.org/2005/Atom}'
+    SITEMAP = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.travel = Category.objects.create(name='Travel')
+        cls.food = Category.objects.create(name='Food')
+        cls.post = Post.objects.create(title='Hiking the Alps', content='Mountain trails.', category=cls.travel, is_published=True)
+        Post.objects.create(title='Street food', content='Noodles.', category=cls.food, is_published=True)
+        Post.objects.create(title='Draft', content='Notes.', category=cls.travel)
+
+    def fetch(self, url, **headers):
+        response = self.client.get(url, **headers)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content
+
+    def test_feeds_list_published_posts(self):
+        with mock.patch.object(feeds, 'CHUNK_SIZE', 1):  # one item per chunk
+            response, content = self.fetch(reverse('blog:feed', args=['rss']))
+        self.assertTrue(response.streaming)
+        self.assertIn('max-age=', response['Cache-Control'])
+        titles = [item.findtext('title') for item in ElementTree.fromstring(content).iter('item')]
+        self.assertCountEqual(titles, ['Hiking the Alps', 'Street food'])
+        self.assertIn('http://testserver/details/hiking-the-alps', content.decode())
+
+        _, content = self.fetch(reverse('blog:category_feed', args=[self.travel.pk, 'atom']))
+        feed = ElementTree.fromstring(content)
+        self.assertEqual(feed.findtext(f'{self.ATOM}title'), 'My Blog: Travel')
+        self.assertEqual([entry.findtext(f'{self.ATOM}title') for entry in feed.iter(f'{self.ATOM}entry')], ['Hiking the Alps'])
+
+        self.assertEqual(self.client.get(reverse('blog:category_feed', args=[999, 'rss'])).status_code, 404)
+        self.assertEqual(self.client.get('/feeds/json.xml').status_code, 404)
+
+    def test_feeds_are_cached_until_posts_change(self):
+        url = reverse('blog:feed', args=['atom'])
+        response, _ = self.fetch(url)
+        with self.assertNumQueries(0):
+            cached, content = self.fetch(url)
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertFalse(cached.streaming)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertIn(b'Hiking the Alps', content)
+
+        # unpublishing replaces the site feed and the category's
+        self.post.is_published = False
+        self.post.save()
+        response, content = self.fetch(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b'Hiking the Alps', content)
+        _, content = self.fetch(reverse('blog:category_feed', args=[self.travel.pk, 'rss']))
+        self.assertNotIn(b'Hiking the Alps', content)
+
+    @override_settings(BLOG_SITEMAP_PAGE_SIZE=1)
+    def test_sitemap_index_and_pages(self):
+        _, content = self.fetch(reverse('blog:sitemap'))
+        pages = [loc.text for loc in ElementTree.fromstring(content).iter(f'{self.SITEMAP}loc')]
+        self.assertEqual(len(pages), 2)  # the draft's page is left out
+
+        response, content = self.fetch(pages[0].removeprefix('http://testserver'))
+        self.assertEqual(response['Content-Type'], 'application/xml')
+        urls = [loc.text for loc in ElementTree.fromstring(content).iter(f'{self.SITEMAP}loc')]
+        self.assertEqual(urls, ['http://testserver' + self.post.get_absolute_url()])
+
+        draft = Post.objects.get(title='Draft')
+        self.assertEqual(self.client.get(reverse('blog:sitemap_page', args=[draft.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('blog:sitemap_page', args=[0])).status_code, 404)
+
+
+class ProfilingTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser('admin', password='password123')
+        Post.objects.create(title='Hiking the Alps', content='Trails.', is_published=True, img_url='https://example.com/a.jpg')
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.enterContext(override_settings(BLOG_PROFILING_DIR=directory))
+
+    def test_staff_request_is_profiled(self):
+        self.client.get(reverse('blog:index'), {'profile': 1})
+        self.assertFalse(RequestProfile.objects.exists())  # anonymous flags are ignored
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('blog:search'), {'q': 'alps'}, HTTP_X_PROFILE='1')
+        profile = RequestProfile.objects.get()
+        self.assertEqual((profile.path, profile.status, profile.user), ('/search?q=alps', 200, self.staff))
+        self.assertEqual(profile.query_count, response.wsgi_request.query_recorder.count)
+        self.assertEqual([name for name, _ in profile.templates], ['blog/search.html'])
+        self.assertTrue(os.path.exists(profiling.stack_path(profile.stack_file)))
+
+        # admins download the stacks; deleting the profile removes them
+        stacks = self.client.get(reverse('admin:blog_requestprofile_stacks', args=[profile.pk]))
+        self.assertEqual(stacks.status_code, 200)
+        self.assertContains(self.client.get(reverse('admin:blog_requestprofile_change', args=[profile.pk])), 'blog/search.html')
+        profile.delete()
+        self.assertFalse(os.path.exists(profiling.stack_path(profile.stack_file)))
+
+    @override_settings(BLOG_PROFILING_SAMPLE_RATE=1.0, BLOG_PROFILING_MODE='cprofile', BLOG_PROFILING_KEEP=2)
+    def test_sampled_requests_are_profiled_with_cprofile(self):
+        for _ in range(3):
+            self.client.get(reverse('blog:search'), {'q': 'alps'})
+        self.assertEqual(RequestProfile.objects.count(), 2)  # the oldest was pruned
+        profile = RequestProfile.objects.first()
+        stats = pstats.Stats(profiling.stack_path(profile.stack_file))
+        self.assertTrue(any(function == 'search' for _, _, function in stats.stats))
+
+    def test_sampler_writes_folded_stacks(self):
+        def busy_work():
+            deadline = time.perf_counter() + 0.1
+            while time.perf_counter() < deadline:
+                pass
+
+        sampler = profiling.StackSampler(threading.get_ident(), 0.001)
+        sampler.start()
+        busy_work()
+        sampler.stop()
+        line = sampler.folded().splitlines()[0]
+        stack, count = line.rsplit(' ', 1)
+        self.assertIn('busy_work (blog/tests.py:', stack.split(';')[-1])
+        self.assertGreater(int(count), 0)
+
+
+class MetricsTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.enterContext(override_settings(BLOG_METRICS_DIR=directory, BLOG_METRICS_TOKEN='s3cret'))
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+    def scrape(self, **headers):
+        response = self.client.get(reverse('blog:metrics'), HTTP_AUTHORIZATION='Bearer s3cret', **headers)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        return response.content.decode()
+
+    def test_requests_are_counted_per_route(self):
+        Post.objects.create(title='Hiking the Alps', content='Trails.', is_published=True, img_url='https://example.com/a.jpg')
+        self.client.get(reverse('blog:index'))
+        self.client.get(reverse('blog:index'))
+        self.client.get(reverse('blog:dashboard'))  # redirected to the login page
+        self.client.get('/no-such-page')  # also redirected
+        text = self.scrape()
+        self.assertIn('blog_http_requests_total{method="GET",route="blog:index",status="200"} 2', text)
+        self.assertIn('blog_http_requests_total{method="GET",route="blog:dashboard",status="302"} 1', text)
+        self.assertIn('blog_http_requests_total{method="GET",route="unmatched",status="302"} 1', text)
+        self.assertIn('blog_http_request_duration_seconds_bucket{route="blog:index",le="+Inf"} 2', text)
+        self.assertIn('blog_http_request_duration_seconds_count{route="blog:index"} 2', text)
+        self.assertRegex(text, r'blog_http_request_db_queries_bucket\{route="blog:index",le="0"\} 1\n')  # then cached
+        self.assertRegex(text, r'blog_http_request_template_seconds_sum\{route="blog:index"\} 0\.\d*[1-9]')
+
+    def test_processes_are_added_up(self):
+        self.client.get(reverse('blog:about'))
+        other = metrics.Registry()  # another worker
+        other.filename = 'other-worker.json'
+        other.inc('blog_http_requests_total', (('method', 'GET'), ('route', 'blog:about'), ('status', '200')), 4)
+        other.observe('blog_http_request_duration_seconds', (('route', 'blog:about'),), 0.02)
+        other.flush()
+        text = self.scrape()
+        self.assertIn('blog_http_requests_total{method="GET",route="blog:about",status="200"} 5', text)
+        self.assertIn('blog_http_request_duration_seconds_count{route="blog:about"} 2', text)
+
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.client.get(reverse('blog:metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('blog:metrics'), HTTP_AUTHORIZATION='Bearer guess').status_code, 403)
+        self.assertIn('# TYPE blog_http_requests_total counter', self.scrape())
+
+    def test_threads_flush_one_at_a_time(self):
+        metrics.registry.inc('blog_http_requests_total', (('method', 'GET'), ('route', 'blog:about'), ('status', '200')))
+        errors = []
+
+        def flush():
+            try:
+                for _ in range(20):
+                    metrics.registry.flush()
+            except OSError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=flush) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertIn('blog_http_requests_total{method="GET",route="blog:about",status="200"} 1', self.scrape())
+
+    @override_settings(BLOG_METRICS_TOKEN=None)
+    def test_only_staff_without_a_token(self):
+        self.assertEqual(self.client.get(reverse('blog:metrics')).status_code, 403)
+        self.client.force_login(User.objects.create_user('writer', password='password123'))
+        self.assertEqual(self.client.get(reverse('blog:metrics')).status_code, 403)
+        self.client.force_login(User.objects.create_user('admin', password='password123', is_staff=True))
+        self.assertEqual(self.client.get(reverse('blog:metrics')).status_code, 200)
+
+
+
+class PostCardTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Travel')
+        cls.posts = [
+            Post.objects.create(title=f'Trip {i}', content='Mountain trails.', category=cls.category,
+                                is_published=i > 0, img_url='https://example.com/a.jpg')
+            for i in range(5)
+        ]
+        cls.editor = User.objects.create_user('editor', password='password123')
+        cls.editor.groups.add(Group.objects.get(name='Editors'))
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.editor)
+        self.render_card = self.enterContext(mock.patch.object(
+            blog_tags, 'render_card', wraps=blog_tags.render_card,
+        ))
+
+    def test_cards_are_rendered_once(self):
+        self.client.get(reverse('blog:dashboard'))
+        self.assertEqual(self.render_card.call_count, 5)
+        response = self.client.get(reverse('blog:dashboard'))
+        self.assertEqual(self.render_card.call_count, 5)
+        self.assertContains(response, 'Trip 0')
+        self.assertContains(response, 'Publish Post', count=1)
+        self.assertContains(response, 'Author: ', count=5)
+
+    def test_edit_and_publish_replace_the_card(self):
+        self.client.get(reverse('blog:dashboard'))
+        draft = self.posts[0]
+        draft.title = 'Trip to the Alps'
+        draft.save()
+        self.assertContains(self.client.get(reverse('blog:dashboard')), 'Trip to the Alps')
+        self.client.get(reverse('blog:publish_post', kwargs={'post_id': draft.pk}))
+        response = self.client.get(reverse('blog:dashboard'))
+        self.assertNotContains(response, 'Publish Post')
+        # the other four cards came from the cache every time
+        self.assertEqual(self.render_card.call_count, 7)
+
+    def test_variants_and_related_names_have_their_own_cards(self):
+        post = Post.objects.select_related('category', 'user').get(pk=self.posts[1].pk)
+        listing = blog_tags.post_card(post, 'listing')
+        self.assertNotIn('Edit Post', listing)
+        self.assertIn('Edit Post', blog_tags.post_card(post, 'dashboard'))
+        self.assertIn(f'<li><a href="{post.get_absolute_url()}">', blog_tags.post_card(post, 'link'))
+        self.category.name = 'Hiking'
+        self.category.save()
+        post.category.name = 'Hiking'
+        self.assertIn('Hiking', blog_tags.post_card(post, 'listing'))
+        self.assertEqual(self.render_card.call_count, 4)
+
+
+class SessionTests(BlogTestCase):
+
+    def session_statements(self, queries):
+        return [query['sql'].split()[0] for query in queries if 'django_session' in query['sql']]
+
+    def test_unchanged_sessions_are_not_written(self):
+        session = sessions.SessionStore()
+        session['theme'] = 'dark'
+        session.save()
+        session = sessions.SessionStore(session.session_key)
+        session['theme'] = 'dark'
+        with self.assertNumQueries(0):
+            session.save()
+        session['theme'] = 'light'
+        with CaptureQueriesContext(connection) as queries:
+            session.save()
+        self.assertEqual(self.session_statements(queries.captured_queries), ['UPDATE'])
+
+    def test_lru_front_serves_recent_sessions(self):
+        session = sessions.SessionStore()
+        session['theme'] = 'dark'
+        session.save()
+        caches['sessions'].clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(sessions.SessionStore(session.session_key)['theme'], 'dark')
+        session.delete()
+        with self.assertNumQueries(1):
+            self.assertNotIn('theme', sessions.SessionStore(session.session_key))
+
+    def test_signed_in_sessions_skip_the_lru_front(self):
+        user = User.objects.create_user('editor', password='password123')
+        user.groups.add(Group.objects.get(name='Editors'))
+        self.client.force_login(user)
+        key = self.client.session.session_key
+        self.assertIsNone(sessions.lru.get(key))
+        self.assertEqual(self.client.get(reverse('blog:dashboard')).status_code, 200)
+        self.assertIsNone(sessions.lru.get(key))
+        # Revoked by another worker: gone from the shared cache and the database
+        sessions.SessionStore.get_model_class().objects.filter(pk=key).delete()
+        caches['sessions'].clear()
+        self.assertEqual(self.client.get(reverse('blog:dashboard')).status_code, 302)
+
+    def test_login_writes_the_session_once_and_messages_never(self):
+        User.objects.create_user('reader', password='password123')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('blog:dashboard'))  # redirected with a message
+            response = self.client.post(reverse('blog:login'), {'username': 'reader', 'password': 'password123'})
+            self.client.get(response['Location'])
+        # A free key is looked up and the session inserted with the login;
+        # the dashboard then stores the user's roles
+        self.assertEqual(self.session_statements(queries.captured_queries), ['SELECT', 'INSERT', 'UPDATE'])
+        self.assertIn('messages', self.client.cookies)
+        self.assertEqual(self.client.session['_auth_user_id'], str(User.objects.get(username='reader').pk))
+
+    def test_expired_sessions_are_deleted_in_batches(self):
+        Session = sessions.SessionStore.get_model_class()
+        past, future = timezone.now() - timezone.timedelta(days=1), timezone.now() + timezone.timedelta(days=1)
+        Session.objects.bulk_create(
+            [Session(session_key=f'expired-session-{i}', session_data='', expire_date=past) for i in range(5)]
+            + [Session(session_key='current-session', session_data='', expire_date=future)]
+        )
+        with CaptureQueriesContext(connection) as queries:
+            call_command('clear_expired_sessions', batch=2, pause=0, stdout=io.StringIO())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['current-session'])
+        self.assertEqual(self.session_statements(queries.captured_queries).count('DELETE'), 3)
+
+
+class PopularityTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', password='password123')
+        cls.reader.groups.add(Group.objects.get(name='Readers'))
+        cls.posts = [
+            Post.objects.create(title=f'Post {i}', content='Body', is_published=True, img_url='https://example.com/p.jpg')
+            for i in range(3)
+        ]
+
+    def test_views_are_buffered_and_flushed_in_one_update(self):
+        self.client.force_login(self.reader)
+        url = self.posts[0].get_absolute_url()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+            self.client.get(url)
+            self.client.get(self.posts[1].get_absolute_url(), HTTP_IF_NONE_MATCH='"stale"')
+            self.client.get('/details/missing')
+        self.assertFalse([query for query in queries.captured_queries if query['sql'].startswith('UPDATE "blog_post"')])
+        self.assertEqual(popularity.buffer.hits, {self.posts[0].slug: 2, self.posts[1].slug: 1})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(popularity.buffer.flush(), 3)
+        self.assertEqual([query['sql'].split()[0] for query in queries.captured_queries if 'blog_post' in query['sql']], ['UPDATE'])
+        self.assertEqual([post.view_count for post in Post.objects.order_by('id')], [2, 1, 0])
+
+    def test_flush_happens_after_the_interval(self):
+        self.client.force_login(self.reader)
+        with override_settings(BLOG_VIEW_FLUSH_INTERVAL=0):
+            self.client.get(self.posts[2].get_absolute_url())
+        self.assertEqual(Post.objects.get(pk=self.posts[2].pk).view_count, 1)
+        self.assertFalse(popularity.buffer.hits)
+
+    def test_trending_decays_and_most_read_does_not(self):
+        old, new, _ = self.posts
+        week_ago = timezone.now() - timezone.timedelta(days=7)
+        popularity.buffer.hits.update({old.slug: 10})
+        popularity.buffer.flush(now=week_ago - timezone.timedelta(days=7))
+        popularity.buffer.hits.update({new.slug: 3})
+        popularity.buffer.flush()
+        self.assertEqual(list(popularity.popular_posts()), [old, new])
+        self.assertEqual(list(popularity.trending_posts()), [new, old])
+        self.assertAlmostEqual(popularity.decayed(Post.objects.get(pk=old.pk).popularity), 2.5, places=1)
+
+    def test_scores_are_rebased_before_they_overflow(self):
+        post = self.posts[0]
+        with override_settings(BLOG_POPULARITY_HALF_LIFE=3600):
+            start = popularity.current_epoch() + timezone.timedelta(hours=10)
+            popularity.buffer.hits.update({post.slug: 4})
+            popularity.buffer.flush(now=start)
+            # 300 half-lives later: past REBASE_AFTER, but short of overflowing
+            later = start + timezone.timedelta(hours=300)
+            popularity.buffer.hits.update({post.slug: 1})
+            popularity.buffer.flush(now=later)
+            self.assertEqual(popularity.current_epoch(), later)
+            self.assertEqual(Post.objects.get(pk=post.pk).popularity, 1.0)
+            popularity.rebase(now=later + timezone.timedelta(hours=1))
+            self.assertEqual(Post.objects.get(pk=post.pk).popularity, 0.5)
+            call_command('rebase_popularity', stdout=io.StringIO())
+        with override_settings(BLOG_POPULARITY_HALF_LIFE=60), self.assertRaises(ImproperlyConfigured):
+            popularity.half_life()
+
+    def test_failed_flushes_keep_their_views(self):
+        popularity.buffer.hits.update({self.posts[0].slug: 3})
+        with mock.patch.object(popularity, 'view_weight', side_effect=OverflowError), \
+                override_settings(BLOG_VIEW_FLUSH_INTERVAL=0), self.assertLogs('blog.popularity', 'ERROR'):
+            popularity.buffer.flush_if_due()
+        self.assertEqual(popularity.buffer.hits, {self.posts[0].slug: 3})
+        self.assertEqual(popularity.buffer.flush(), 3)
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk).view_count, 3)
+
+    def test_saving_a_post_keeps_its_views(self):
+        post = Post.objects.get(pk=self.posts[0].pk)
+        popularity.buffer.hits.update({post.slug: 5})
+        popularity.buffer.flush()
+        post.title = 'Renamed'
+        post.save()
+        self.assertEqual(Post.objects.get(pk=post.pk).view_count, 5)
+
+    def test_flushes_refresh_the_index(self):
+        response = self.client.get(reverse('blog:index'))
+        self.assertEqual(self.client.get(reverse('blog:index'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        popularity.buffer.hits.update({self.posts[2].slug: 2})
+        popularity.buffer.flush()
+        response = self.client.get(reverse('blog:index'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertEqual(response.context['sidebar']['popular'], [self.posts[2]])
+        # Later flushes leave the page alone until BLOG_POPULAR_CACHE_TIMEOUT has passed
+        popularity.buffer.hits.update({self.posts[1].slug: 5})
+        popularity.buffer.flush()
+        self.assertEqual(self.client.get(reverse('blog:index'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        caching.page_cache().delete(popularity.REFRESH_KEY)
+        popularity.buffer.hits.update({self.posts[1].slug: 5})
+        popularity.buffer.flush()
+        self.assertEqual(self.client.get(reverse('blog:index'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_index_sidebar(self):
+        popularity.buffer.hits.update({self.posts[1].slug: 4})
+        popularity.buffer.flush()
+        response = self.client.get(reverse('blog:index'))
+        self.assertContains(response, 'Most Read')
+        self.assertEqual(response.context['sidebar']['popular'], [self.posts[1]])
+        with CaptureQueriesContext(connection) as queries:
+            list(popularity.popular_posts())
+            list(popularity.trending_posts())
+        with connection.cursor() as cursor:
+            for query, index in zip(queries.captured_queries, ('post_most_read_idx', 'post_trending_idx')):
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                self.assertIn(index, ' '.join(row[-1] for row in cursor.fetchall()))
+
+
+class CategoryTests(BlogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.travel = Category.objects.create(name='Travel')
+        cls.food = Category.objects.create(name='Food')
+
+    def counts(self):
+        return dict(Category.objects.values_list('name', 'published_post_count'))
+
+    def new_post(self, title, category, published=True):
+        return Post.objects.create(title=title, content='Body', category=category, is_published=published,
+                                   img_url='https://example.com/p.jpg')
+
+    def test_counts_follow_publishing_moves_and_deletes(self):
+        hike = self.new_post('Hike', self.travel)
+        draft = self.new_post('Draft', self.travel, published=False)
+        self.assertEqual(self.counts(), {'Travel': 1, 'Food': 0})
+        draft.is_published = True
+        draft.save()
+        self.assertEqual(self.counts(), {'Travel': 2, 'Food': 0})
+        hike.category = self.food
+        hike.save()
+        self.assertEqual(self.counts(), {'Travel': 1, 'Food': 1})
+        draft.is_published = False
+        draft.save()
+        hike.delete()
+        self.assertEqual(self.counts(), {'Travel': 0, 'Food': 0})
+
+    def test_reconcile_fixes_drift_from_one_grouped_query(self):
+        self.new_post('Hike', self.travel)
+        self.new_post('Climb', self.travel)
+        Post.objects.update(is_published=False)  # no signals
+        Post.objects.filter(title='Climb').update(is_published=True, category=self.food)
+        with CaptureQueriesContext(connection) as queries:
+            call_command('reconcile_category_counts', stdout=io.StringIO())
+        self.assertEqual(self.counts(), {'Travel': 0, 'Food': 1})
+        post_queries = [query['sql'] for query in queries.captured_queries if 'FROM "blog_post"' in query['sql']]
+        self.assertEqual(len(post_queries), 1)
+        self.assertIn('GROUP BY', post_queries[0])
+
+    def test_category_page_uses_the_stored_count(self):
+        for i in range(7):
+            self.new_post(f'Hike {i}', self.travel)
+        self.new_post('Soup', self.food)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.travel.get_absolute_url())
+        self.assertContains(response, 'Hike 6')
+        self.assertNotContains(response, 'Soup')
+        self.assertContains(response, 'Page 1 of 2')
+        self.assertContains(response, f'href="{self.food.get_absolute_url()}">Food</a>')
+        self.assertContains(response, '(7)')
+        self.assertFalse([query for query in queries.captured_queries if 'COUNT(' in query['sql']])
+        self.assertEqual(self.client.get(reverse('blog:category', kwargs={'category_id': 999})).status_code, 404)
+
+    def test_publishing_refreshes_the_navigation(self):
+        self.new_post('Hike', self.travel)
+        self.assertContains(self.client.get(reverse('blog:index')), '(1)')
+        self.new_post('Climb', self.travel)
+        self.assertContains(self.client.get(reverse('blog:index')), '(2)')
+
+    def test_navigation_follows_other_processes(self):
+        self.new_post('Hike', self.travel)
+        self.new_post('Soup', self.food)
+        self.assertContains(self.client.get(reverse('blog:index')), '(1)', count=2)
+        # Another worker's changes reach this one through the shared 'listing' version only
+        Category.objects.filter(pk=self.travel.pk).update(published_post_count=3)
+        Category.objects.filter(pk=self.food.pk).delete()
+        caching.invalidate_tags('listing')
+        response = self.client.get(reverse('blog:index'))
+        self.assertContains(response, '(3)')
+        self.assertNotContains(response, self.food.get_absolute_url())
+
+    def test_imports_add_to_the_counts(self):
+        rows = [(1, {'title': 'Hike', 'category': 'Travel', 'is_published': 'true'}),
+                (2, {'title': 'Draft', 'category': 'Travel'}),
+                (3, {'title': 'Market', 'category': 'Markets', 'is_published': 'true'})]
+        transfer.PostImporter().run(rows)
+        self.assertEqual(self.counts(), {'Travel': 1, 'Food': 0, 'Markets': 1})
@@ -0,0 +1,214 @@
+"""
+transfer.py
+
+Bulk import and export of posts as JSON lines or CSV:
+- Rows are streamed both ways, so memory use doesn't grow with the file
+- Imports are written in batches: the batch's slugs are allocated together,
+  then one bulk_create runs inside the batch's own transaction, which also
+  creates the new categories of its rows, so skipped rows leave none behind
+- bulk_create skips the save signals, so each batch is added to the search
+  index and its categories' post counts here, and the pages showing
+  imported posts are invalidated at the end
+"""
+
+import csv
+import json
+import sys
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .caching import invalidate_tags
+from .categories import adjust_counts
+from .models import DEFAULT_IMAGE_URL, Category, Post, unique_slugs
+from .search import get_backend
+
+FIELDS = ['title', 'slug', 'content', 'category', 'author', 'is_published', 'create_at', 'updated_at', 'img_url']
+FORMATS = ('jsonl', 'csv')
+TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+FALSE_VALUES = {'', '0', 'false', 'no', 'off'}
+
+# Post bodies easily exceed csv's default 128 KiB field limit
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+
+
+class RowError(ValueError):
+    pass
+
+
+def guess_format(path):
+    return 'csv' if str(path).lower().endswith('.csv') else 'jsonl'
+
+
+def read_rows(file, fmt):
+    """Yield (line number, row dict or RowError) for every record of a file."""
+    if fmt == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            row = RowError(f"invalid JSON: {error}")
+        if not isinstance(row, (dict, RowError)):
+            row = RowError("expected a JSON object")
+        yield number, row
+
+
+def parse_bool(value):
+    if isinstance(value, bool) or value is None:
+        return bool(value)
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES | FALSE_VALUES:
+        return text in TRUE_VALUES
+    raise RowError(f"is_published: not a boolean: {value!r}")
+
+
+def parse_date(value, field):
+    if not value:
+        return None
+    try:
+        date = parse_datetime(value)
+    except ValueError:
+        date = None
+    if date is None:
+        raise RowError(f"{field}: not an ISO 8601 date and time: {value!r}")
+    return date if timezone.is_aware(date) else timezone.make_aware(date)
+
+
+class PostImporter:
+    """Turns rows into posts and writes them in batches."""
+
+    def __init__(self, batch_size=500, author=None):
+        self.batch_size = batch_size
+        self.default_author = author
+        # Categories and authors are few; rows only refer to them by name
+        self.categories = dict(Category.objects.values_list('name', 'pk'))
+        self.authors = {}
+        self.category_ids = set()
+        self.created = 0
+        self.failed = 0
+
+    def author_id(self, username):
+        if not username:
+            return self.default_author.pk if self.default_author else None
+        if username not in self.authors:
+            user = User.objects.filter(username=username).values_list('pk', flat=True).first()
+            if user is None:
+                raise RowError(f"author: no user named {username!r}")
+            self.authors[username] = user
+        return self.authors[username]
+
+    def category_ids_for(self, names):
+        # {name: pk} of the batch's categories, creating the missing ones;
+        # called in the batch's transaction
+        missing = set(names) - self.categories.keys() - {''}
+        created = {name: Category.objects.create(name=name).pk for name in sorted(missing)}
+        return {**self.categories, **created}
+
+    def build(self, row):
+        # An unsaved Post, the dates to restore after bulk_create and its category's name
+        title = (row.get('title') or '').strip()
+        if not title:
+            raise RowError("title: missing")
+        if len(title) > Post._meta.get_field('title').max_length:
+            raise RowError("title: too long")
+        post = Post(
+            title=title,
+            slug=row.get('slug') or '',
+            content=row.get('content') or '',
+            user_id=self.author_id((row.get('author') or '').strip()),
+            is_published=parse_bool(row.get('is_published')),
+            img_url=row.get('img_url') or DEFAULT_IMAGE_URL,
+        )
+        post.update_summary()
+        dates = {field: parse_date(row.get(field), field) for field in ('create_at', 'updated_at')}
+        return post, {field: date for field, date in dates.items() if date}, (row.get('category') or '').strip()
+
+    def write(self, batch):
+        # One transaction per batch: categories, slugs, posts, their dates and search entries
+        posts = [post for post, _, _ in batch]
+        with transaction.atomic():
+            categories = self.category_ids_for(name for _, _, name in batch)
+            for post, _, name in batch:
+                post.category_id = categories.get(name)
+            for post, slug in zip(posts, unique_slugs([post.slug or post.title for post in posts])):
+                post.slug = slug
+            Post.objects.bulk_create(posts)
+            # auto_now(_add) overrode the dates while inserting
+            dated = []
+            for post, dates, _ in batch:
+                for field, date in dates.items():
+                    setattr(post, field, date)
+                if dates:
+                    dated.append(post)
+            if dated:
+                Post.objects.bulk_update(dated, ['create_at', 'updated_at'])
+            get_backend().index_posts([post.pk for post in posts if post.is_published])
+            adjust_counts(Counter(post.category_id for post in posts if post.is_published and post.category_id))
+        # Only once committed: a failed batch rolls its new categories back
+        self.categories = categories
+        self.category_ids.update(post.category_id for post in posts)
+        self.created += len(posts)
+
+    def run(self, rows, on_error=None, on_batch=None):
+        """Import (line number, row) pairs; returns the number of posts created."""
+        batch = []
+        for number, row in rows:
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                batch.append(self.build(row))
+            except RowError as error:
+                self.failed += 1
+                if on_error:
+                    on_error(number, error)
+                continue
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+                if on_batch:
+                    on_batch(self.created)
+        if batch:
+            self.write(batch)
+        self.finish()
+        return self.created
+
+    def finish(self):
+        if self.created:
+            invalidate_tags('listing', *(f'category:{pk}' for pk in self.category_ids))
+
+
+def export_rows(queryset):
+    """Yield a row dict per post, reading the posts in chunks."""
+    columns = ['title', 'slug', 'content', 'category__name', 'user__username',
+               'is_published', 'create_at', 'updated_at', 'img_url']
+    for values in queryset.order_by('pk').values_list(*columns).iterator(chunk_size=2000):
+        row = dict(zip(FIELDS, values))
+        row['category'] = row['category'] or ''
+        row['author'] = row['author'] or ''
+        row['create_at'] = row['create_at'].isoformat()
+        row['updated_at'] = row['updated_at'].isoformat()
+        row['img_url'] = row['img_url'] or ''
+        yield row
+
+
+def write_rows(file, fmt, rows):
+    # Returns the number of rows written
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(file, fieldnames=FIELDS)
+        writer.writeheader()
+        for count, row in enumerate(rows, 1):
+            writer.writerow(row)
+        return count
+    for count, row in enumerate(rows, 1):
+        file.write(json.dumps(row, ensure_ascii=False) + '\n')
+    return count
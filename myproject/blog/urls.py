@@ -6,14 +6,24 @@ Defines URL patterns for the blog app:
 """
 
 from django.urls import path
-from . import views
+from . import feeds, metrics, views
 
 app_name = 'blog'
 
+# Access rules compiled by myproject.middleware.UserRedirectMiddleware:
+# routes anonymous visitors may open, and routes signed-in users are sent away from
+public_routes = frozenset({
+    'index', 'category', 'search', 'about', 'login', 'register', 'forget_password', 'reset_password',
+    'feed', 'category_feed', 'sitemap', 'sitemap_page', 'metrics',
+})
+guest_only_routes = frozenset({'register', 'login'})
+
 # URL patterns for the blog app
 urlpatterns = [
     path("",views.index,name="index"),
+    path('category/<int:category_id>',views.category,name='category'),
     path('details/<str:slug>',views.details,name='details'),
+    path('search',views.search,name='search'),
     path('about',views.about,name='about'),
     path('register',views.register,name='register'),
     path('login',views.login,name='login'),
@@ -25,4 +35,9 @@ urlpatterns = [
     path('edit_post/<int:post_id>',views.edit_post,name='edit_post'),
     path('delete_post/<int:post_id>',views.delete_post,name='delete_post'),
     path('publish_post/<int:post_id>',views.publish_post,name='publish_post'),
+    path('feeds/<str:kind>.xml',feeds.post_feed,name='feed'),
+    path('feeds/category/<int:category_id>/<str:kind>.xml',feeds.post_feed,name='category_feed'),
+    path('sitemap.xml',feeds.sitemap_index,name='sitemap'),
+    path('sitemap-posts-<int:page>.xml',feeds.sitemap_page,name='sitemap_page'),
+    path('metrics',metrics.metrics,name='metrics'),
 ]
\ No newline at end of file
@@ -5,17 +5,31 @@ Main view logic for the blog app:
 - Handles user authentication (register, login, logout, password reset)
 - Manages blog post CRUD operations
 - Renders dashboard and other pages
+- index, category, details and about are async views using the async ORM;
+  the WSGI handler serves their sync twins (sync_index, ...) instead
 """
 
-from django.shortcuts import render,get_object_or_404
-from .models import Post
+import asyncio
+
+from django.shortcuts import render,get_object_or_404,aget_object_or_404
+from .models import Category,Post
+from .search import search_posts
+from .pagination import CursorPaginator
+from .caching import cache_anonymous_page,tag_page
+from .conditional import conditional_page
+from .related import related_posts_of
+from .popularity import asidebar,count_views,sidebar
+from .categories import acategory_nav,category_nav
+from .instrumentation import query_budget
+from .db import read_only
+from .roles import get_roles,role_required
+from .outbox import queue_mail
 from .forms import RegisterForm,LoginForm,PostForm,forgetPasswordForm,resetForm
 from django.contrib import messages
 from django.shortcuts import redirect
 from django.contrib.auth import authenticate,login as auth_login,logout as auth_logout
 from django.core.paginator import Paginator
 from django.contrib.auth.models import Group
-from django.contrib.auth.decorators import permission_required
 from django.contrib.auth.models import User,Group
 
 from django.contrib.auth.tokens import default_token_generator
@@ -23,35 +37,191 @@ from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode,urlsafe_base64_decode
 from django.contrib.sites.shortcuts import get_current_site
 from django.template.loader import render_to_string
-from django.core.mail import send_mail
 
-def index(request):
+async def alist(queryset):
+    # Evaluate a queryset through the async ORM
+    return [item async for item in queryset]
+
+def served_under_wsgi_by(sync_view):
+    # The WSGI handler (myproject/wsgi.py) calls sync_view instead: there an
+    # async view would pay for async_to_sync on every request
+    def decorator(view_func):
+        view_func.wsgi_view = sync_view
+        return view_func
+    return decorator
+
+def listing_state(request):
+    # The index changes with the site-wide content version and, at most once
+    # per BLOG_POPULAR_CACHE_TIMEOUT, the view rankings of its sidebar
+    return ['listing', 'popular'], None
+
+def category_state(request, category_id):
+    # A category's listing also shows the navigation, whose counts follow the listing
+    return ['listing', f'category:{category_id}'], None
+
+def post_state(request, slug):
+    # Tags and updated_at of a post's page, from one lookup on the slug index
+    post = Post.objects.filter(slug=slug).values('id','category_id','updated_at').first()
+    if post is None:
+        return None
+    return [f"post:{post['id']}", f"category:{post['category_id']}"], post['updated_at']
+
+async def apost_state(request, slug):
+    post = await Post.objects.filter(slug=slug).values('id','category_id','updated_at').afirst()
+    if post is None:
+        return None
+    return [f"post:{post['id']}", f"category:{post['category_id']}"], post['updated_at']
+
+def listed_posts(**filters):
+    # Cards show the stored excerpt, so article bodies are never loaded
+    return Post.objects.filter(is_published=True,**filters).select_related('category').defer('content')
+
+def same_category_posts(post):
+    # Stand-ins for the related posts until the worker has run
+    return Post.objects.filter(category=post.category_id,is_published=True).exclude(pk=post.id).only('id','title','slug','updated_at')[:3]
+
+@query_budget(7)
+@read_only
+@conditional_page(listing_state)
+@cache_anonymous_page
+def sync_index(request):
+    # index() for the WSGI handler
+    tag_page(request, 'listing', 'popular')
+    paginator_obj = CursorPaginator(listed_posts(),5,count_cache_key='blog:post-count:published:',count_tags=['listing'])
+    page_data = {
+        'post_list' : paginator_obj.get_page(request.GET.get("cursor")),
+        'sidebar' : sidebar(),
+        'categories' : category_nav(),
+    }
+    return render(request,'blog/index.html',page_data)
+
+@served_under_wsgi_by(sync_index)
+@query_budget(7)
+@read_only
+@conditional_page(listing_state)
+@cache_anonymous_page
+async def index(request):
     # Display published blog posts with pagination.
-    post = Post.objects.filter(is_published=True)
+    tag_page(request, 'listing', 'popular')
     items_per_page = 5
-    page_num = request.GET.get("page")
-    paginator_obj = Paginator(post,items_per_page)
-    post = paginator_obj.get_page(page_num) 
+    cursor = request.GET.get("cursor")
+    paginator_obj = CursorPaginator(listed_posts(),items_per_page,count_cache_key='blog:post-count:published:',count_tags=['listing'])
+    # Everything the template shows is loaded before rendering: templates
+    # can't query from an async view. Django runs the async ORM's queries
+    # one at a time, so gather() saves event loop turns, not query time
+    post,_,rankings,categories = await asyncio.gather(
+        paginator_obj.aget_page(cursor), paginator_obj.acount(), asidebar(), acategory_nav(),
+    )
     page_data = {
-        'post_list' : post 
+        'post_list' : post,
+        'sidebar' : rankings,
+        'categories' : categories,
     }
     return render(request,'blog/index.html',page_data)
 
-@permission_required('blog.view_post', raise_exception=True)
-def details(request,slug):
+@query_budget(4)
+@read_only
+@conditional_page(category_state)
+@cache_anonymous_page
+def sync_category(request,category_id):
+    # category() for the WSGI handler
+    tag_page(request, 'listing', f'category:{category_id}')
+    category = get_object_or_404(Category,pk=category_id)
+    paginator_obj = CursorPaginator(listed_posts(category=category_id),5,total=category.published_post_count)
+    page_data = {
+        'category' : category,
+        'post_list' : paginator_obj.get_page(request.GET.get("cursor")),
+        'categories' : category_nav(),
+    }
+    return render(request,'blog/category.html',page_data)
+
+@served_under_wsgi_by(sync_category)
+@query_budget(4)
+@read_only
+@conditional_page(category_state)
+@cache_anonymous_page
+async def category(request,category_id):
+    # Display the published posts of one category, paginated like the index
+    tag_page(request, 'listing', f'category:{category_id}')
+    category = await aget_object_or_404(Category,pk=category_id)
+    # The stored count stands in for COUNT(*)
+    paginator_obj = CursorPaginator(listed_posts(category=category_id),5,total=category.published_post_count)
+    post,categories = await asyncio.gather(paginator_obj.aget_page(request.GET.get("cursor")), acategory_nav())
+    page_data = {
+        'category' : category,
+        'post_list' : post,
+        'categories' : categories,
+    }
+    return render(request,'blog/category.html',page_data)
+
+@query_budget(10)
+@read_only
+@role_required('blog.view_post')
+@count_views
+@conditional_page(post_state)
+@cache_anonymous_page
+def sync_details(request,slug):
+    # details() for the WSGI handler
+    post = get_object_or_404(Post.objects.select_related('category','user'),slug=slug)
+    tag_page(request, f'post:{post.id}', f'category:{post.category_id}')
+    page_data = {
+        'post' : post,
+        'releted_post' : list(related_posts_of(slug)) or list(same_category_posts(post)),
+    }
+    return render(request, "blog/details.html",page_data)
+
+@served_under_wsgi_by(sync_details)
+@query_budget(10)
+@read_only
+@role_required('blog.view_post')
+@count_views
+@conditional_page(apost_state)
+@cache_anonymous_page
+async def details(request,slug):
     # Display full blog post
-    post = Post.objects.get(slug=slug)
-    releted_post = Post.objects.filter(category=post.category,is_published=True).exclude(pk=post.id)[:3]
+    # The post and its precomputed content-similar posts, both by slug
+    post,releted_post = await asyncio.gather(
+        aget_object_or_404(Post.objects.select_related('category','user'),slug=slug),
+        alist(related_posts_of(slug)),
+    )
+    tag_page(request, f'post:{post.id}', f'category:{post.category_id}')
+    if not releted_post:
+        releted_post = await alist(same_category_posts(post))
     page_data = {
         'post' : post,
         'releted_post' : releted_post 
     }
     return render(request, "blog/details.html",page_data)
 
-def about(request):
+@query_budget(6)
+@read_only
+def search(request):
+    # Ranked full-text search over published blog posts with pagination.
+    query = request.GET.get("q", "").strip()
+    items_per_page = 5
+    page_num = request.GET.get("page")
+    paginator_obj = Paginator(search_posts(query),items_per_page)
+    post = paginator_obj.get_page(page_num)
+    page_data = {
+        'post_list' : post,
+        'query' : query,
+    }
+    return render(request, "blog/search.html",page_data)
+
+@query_budget(2)
+@read_only
+def sync_about(request):
+    # about() for the WSGI handler
+    return render(request, "blog/about.html")
+
+@served_under_wsgi_by(sync_about)
+@query_budget(2)
+@read_only
+async def about(request):
     # Render the About page.
     return render(request, "blog/about.html")
     
+@query_budget(8)
 def register(request):
     # Handle user registration.
     form = RegisterForm()
@@ -70,6 +240,7 @@ def register(request):
     }
     return render(request, "blog/register.html",page_data)
 
+@query_budget(10)
 def login(request):
     # Authenticate and log in a user.
     form = LoginForm()
@@ -91,6 +262,7 @@ def login(request):
     }
     return render(request, "blog/login.html",page_data)
 
+@query_budget(6)
 def forget_password(request):
     # Send password reset email to user.
     form = forgetPasswordForm()
@@ -111,8 +283,8 @@ def forget_password(request):
                 'uid':uid,
                 'token':token,
             })
-            # Send email with reset link
-            send_mail(subject,message,'noreply@example.com',[email])
+            # Queue the email with the reset link; send_queued_mail delivers it
+            queue_mail(subject,message,[email],'noreply@example.com')
             messages.success(request, "Email has been sent")
         else:
             messages.error(request, "Email not found")
@@ -122,6 +294,7 @@ def forget_password(request):
     }
     return render(request, "blog/forget_password.html",page_data)
 
+@query_budget(8)
 def reset_password(request,uidb64,token):
     # Reset user password using token from email.
     form = resetForm()
@@ -148,31 +321,36 @@ def reset_password(request,uidb64,token):
     }
     return render(request, "blog/reset_password.html",page_data)
 
-@permission_required('blog.add_post', raise_exception=True)
+@query_budget(10)
+@role_required('blog.add_post')
 def dashboard(request):
     # Show dashboard with user's posts or all posts if permitted.
 
     # Editors can see all posts, while authors see their own.
-    if request.user.has_perm('blog.can_publish'):
-        post = Post.objects.all()
+    if get_roles(request).has_perm('blog.can_publish'):
+        post = Post.objects.select_related('category','user').defer('content')
+        count_cache_key = 'blog:post-count:all'
     else:
-        post = Post.objects.filter(user=request.user)
+        post = Post.objects.filter(user=request.user).select_related('category','user').defer('content')
+        count_cache_key = f'blog:post-count:user:{request.user.pk}'
 
     items_per_page = 5
-    page_num = request.GET.get("page")
-    paginator_obj = Paginator(post,items_per_page)
-    post = paginator_obj.get_page(page_num) 
+    cursor = request.GET.get("cursor")
+    paginator_obj = CursorPaginator(post,items_per_page,count_cache_key=count_cache_key)
+    post = paginator_obj.get_page(cursor)
     page_data = {
         'post_list' : post,
     }
     return render(request, "blog/dashboard.html",page_data)
 
+@query_budget(4)
 def logout(request):
     # Log out the current user.
     auth_logout(request)
     return redirect("blog:index")
 
-@permission_required('blog.add_post', raise_exception=True)
+@query_budget(14)
+@role_required('blog.add_post')
 def new_post(request):
     # Create a new blog post.
     form = PostForm()
@@ -190,13 +368,14 @@ def new_post(request):
     }
     return render(request, "blog/new_post.html",page_data)
 
-@permission_required('blog.change_post', raise_exception=True)
+@query_budget(14)
+@role_required('blog.change_post')
 def edit_post(request,post_id):
     # Edit an existing blog post.
     post = get_object_or_404(Post,id=post_id)
 
     # Authors can only edit their own posts, editors can edit any post
-    if not request.user.groups.filter(name='Editors').exists():
+    if not get_roles(request).is_editor:
         if request.user != post.user:
             messages.error(request, "Author can't modify other posts.")
             return redirect("blog:dashboard")
@@ -214,11 +393,12 @@ def edit_post(request,post_id):
     }
     return render(request, "blog/edit_post.html",page_data)
 
-@permission_required('blog.delete_post', raise_exception=True)
+@query_budget(12)
+@role_required('blog.delete_post')
 def delete_post(request,post_id):
     # Delete a blog post.
     post = get_object_or_404(Post,id=post_id)
-    if not request.user.groups.filter(name='Editors').exists():
+    if not get_roles(request).is_editor:
         if request.user != post.user:
             messages.error(request, "Author can't modify other posts.")
             return redirect("blog:dashboard")
@@ -227,7 +407,8 @@ def delete_post(request,post_id):
     messages.success(request,"Post Deleted successfully")
     return redirect('blog:dashboard')
 
-@permission_required('blog.can_publish', raise_exception=True)
+@query_budget(16)
+@role_required('blog.can_publish')
 def publish_post(request,post_id):
     # Toggle publish status of a blog post. 
     post = get_object_or_404(Post,id=post_id)
@@ -239,4 +420,4 @@ def publish_post(request,post_id):
     else:
         messages.success(request, "Blog hidden successfully")
         
-    return redirect('blog:dashboard')
\ No newline at end of file
+    return redirect('blog:dashboard')
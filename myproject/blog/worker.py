@@ -0,0 +1,18 @@
+"""
+worker.py
+
+Entry points for run_worker's pool processes. Kept free of model imports:
+spawned processes unpickle these functions before Django is set up.
+"""
+
+import django
+
+
+def init_process():
+    # Each pool process is spawned fresh and needs its own Django setup
+    django.setup()
+
+
+def execute(kind, payload):
+    from .jobs import run_job
+    return run_job(kind, payload)
@@ -0,0 +1,152 @@
+"""
+media.py
+
+Serves user-uploaded files under MEDIA_URL, in development and production:
+- Streams files with FileResponse, so WSGI servers can use sendfile()
+- Strong ETag / Last-Modified validators answer conditional requests with 304
+- Single byte ranges (Range / If-Range) return 206 partial content
+- Content-hashed names (image renditions) are cached as immutable
+- BLOG_MEDIA_OFFLOAD hands the transfer to the front-end server instead,
+  through X-Accel-Redirect (nginx) or X-Sendfile (Apache, lighttpd)
+"""
+
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+# "<stem>-<12 hex digits of sha256>-<width>.<ext>", as written by blog/images.py
+HASHED_NAME_RE = re.compile(r'-[0-9a-f]{12}-\d+\.\w+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def cache_control(path):
+    if HASHED_NAME_RE.search(path):
+        return IMMUTABLE
+    # Originals keep their name when replaced, so they are revalidated
+    return f"public, max-age={getattr(settings, 'BLOG_MEDIA_MAX_AGE', 3600)}"
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single "bytes=" range, inclusive, or None to send the
+    whole file. Raises ValueError for a range that can't be satisfied.
+
+    Multi-range requests are answered with the whole file, as RFC 9110 allows.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N bytes
+        if int(last) == 0:
+            raise ValueError(header)
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+
+class FileRange:
+    """Read-only view of bytes [start, end] of an open file."""
+
+    def __init__(self, file, start, end):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = end - start + 1
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _offload(response, full_path, path):
+    mode = getattr(settings, 'BLOG_MEDIA_OFFLOAD', None)
+    if mode == 'x-accel-redirect':
+        # nginx: an `internal` location aliased to MEDIA_ROOT. The header is
+        # a URI, which nginx decodes: names with spaces, '%', '?' or non-ASCII
+        # characters must reach it percent-encoded
+        prefix = getattr(settings, 'BLOG_MEDIA_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix + quote(path)
+    elif mode == 'x-sendfile':
+        response['X-Sendfile'] = full_path
+    else:
+        return None
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve a file from MEDIA_ROOT with validators, ranges and cache headers."""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        info = os.stat(full_path)
+    except (OSError, ValueError, SuspiciousFileOperation):
+        # A path escaping MEDIA_ROOT, or containing a NUL byte, is just missing
+        raise Http404("File not found.")
+    if not stat.S_ISREG(info.st_mode):
+        raise Http404("File not found.")
+
+    etag = quote_etag(f'{info.st_mtime_ns:x}-{info.st_size:x}')
+    last_modified = int(info.st_mtime)
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    def with_validators(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = cache_control(path)
+        return response
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        return with_validators(conditional)
+
+    offloaded = _offload(HttpResponse(content_type=content_type), full_path, path)
+    if offloaded is not None:
+        # The front-end server sends the body and handles Range itself
+        return with_validators(offloaded)
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    # If-Range: only honour the range while the client's copy is current
+    if range_header and request.headers.get('If-Range', etag) in (etag, http_date(last_modified)):
+        try:
+            byte_range = parse_range(range_header, info.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{info.st_size}'
+            return with_validators(response)
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = info.st_size
+    else:
+        start, end = byte_range
+        response = FileResponse(FileRange(file, start, end), content_type=content_type, status=206)
+        response.block_size = CHUNK_SIZE
+        response['Content-Range'] = f'bytes {start}-{end}/{info.st_size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return with_validators(response)
@@ -4,40 +4,99 @@ middleware.py
 Custom middleware for user redirection and access control:
 - Redirects authenticated users away from login/register pages
 - Restricts unauthenticated users to allowed paths
+- Allowed paths are compiled once from the route names declared in blog/urls.py
 """
 
-from django.urls import reverse
+import re
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.urls import URLResolver, get_resolver, reverse
 from django.shortcuts import redirect
 from django.contrib import messages
 
+from blog import urls as blog_urls
+
+# Paths outside the blog app that anonymous users may always open
+PUBLIC_PREFIXES = (settings.MEDIA_URL, '/admin')
+
+NAMED_GROUP_RE = re.compile(r'\(\?P<\w+>')
+
+
+async def resolved_user(user):
+    return user
+
+
+def route_regexes(patterns, namespace, prefix='^/', current=None):
+    # Yield (name, full path regex) for the named routes of a namespace
+    for pattern in patterns:
+        regex = pattern.pattern.regex.pattern.removeprefix('^')
+        if isinstance(pattern, URLResolver):
+            yield from route_regexes(pattern.url_patterns, namespace, prefix + regex, pattern.namespace or current)
+        elif current == namespace and pattern.name:
+            yield pattern.name, prefix + regex
+
+
+class RouteTable:
+    """Set of paths built from route names: literal routes are looked up in a
+    frozenset, parameterised ones share one alternation regex."""
+
+    def __init__(self, names, namespace=blog_urls.app_name, prefixes=()):
+        paths, patterns = set(), []
+        for name, regex in route_regexes(get_resolver().url_patterns, namespace):
+            if name not in names:
+                continue
+            if NAMED_GROUP_RE.search(regex):
+                # Group names would clash inside one alternation
+                patterns.append(NAMED_GROUP_RE.sub('(?:', regex))
+            else:
+                paths.add(reverse(f'{namespace}:{name}'))
+        self.paths = frozenset(paths)
+        self.regex = re.compile('|'.join(f'(?:{regex})' for regex in patterns)) if patterns else None
+        self.prefixes = tuple(prefixes)
+
+    def __contains__(self, path):
+        if path in self.paths or path.startswith(self.prefixes):
+            return True
+        return self.regex is not None and self.regex.match(path) is not None
+
+
 class UserRedirectMiddleware:
-    # Middleware to manage user access and redirects.
+    # Middleware to manage user access and redirects; runs natively under WSGI and ASGI.
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.public = RouteTable(blog_urls.public_routes, prefixes=PUBLIC_PREFIXES)
+        self.guest_only = RouteTable(blog_urls.guest_only_routes)
+        self.dashboard_url = reverse('blog:dashboard')
+        self.login_url = reverse('blog:login')
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        user = request.user
+        # Async views run under WSGI get the loaded user from auser() too
+        request.auser = partial(resolved_user, user)
+        return self.check(request, user) or self.get_response(request)
+
+    async def __acall__(self, request):
+        # Resolve the user once without blocking; views and templates reading
+        # request.user afterwards must not query from the event loop
+        request.user = await request.auser()
+        return self.check(request, request.user) or await self.get_response(request)
+
+    def check(self, request, user):
         # Redirect authenticated users away from login/register
-        if request.user.is_authenticated:
-            path_to_redirect = [reverse('blog:register'), reverse('blog:login')]
-            if request.path in path_to_redirect:
-                return redirect('blog:dashboard')
-        else:
-            # Allow unauthenticated users only on certain paths
-            allowed_paths = [
-                reverse('blog:index'),
-                reverse('blog:about'),
-                reverse('blog:login'),
-                reverse('blog:register'),
-                reverse('blog:forget_password'),
-                reverse('blog:reset_password', kwargs={'uidb64': 'dummy_uid', 'token': 'dummy_token'})
-            ]
-            # Allow access to static files and admin
-            if request.path.startswith('/media/') or request.path.startswith('/admin') or request.path.startswith('/reset_password'):
-                return self.get_response(request)
-            # Redirect if not allowed
-            if request.path not in allowed_paths:
-                messages.error(request, 'You must be logged in to access this page.')
-                return redirect('blog:login')
-            
-        return self.get_response(request)
\ No newline at end of file
+        if user.is_authenticated:
+            if request.path in self.guest_only:
+                return redirect(self.dashboard_url)
+        # Redirect unauthenticated users unless the path is public
+        elif request.path not in self.public:
+            messages.error(request, 'You must be logged in to access this page.')
+            return redirect(self.login_url)
+        return None
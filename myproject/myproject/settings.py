@@ -41,7 +41,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'blog.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'blog.instrumentation.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -49,19 +51,30 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'myproject.middleware.UserRedirectMiddleware',
+    'blog.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'myproject.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for profiles and metrics (blog/profiling.py)
+        'BACKEND': 'blog.profiling.ProfiledDjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Templates are compiled once per process (Django resets the
+            # cache when runserver sees a template change)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
+                # Replaces the auth processor's perms with the cached roles
+                'blog.roles.roles_context',
                 'django.contrib.messages.context_processors.messages',
             ],
         },
@@ -74,13 +87,105 @@ WSGI_APPLICATION = 'myproject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Applied to every new SQLite connection through OPTIONS['init_command']
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',      # readers and the writer no longer block each other
+    'synchronous': 'normal',    # with WAL, only the last commits can be lost on power failure
+    'busy_timeout': 5000,       # ms to wait for the write lock instead of "database is locked"
+    'cache_size': -20000,       # page cache per connection, in KiB
+    'mmap_size': 134217728,     # read through a 128 MiB memory map
+    'temp_store': 'memory',
+}
+# Changing journal_mode is a write, so the read-only connection leaves it alone
+SQLITE_READ_PRAGMAS = {name: value for name, value in SQLITE_PRAGMAS.items() if name != 'journal_mode'}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Connections are kept across requests, and checked before reuse
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock when a transaction starts; a deferred
+            # transaction upgrading its lock fails without waiting
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        },
+    },
+    # Read-only connection to the same file, used by read-only views (see blog/db.py)
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{BASE_DIR / 'db.sqlite3'}?mode=ro",
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_READ_PRAGMAS.items()),
+        },
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['blog.db.ReadReplicaRouter']
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# 'pages' holds rendered pages for anonymous readers (see blog/caching.py). It
+# is file-based so every worker process shares the same pages and versions.
+# 'fragments' holds rendered post cards (see blog/templatetags/blog_tags.py);
+# their keys carry the post's version, so each process may keep its own.
+# 'sessions' holds copies of the database sessions, shared by every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'pages',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'blog-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
+BLOG_PAGE_CACHE_TIMEOUT = 600
+
+# Query budgets (see blog/instrumentation.py): over-budget requests and
+# statements repeated BLOG_QUERY_REPEAT_THRESHOLD times (N+1) raise while
+# developing and are logged otherwise
+BLOG_QUERY_BUDGET_STRICT = DEBUG
+BLOG_QUERY_REPEAT_THRESHOLD = 3
+
+# Sessions and messages (see blog/sessions.py): database sessions with a
+# shared cache copy and, for anonymous visitors, a per-process LRU front,
+# written only when their data changes. Flash messages travel in a signed
+# cookie and never touch the session.
+SESSION_ENGINE = 'blog.sessions'
+SESSION_CACHE_ALIAS = 'sessions'
+BLOG_SESSION_LRU_SIZE = 1000
+BLOG_SESSION_LRU_TTL = 5.0
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# Post views (see blog/popularity.py): counted in memory and written in one
+# batched UPDATE at most every BLOG_VIEW_FLUSH_INTERVAL seconds per process.
+# Trending scores halve every BLOG_POPULARITY_HALF_LIFE seconds (3600 or more); the index
+# sidebar lists BLOG_POPULAR_POSTS posts. It (and the cached index pages) is
+# refreshed by flushes at most once per BLOG_POPULAR_CACHE_TIMEOUT seconds
+BLOG_VIEW_FLUSH_INTERVAL = 10.0
+BLOG_POPULARITY_HALF_LIFE = 7 * 24 * 3600
+BLOG_POPULAR_POSTS = 5
+BLOG_POPULAR_CACHE_TIMEOUT = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -130,6 +235,30 @@ import os
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR,'media')
 
+# Media serving (see myproject/media.py): browser cache lifetime of files
+# without a content hash in their name, and an optional transfer offload to
+# the front-end server: None, 'x-accel-redirect' (nginx) or 'x-sendfile'
+BLOG_MEDIA_MAX_AGE = 3600
+BLOG_MEDIA_OFFLOAD = None
+BLOG_MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Request profiling (see blog/profiling.py): staff profile a request with
+# ?profile=1 or an X-Profile header, and a random fraction of all requests
+# can be profiled too. Modes: 'sample' (folded stacks) or 'cprofile'
+BLOG_PROFILING_SAMPLE_RATE = 0.0
+BLOG_PROFILING_MODE = 'sample'
+BLOG_PROFILING_INTERVAL = 0.001
+BLOG_PROFILING_DIR = BASE_DIR / 'var' / 'profiles'
+BLOG_PROFILING_KEEP = 200
+
+# Request metrics (see blog/metrics.py), served at /metrics. Each process
+# saves its own file to BLOG_METRICS_DIR; empty it when the server starts.
+# Scrapers send "Authorization: Bearer <BLOG_METRICS_TOKEN>"; without a token
+# set, only signed-in staff can read them.
+BLOG_METRICS_DIR = BASE_DIR / 'var' / 'metrics'
+BLOG_METRICS_FLUSH_INTERVAL = 1.0
+BLOG_METRICS_TOKEN = None
+
 
 
 # ------------------------------------------------------------------------------
@@ -146,4 +275,7 @@ EMAIL_PORT = '2525'
 
 DEFAULT_FROM_EMAIL = 'your_name@example.com' 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
-EMAIL_USE_TLS = True 
\ No newline at end of file
+EMAIL_USE_TLS = True 
+
+# Keeps test runs out of var/ (see myproject/test_runner.py)
+TEST_RUNNER = 'myproject.test_runner.BlogTestRunner'
@@ -0,0 +1,47 @@
+"""
+test_runner.py
+
+Test runner (TEST_RUNNER) keeping test runs away from the project's files:
+- Files the code writes as it serves requests (request metrics, the related
+  posts index) and the file-based caches (pages, sessions) go to a temporary
+  directory, removed after the run
+"""
+
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class BlogTestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.directory = tempfile.mkdtemp(prefix='blog-tests-')
+        self.overrides = override_settings(
+            BLOG_METRICS_DIR=os.path.join(self.directory, 'metrics'),
+            BLOG_RELATED_INDEX_PATH=os.path.join(self.directory, 'related_posts.npz'),
+            CACHES=self.test_caches(),
+        )
+        self.overrides.enable()
+
+    def test_caches(self):
+        # Same backends, but file-based caches start empty in the run's directory
+        caches = {}
+        for alias, options in settings.CACHES.items():
+            if options['BACKEND'].endswith('.FileBasedCache'):
+                options = {**options, 'LOCATION': os.path.join(self.directory, 'cache', alias)}
+            caches[alias] = options
+        return caches
+
+    def teardown_test_environment(self, **kwargs):
+        from blog.metrics import registry
+
+        # Nothing left to be saved at exit, into the project's directory
+        registry.reset()
+        self.overrides.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -9,8 +9,29 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 
 import os
 
-from django.core.wsgi import get_wsgi_application
+import django
+from django.core.handlers.wsgi import WSGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
 
+
+class SyncViews:
+    # Handler mixin serving the sync twins of the async views (see
+    # blog/views.py), which would otherwise each run through async_to_sync
+    def resolve_request(self, request):
+        match = super().resolve_request(request)
+        match.func = getattr(match.func, 'wsgi_view', match.func)
+        return match
+
+
+class SyncViewsWSGIHandler(SyncViews, WSGIHandler):
+    pass
+
+
+def get_wsgi_application():
+    # As django.core.wsgi.get_wsgi_application(), with the handler above
+    django.setup(set_prefix=False)
+    return SyncViewsWSGIHandler()
+
+
 application = get_wsgi_application()